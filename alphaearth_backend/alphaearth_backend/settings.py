@@ -3,7 +3,7 @@ Django settings for AlphaEarth Insurance Backend
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 from datetime import timedelta
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -114,6 +114,103 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Damage analysis
+# Detector weights are loaded lazily on first use; set DAMAGE_DETECTOR_PREWARM
+# to load them in wsgi.py instead (with gunicorn --preload they are then
+# shared copy-on-write by all workers).
+DAMAGE_DETECTOR_WEIGHTS = config('DAMAGE_DETECTOR_WEIGHTS', default='yolov8m.pt')
+DAMAGE_DETECTOR_PREWARM = config('DAMAGE_DETECTOR_PREWARM', default=False, cast=bool)
+# Detector backend: 'torch' (ultralytics/PyTorch) or 'onnx' (ONNX Runtime on
+# CPU, with the model produced by `manage.py export_detector`). 0 threads lets
+# ONNX Runtime pick; on shared nodes set intra-op to cores per worker.
+DAMAGE_DETECTOR_BACKEND = config('DAMAGE_DETECTOR_BACKEND', default='torch')
+DAMAGE_DETECTOR_ONNX_PATH = config('DAMAGE_DETECTOR_ONNX_PATH', default='yolov8m.onnx')
+DAMAGE_ONNX_INTRA_OP_THREADS = config('DAMAGE_ONNX_INTRA_OP_THREADS', default=0, cast=int)
+DAMAGE_ONNX_INTER_OP_THREADS = config('DAMAGE_ONNX_INTER_OP_THREADS', default=0, cast=int)
+# POST /api/damage-analysis/ queues a job and returns 202 when ?async=1 is
+# passed, or by default when DAMAGE_ANALYSIS_ASYNC is set. Queued jobs run on
+# DAMAGE_JOB_WORKERS threads per process (0 leaves them to run_damage_worker).
+# A running job holds a DAMAGE_JOB_LEASE_SECONDS lease, renewed as it makes
+# progress; when it runs out (the process died) the job is queued again, up
+# to DAMAGE_JOB_MAX_ATTEMPTS runs in all.
+DAMAGE_ANALYSIS_ASYNC = config('DAMAGE_ANALYSIS_ASYNC', default=False, cast=bool)
+DAMAGE_JOB_WORKERS = config('DAMAGE_JOB_WORKERS', default=2, cast=int)
+DAMAGE_JOB_LEASE_SECONDS = config('DAMAGE_JOB_LEASE_SECONDS', default=900, cast=int)
+DAMAGE_JOB_MAX_ATTEMPTS = config('DAMAGE_JOB_MAX_ATTEMPTS', default=3, cast=int)
+# Images submitted by concurrent threads of one process within
+# DAMAGE_BATCH_MAX_WAIT_MS are run through the detector as a single batch.
+DAMAGE_BATCH_MAX_SIZE = config('DAMAGE_BATCH_MAX_SIZE', default=8, cast=int)
+DAMAGE_BATCH_MAX_WAIT_MS = config('DAMAGE_BATCH_MAX_WAIT_MS', default=10, cast=float)
+DAMAGE_BATCH_MAX_CLAIMS = config('DAMAGE_BATCH_MAX_CLAIMS', default=50, cast=int)
+# Inference runs on DAMAGE_INFERENCE_WORKERS threads per process (more than
+# one only helps the onnx backend). Requests are answered with 429 and a
+# Retry-After header once DAMAGE_INFERENCE_MAX_QUEUE images are waiting (0 =
+# unbounded). Budget workers x processes x DAMAGE_TORCH_THREADS (or
+# DAMAGE_ONNX_INTRA_OP_THREADS) to the node's cores; 0 keeps library defaults.
+DAMAGE_INFERENCE_WORKERS = config('DAMAGE_INFERENCE_WORKERS', default=1, cast=int)
+DAMAGE_INFERENCE_MAX_QUEUE = config('DAMAGE_INFERENCE_MAX_QUEUE', default=64, cast=int)
+DAMAGE_TORCH_THREADS = config('DAMAGE_TORCH_THREADS', default=0, cast=int)
+DAMAGE_OPENCV_THREADS = config('DAMAGE_OPENCV_THREADS', default=0, cast=int)
+# Detections are cached by image hash + model version in a local SQLite file
+# (LRU-evicted past DAMAGE_DETECTION_CACHE_MAX_ENTRIES). An empty path
+# disables the cache.
+DAMAGE_DETECTION_CACHE_PATH = config(
+    'DAMAGE_DETECTION_CACHE_PATH', default=str(BASE_DIR / 'detection_cache.sqlite3')
+)
+DAMAGE_DETECTION_CACHE_MAX_ENTRIES = config('DAMAGE_DETECTION_CACHE_MAX_ENTRIES', default=10000, cast=int)
+# Scenes whose longer side reaches DAMAGE_TILED_MIN_SIDE pixels are analysed
+# as overlapping tiles at each of DAMAGE_TILE_SCALES, and the affected area
+# is measured from changed pixels at DAMAGE_GROUND_SAMPLE_DISTANCE_M metres
+# per pixel.
+DAMAGE_TILED_MIN_SIDE = config('DAMAGE_TILED_MIN_SIDE', default=2048, cast=int)
+DAMAGE_TILE_SIZE = config('DAMAGE_TILE_SIZE', default=640, cast=int)
+DAMAGE_TILE_OVERLAP = config('DAMAGE_TILE_OVERLAP', default=64, cast=int)
+DAMAGE_TILE_SCALES = config('DAMAGE_TILE_SCALES', default='1.0', cast=Csv(float))
+DAMAGE_GROUND_SAMPLE_DISTANCE_M = config('DAMAGE_GROUND_SAMPLE_DISTANCE_M', default=0.5, cast=float)
+# Uploads are checked from their header only and may have up to
+# DAMAGE_SCENE_MAX_PIXELS pixels, instead of Pillow's ~179M pixel
+# decompression-bomb limit (OpenCV itself decodes up to 2^30 pixels)
+DAMAGE_SCENE_MAX_PIXELS = config('DAMAGE_SCENE_MAX_PIXELS', default=1_000_000_000, cast=int)
+# Pre/post objects of the same class are matched one-to-one ('greedy' or
+# 'hungarian') when their IoU reaches DAMAGE_MATCH_IOU; matches below
+# DAMAGE_INTACT_IOU count as damaged rather than intact.
+DAMAGE_MATCHING = config('DAMAGE_MATCHING', default='greedy')
+DAMAGE_MATCH_IOU = config('DAMAGE_MATCH_IOU', default=0.5, cast=float)
+DAMAGE_INTACT_IOU = config('DAMAGE_INTACT_IOU', default=0.75, cast=float)
+# When nothing is detected the images are compared with SSIM after
+# downsampling to at most DAMAGE_SSIM_MAX_SIDE pixels (0 = full resolution,
+# most accurate, slowest). DAMAGE_SSIM_HEATMAP_BLOCKS > 0 stores an N x N
+# dissimilarity heatmap with the analysis.
+DAMAGE_SSIM_MAX_SIDE = config('DAMAGE_SSIM_MAX_SIDE', default=1024, cast=int)
+DAMAGE_SSIM_HEATMAP_BLOCKS = config('DAMAGE_SSIM_HEATMAP_BLOCKS', default=8, cast=int)
+
+# Dashboard statistics are served from a materialized snapshot kept current by
+# model signals, cached per process for DASHBOARD_STATS_CACHE_TTL seconds and
+# rebuilt on read once older than DASHBOARD_STATS_MAX_AGE (bulk writes skip
+# signals). GET /api/dashboard-stats/?fresh=1 bypasses both.
+DASHBOARD_STATS_CACHE_TTL = config('DASHBOARD_STATS_CACHE_TTL', default=10, cast=int)
+DASHBOARD_STATS_MAX_AGE = config('DASHBOARD_STATS_MAX_AGE', default=300, cast=int)
+
+# Most locations /api/locations/suggest/ returns, best-ranked first
+# (by_location filters on every match)
+LOCATION_SEARCH_LIMIT = config('LOCATION_SEARCH_LIMIT', default=500, cast=int)
+
+# by_location orders the best LOCATION_RANK_LIMIT matches by rank and the
+# rest after them; each ranked match is a query parameter
+LOCATION_RANK_LIMIT = config('LOCATION_RANK_LIMIT', default=500, cast=int)
+
+# Asset map clusters: each tile is aggregated over an ASSET_CLUSTER_GRID x
+# ASSET_CLUSTER_GRID grid and cached for ASSET_CLUSTER_CACHE_TTL seconds
+# (asset, risk zone and location writes clear the cache sooner)
+ASSET_CLUSTER_GRID = config('ASSET_CLUSTER_GRID', default=8, cast=int)
+ASSET_CLUSTER_CACHE_TTL = config('ASSET_CLUSTER_CACHE_TTL', default=300, cast=int)
+
+# POST <list>/bulk/ validates and writes this many rows per transaction
+BULK_CHUNK_SIZE = config('BULK_CHUNK_SIZE', default=2000, cast=int)
+
+# GET <list>/export/ fetches and writes this many rows at a time
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
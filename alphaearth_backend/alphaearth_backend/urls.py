@@ -11,7 +11,8 @@ from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from api.views import (
     RiskZoneViewSet, InsuranceClaimViewSet, ParametricTriggerViewSet,
     AssetViewSet, AIModelInsightViewSet, DashboardStatsView,
-    DamageAnalysisView, RiskAssessmentView
+    DamageAnalysisView, DamageAnalysisBatchView, DamageAnalysisJobView,
+    RiskAssessmentView, InferenceMetricsView, LocationSuggestView
 )
 
 # Create router for ViewSets
@@ -32,7 +33,11 @@ urlpatterns = [
     # Custom API endpoints
     path('api/dashboard-stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
     path('api/damage-analysis/', DamageAnalysisView.as_view(), name='damage-analysis'),
+    path('api/damage-analysis/batch/', DamageAnalysisBatchView.as_view(), name='damage-analysis-batch'),
+    path('api/damage-analysis/jobs/<int:pk>/', DamageAnalysisJobView.as_view(), name='damage-analysis-job'),
+    path('api/locations/suggest/', LocationSuggestView.as_view(), name='location-suggest'),
     path('api/risk-assessment/', RiskAssessmentView.as_view(), name='risk-assessment'),
+    path('api/inference-metrics/', InferenceMetricsView.as_view(), name='inference-metrics'),
     
     # JWT Authentication
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'alphaearth_backend.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.DAMAGE_DETECTOR_PREWARM:
+    from api.model_registry import prewarm  # noqa: E402
+    prewarm()
+
+if settings.DAMAGE_JOB_WORKERS > 0:
+    from api import jobs  # noqa: E402
+    jobs.start()
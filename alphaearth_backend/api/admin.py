@@ -1,17 +1,24 @@
 from django.contrib import admin
 from .models import (
-    RiskZone, InsuranceClaim, ParametricTrigger,
-    Asset, AIModelInsight, DamageAnalysis
+    Location, RiskZone, InsuranceClaim, ParametricTrigger,
+    Asset, AIModelInsight, DamageAnalysis, DamageAnalysisJob
 )
 
 
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    list_display = ['name', 'key', 'latitude', 'longitude', 'created_at']
+    search_fields = ['name', 'key']
+    readonly_fields = ['created_at']
+
+
 @admin.register(RiskZone)
 class RiskZoneAdmin(admin.ModelAdmin):
     list_display = ['location_name', 'risk_score', 'flood_risk', 'wildfire_risk', 'storm_risk', 'updated_at']
     list_filter = ['risk_score']
     search_fields = ['location_name']
     ordering = ['-risk_score']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['location', 'created_at', 'updated_at']
 
 
 class DamageAnalysisInline(admin.TabularInline):
@@ -26,7 +33,7 @@ class InsuranceClaimAdmin(admin.ModelAdmin):
     list_filter = ['claim_status', 'disaster_type', 'auto_approved']
     search_fields = ['claim_id', 'policy_id', 'location_name']
     ordering = ['-date_filed']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['location', 'created_at', 'updated_at']
     inlines = [DamageAnalysisInline]
     
     fieldsets = (
@@ -51,7 +58,7 @@ class ParametricTriggerAdmin(admin.ModelAdmin):
     list_filter = ['triggered', 'parameter']
     search_fields = ['trigger_id', 'location_name', 'parameter']
     ordering = ['-date_checked']
-    readonly_fields = ['triggered', 'created_at', 'updated_at']
+    readonly_fields = ['location', 'triggered', 'created_at', 'updated_at']
 
 
 @admin.register(Asset)
@@ -60,7 +67,7 @@ class AssetAdmin(admin.ModelAdmin):
     list_filter = ['active', 'asset_type']
     search_fields = ['asset_id', 'owner', 'location_name']
     ordering = ['-insured_value_usd']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['location', 'created_at', 'updated_at']
 
 
 @admin.register(AIModelInsight)
@@ -78,3 +85,12 @@ class DamageAnalysisAdmin(admin.ModelAdmin):
     search_fields = ['claim__claim_id']
     ordering = ['-analysis_date']
     readonly_fields = ['analysis_date']
+
+
+@admin.register(DamageAnalysisJob)
+class DamageAnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'location_name', 'disaster_type', 'status', 'progress', 'created_at', 'finished_at']
+    list_filter = ['status', 'disaster_type']
+    search_fields = ['location_name', 'claim__claim_id']
+    ordering = ['-created_at']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
@@ -0,0 +1,209 @@
+"""
+Micro-batching for detector inference.
+
+Request threads submit images and get a ``Future`` back per image;
+background threads group whatever arrives within ``max_wait`` seconds (up
+to ``max_batch_size`` images) into one ``predict`` call. Besides improving
+throughput this keeps inference on a small, fixed pool of ``workers``
+threads however many requests are in flight, so concurrent requests don't
+oversubscribe the CPU.
+
+The queue is bounded by ``max_queue`` images: once it is full ``submit``
+raises ``QueueFull`` straight away, with an estimate of when to retry,
+instead of letting latency grow without limit. (A request bigger than the
+whole queue is still admitted when the queue is empty.)
+"""
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from django.conf import settings
+
+
+# Latency samples kept for the percentiles in ``metrics()``
+LATENCY_WINDOW = 1024
+
+
+class QueueFull(Exception):
+    """The inference queue has no room; try again after ``retry_after`` seconds"""
+
+    def __init__(self, depth, retry_after):
+        super().__init__(f'Inference queue is full ({depth} images waiting)')
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+def _percentiles(samples):
+    if not samples:
+        return None
+    values = sorted(samples)
+    pick = lambda p: values[min(int(p / 100 * len(values)), len(values) - 1)]
+    return {f'p{p}': round(pick(p) * 1000, 2) for p in (50, 95, 99)}
+
+
+class MicroBatcher:
+    def __init__(self, predict_batch, max_batch_size=8, max_wait=0.01, max_queue=0, workers=1):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self.max_queue = max(0, max_queue)
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._queue_waits = deque(maxlen=LATENCY_WINDOW)
+        self._batch_seconds = deque(maxlen=LATENCY_WINDOW)
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.rejected = 0
+
+    def _ensure_started(self):
+        # Threads don't survive fork, so a batcher created in the parent
+        # process starts fresh workers in each child.
+        if self._threads and self._pid == os.getpid():
+            return
+        with self._lock:
+            if not self._threads or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._threads = [
+                    threading.Thread(
+                        target=self._run, args=(self._queue,),
+                        name=f'detector-batcher-{n}', daemon=True
+                    )
+                    for n in range(self.workers)
+                ]
+                for thread in self._threads:
+                    thread.start()
+
+    def retry_after(self):
+        """Rough seconds until the current queue drains, at least 1"""
+        with self._stats_lock:
+            recent = list(self._batch_seconds)
+        per_batch = sum(recent) / len(recent) if recent else 1.0
+        depth = self._queue.qsize() if self._queue is not None else 0
+        batches = math.ceil(depth / self.max_batch_size) / self.workers
+        return max(1, math.ceil(batches * per_batch))
+
+    def submit_many(self, items):
+        """
+        Queue all ``items`` and return a Future per item. Either every item
+        is queued or, if they don't fit, none is and ``QueueFull`` is raised.
+        """
+        if not items:
+            return []
+        self._ensure_started()
+        now = time.monotonic()
+        with self._lock:
+            depth = self._queue.qsize()
+            if self.max_queue and depth and depth + len(items) > self.max_queue:
+                self.rejected += 1
+                raise QueueFull(depth, self.retry_after())
+            futures = []
+            for item in items:
+                future = Future()
+                self._queue.put((item, future, now))
+                futures.append(future)
+        return futures
+
+    def submit(self, item):
+        """Queue ``item`` for the next batch and return a Future for its result"""
+        return self.submit_many([item])[0]
+
+    def map(self, items):
+        """Submit all ``items`` at once and wait for their results, in order"""
+        return [future.result() for future in self.submit_many(items)]
+
+    def _collect(self, pending):
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(pending.get(timeout=timeout))
+                else:
+                    batch.append(pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, pending):
+        while True:
+            collected = self._collect(pending)
+            started = time.monotonic()
+            batch = [
+                (item, future) for item, future, _ in collected
+                if future.set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            try:
+                results = list(self.predict_batch([item for item, _ in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f'predict_batch returned {len(results)} results for {len(batch)} items'
+                    )
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            with self._stats_lock:
+                self._batch_seconds.append(time.monotonic() - started)
+                self._queue_waits.extend(started - queued_at for _, _, queued_at in collected)
+                self.batches += 1
+                self.items += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+
+    def metrics(self):
+        with self._stats_lock:
+            queue_waits = list(self._queue_waits)
+            batch_seconds = list(self._batch_seconds)
+        return {
+            'workers': self.workers,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': round(self.max_wait * 1000, 3),
+            'max_queue': self.max_queue,
+            'batches': self.batches,
+            'images': self.items,
+            'mean_batch_size': round(self.items / self.batches, 2) if self.batches else 0,
+            'largest_batch': self.largest_batch,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'rejected': self.rejected,
+            'queue_wait_ms': _percentiles(queue_waits),
+            'batch_ms': _percentiles(batch_seconds),
+        }
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(name, predict_batch):
+    """Process-wide batcher for ``name``, sized from settings"""
+    batcher = _batchers.get(name)
+    if batcher is None:
+        with _batchers_lock:
+            batcher = _batchers.get(name)
+            if batcher is None:
+                batcher = _batchers[name] = MicroBatcher(
+                    predict_batch,
+                    max_batch_size=settings.DAMAGE_BATCH_MAX_SIZE,
+                    max_wait=settings.DAMAGE_BATCH_MAX_WAIT_MS / 1000,
+                    max_queue=settings.DAMAGE_INFERENCE_MAX_QUEUE,
+                    workers=settings.DAMAGE_INFERENCE_WORKERS,
+                )
+    return batcher
+
+
+def metrics():
+    return {name: batcher.metrics() for name, batcher in _batchers.items()}
@@ -0,0 +1,92 @@
+"""
+Reading and writing the rows of the ``/bulk/`` actions.
+
+The body is a JSON array of objects, or NDJSON (``application/x-ndjson``:
+one object per line), which is read from the request stream line by line
+instead of being parsed whole. Rows are handled ``BULK_CHUNK_SIZE`` at a
+time: each chunk is validated by the viewset's bulk serializer (a
+``BulkListSerializer``) and its valid rows upserted in one transaction.
+Invalid rows are reported by their index in the body and don't hold up
+the others.
+"""
+import json
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ParseError
+
+from . import clusters, dashboard
+from .models import Asset
+
+
+NDJSON_MEDIA_TYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl'}
+
+
+class _Unreadable:
+    """An NDJSON line that isn't JSON"""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def iter_rows(request):
+    """``(index, row)`` of every row in the request body"""
+    media_type = request.content_type.split(';')[0].strip().lower()
+    if media_type not in NDJSON_MEDIA_TYPES:
+        if not isinstance(request.data, list):
+            raise ParseError('Expected a JSON array or NDJSON (application/x-ndjson) rows')
+        yield from enumerate(request.data)
+        return
+    index = 0
+    for line in request.stream or ():
+        if not line.strip():
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError as exc:
+            yield index, _Unreadable(f'Invalid JSON: {exc}')
+        index += 1
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def write_chunk(serializer_class, chunk, result, context=None):
+    """
+    Validate and upsert one chunk of ``(index, row)``, adding the number
+    of rows written and the errors of the others to ``result``
+    """
+    indexes, rows = [], []
+    for index, row in chunk:
+        if isinstance(row, _Unreadable):
+            result['errors'].append({'index': index, 'errors': {'non_field_errors': [row.message]}})
+        else:
+            indexes.append(index)
+            rows.append(row)
+
+    serializer = serializer_class(data=rows, many=True, context=context)
+    serializer.is_valid()
+    failed = {indexes[position]: errors for position, errors in serializer.row_errors}
+    try:
+        with transaction.atomic():
+            serializer.save()
+            _mark_changed(serializer.child.Meta.model)
+    except IntegrityError as exc:
+        # Key conflicts are upserts; any other constraint rolls back the
+        # whole chunk
+        message = {'non_field_errors': [f'Not saved: {exc}']}
+        failed.update((index, message) for index in indexes if index not in failed)
+    else:
+        result['written'] += len(serializer.instance)
+    result['errors'].extend({'index': index, 'errors': errors} for index, errors in sorted(failed.items()))
+
+
+def _mark_changed(model):
+    # bulk_create and bulk_update skip the signals of api/signals.py
+    if model in dashboard.AGGREGATES:
+        dashboard.mark_changed(model)
+    if model is Asset:
+        clusters.mark_changed()
@@ -0,0 +1,214 @@
+"""
+Per-object change detection between pre- and post-disaster detections.
+
+Detections are rows of ``[x1, y1, x2, y2, conf, cls]``. Pre and post boxes
+of the same class are matched one-to-one by IoU; every pre-disaster object
+ends up intact, damaged (matched, but its footprint moved/shrank or the
+detector lost confidence) or disappeared, and unmatched post-disaster
+objects count as new. Everything is done with NumPy over whole arrays, so
+scenes with thousands of boxes stay fast.
+"""
+import numpy as np
+
+
+INTACT, DAMAGED, DISAPPEARED = 0, 1, 2
+
+# Pre boxes compared at once; each chunk is only compared with the post boxes
+# that overlap its x-range, bounding memory to CHUNK x (nearby post boxes)
+CHUNK = 256
+
+
+def box_areas(boxes):
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU of box rows ``a`` (N) and ``b`` (M) as an N x M array"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = box_areas(a)[:, None] + box_areas(b)[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def candidate_pairs(pre, post, threshold):
+    """
+    Same-class ``(pre_idx, post_idx, iou)`` pairs with IoU >= ``threshold``.
+
+    Both sides are sorted by x1 so each chunk of ``CHUNK`` pre boxes only
+    builds an IoU matrix against the post boxes that can overlap it.
+    """
+    pre_order = np.argsort(pre[:, 0], kind='stable')
+    post_order = np.argsort(post[:, 0], kind='stable')
+    post_sorted = post[post_order]
+    post_x1 = post_sorted[:, 0]
+    max_post_width = (post_sorted[:, 2] - post_x1).max()
+
+    rows, cols, vals = [], [], []
+    for start in range(0, len(pre), CHUNK):
+        idx = pre_order[start:start + CHUNK]
+        block = pre[idx]
+        lo = np.searchsorted(post_x1, block[:, 0].min() - max_post_width, side='left')
+        hi = np.searchsorted(post_x1, block[:, 2].max(), side='right')
+        if lo >= hi:
+            continue
+        near = post_sorted[lo:hi]
+        iou = iou_matrix(block, near)
+        iou[block[:, None, 5] != near[None, :, 5]] = 0
+        r, c = np.nonzero(iou >= threshold)
+        rows.append(idx[r])
+        cols.append(post_order[lo + c])
+        vals.append(iou[r, c])
+    if not rows:
+        return np.zeros(0, int), np.zeros(0, int), np.zeros(0)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+
+
+def _first_per_group(groups, values):
+    """Index of the highest value in each group (lowest index on ties)"""
+    order = np.lexsort((np.arange(len(values)), -values, groups))
+    first = np.r_[True, groups[order][1:] != groups[order][:-1]]
+    return order[first]
+
+
+def match_greedy(rows, cols, vals):
+    """
+    Greedy one-to-one matching, highest IoU first. Each round matches every
+    pair that is the best remaining option for both its boxes, which gives
+    the same result as sorting all pairs but needs only a few vectorized
+    passes.
+    """
+    matched = []
+    active = np.arange(len(vals))
+    while active.size:
+        r, c, v = rows[active], cols[active], vals[active]
+        mutual = np.intersect1d(_first_per_group(r, v), _first_per_group(c, v))
+        matched.append(active[mutual])
+        keep = ~np.isin(r, r[mutual]) & ~np.isin(c, c[mutual])
+        active = active[keep]
+    picked = np.concatenate(matched) if matched else np.zeros(0, int)
+    return rows[picked], cols[picked], vals[picked]
+
+
+def match_hungarian(rows, cols, vals, n_pre, n_post):
+    """
+    Optimal matching (maximum total IoU) with scipy, solved separately for
+    each connected group of overlapping boxes to keep the problems small.
+    """
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    graph = coo_matrix((np.ones(len(vals)), (rows, cols + n_pre)), shape=(n_pre + n_post,) * 2)
+    _, labels = connected_components(graph, directed=False)
+    component = labels[rows]
+    out_rows, out_cols, out_vals = [], [], []
+    order = np.argsort(component, kind='stable')
+    bounds = np.flatnonzero(np.r_[True, np.diff(component[order]) != 0, True])
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        idx = order[start:end]
+        r_ids, r = np.unique(rows[idx], return_inverse=True)
+        c_ids, c = np.unique(cols[idx], return_inverse=True)
+        weights = np.zeros((len(r_ids), len(c_ids)))
+        weights[r, c] = vals[idx]
+        sel_r, sel_c = linear_sum_assignment(weights, maximize=True)
+        valid = weights[sel_r, sel_c] > 0
+        out_rows.append(r_ids[sel_r[valid]])
+        out_cols.append(c_ids[sel_c[valid]])
+        out_vals.append(weights[sel_r[valid], sel_c[valid]])
+    if not out_rows:
+        return np.zeros(0, int), np.zeros(0, int), np.zeros(0)
+    return np.concatenate(out_rows), np.concatenate(out_cols), np.concatenate(out_vals)
+
+
+def classify(pre, post, match_threshold=0.5, intact_iou=0.75, min_conf_ratio=0.5,
+             method='greedy'):
+    """
+    Match ``pre`` against ``post`` detections.
+
+    Returns ``(pre_status, post_matched)``: the INTACT/DAMAGED/DISAPPEARED
+    status of every pre box and a mask of the post boxes that were matched
+    (the rest are new objects).
+    """
+    pre = np.asarray(pre, dtype=np.float64).reshape(-1, 6)
+    post = np.asarray(post, dtype=np.float64).reshape(-1, 6)
+    pre_status = np.full(len(pre), DISAPPEARED, dtype=np.int8)
+    post_matched = np.zeros(len(post), dtype=bool)
+    if not len(pre) or not len(post):
+        return pre_status, post_matched
+
+    rows, cols, vals = candidate_pairs(pre, post, match_threshold)
+    if method == 'hungarian':
+        rows, cols, vals = match_hungarian(rows, cols, vals, len(pre), len(post))
+    else:
+        rows, cols, vals = match_greedy(rows, cols, vals)
+
+    intact = (vals >= intact_iou) & (post[cols, 4] >= min_conf_ratio * pre[rows, 4])
+    pre_status[rows] = np.where(intact, INTACT, DAMAGED)
+    post_matched[cols] = True
+    return pre_status, post_matched
+
+
+def _score(disappeared, damaged, new, total):
+    # Damaged objects count half; new objects count as change like before
+    return np.where(total > 0, (disappeared + 0.5 * damaged + new) / np.maximum(total, 1), 0.0)
+
+
+def summarize(pre, pre_status, post_matched):
+    """Object counts, damaged footprint (pixels) and damage score for a scene"""
+    pre = np.asarray(pre, dtype=np.float64).reshape(-1, 6)
+    counts = np.bincount(pre_status, minlength=3)
+    new = int(np.count_nonzero(~post_matched))
+    lost = pre_status != INTACT
+    return {
+        'pre_objects': len(pre),
+        'post_objects': len(post_matched),
+        'intact': int(counts[INTACT]),
+        'damaged': int(counts[DAMAGED]),
+        'disappeared': int(counts[DISAPPEARED]),
+        'new': new,
+        'damaged_footprint_px': float(box_areas(pre[lost]).sum()) if lost.any() else 0.0,
+        'score': float(_score(counts[DISAPPEARED], counts[DAMAGED], new, len(pre) + new)),
+    }
+
+
+def summarize_tiles(pre, post, pre_status, post_matched, shape, tile_size):
+    """
+    Per-tile breakdown of the same counts, assigning each object to the
+    tile containing its centre. Only tiles with objects are listed.
+    """
+    pre = np.asarray(pre, dtype=np.float64).reshape(-1, 6)
+    post = np.asarray(post, dtype=np.float64).reshape(-1, 6)
+    height, width = shape
+    tiles_x = max(int(np.ceil(width / tile_size)), 1)
+    n_tiles = tiles_x * max(int(np.ceil(height / tile_size)), 1)
+
+    def tile_of(boxes):
+        cx = np.clip((boxes[:, 0] + boxes[:, 2]) / 2 // tile_size, 0, tiles_x - 1)
+        cy = np.clip((boxes[:, 1] + boxes[:, 3]) / 2 // tile_size, 0, n_tiles // tiles_x - 1)
+        return (cy * tiles_x + cx).astype(int)
+
+    pre_tiles = tile_of(pre)
+    lost = pre_status != INTACT
+    count = lambda tiles, mask=None: np.bincount(tiles, weights=mask, minlength=n_tiles)
+    total_pre = count(pre_tiles)
+    damaged = count(pre_tiles, (pre_status == DAMAGED).astype(float))
+    disappeared = count(pre_tiles, (pre_status == DISAPPEARED).astype(float))
+    footprint = count(pre_tiles, np.where(lost, box_areas(pre), 0.0))
+    new = count(tile_of(post), (~post_matched).astype(float))
+    scores = _score(disappeared, damaged, new, total_pre + new)
+
+    tiles = []
+    for tile in np.flatnonzero(total_pre + new):
+        y0, x0 = (tile // tiles_x) * tile_size, (tile % tiles_x) * tile_size
+        tiles.append({
+            'window': [int(y0), int(x0), int(min(y0 + tile_size, height)), int(min(x0 + tile_size, width))],
+            'damaged': int(damaged[tile]),
+            'disappeared': int(disappeared[tile]),
+            'new': int(new[tile]),
+            'damaged_footprint_px': float(footprint[tile]),
+            'damage': round(float(scores[tile]), 4),
+        })
+    return tiles
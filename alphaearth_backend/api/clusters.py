@@ -0,0 +1,158 @@
+"""
+Asset clusters for the map, one standard XYZ (Web Mercator) tile at a time.
+
+A tile is divided into a ``ASSET_CLUSTER_GRID`` x ``ASSET_CLUSTER_GRID``
+grid and the assets whose location falls in each cell are aggregated into
+one cluster: asset count, total insured value, the highest risk score of
+their locations and the average position. The locations in the tile are
+found through the spatial index (see ``spatial``), and the grid cell of
+every row is computed in the query itself, so the database returns at most
+one row per cell however many assets the tile holds.
+
+Tiles are cached for ``ASSET_CLUSTER_CACHE_TTL`` seconds under a version
+that saving or deleting an asset, risk zone or location bumps once the
+transaction commits (see ``api/signals.py``), as do the bulk endpoints.
+The version is a ``CacheVersion`` row rather than a cache entry, so a bump
+reaches every worker process even with the default per-process cache; a
+cached tile costs one primary-key query.
+"""
+import hashlib
+import math
+import threading
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, F, FloatField, Max, Sum, Value
+from django.db.models.functions import Cos, Floor, Ln, Radians, Tan
+from rest_framework.exceptions import NotFound
+
+from . import spatial
+from .models import CacheVersion, Location, RiskZone
+
+
+VERSION_KEY = 'asset-clusters-version'
+
+MAX_ZOOM = 22
+
+
+def tile_bounds(z, x, y):
+    """``(west, south, east, north)`` of tile ``z/x/y`` in degrees"""
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise NotFound('No such tile')
+    n = 2 ** z
+
+    def latitude(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, latitude(y + 1), (x + 1) / n * 360 - 180, latitude(y)
+
+
+def _cell(z, grid, prefix=''):
+    """Expressions for the global grid column and row of each row's coordinates"""
+    scale = 2 ** z * grid
+    longitude, latitude = F(f'{prefix}longitude'), Radians(F(f'{prefix}latitude'))
+    column = Floor((longitude + 180) / 360 * scale)
+    mercator = Ln(Tan(latitude) + Value(1.0) / Cos(latitude))
+    row = Floor((Value(1.0) - mercator / math.pi) / 2 * scale, output_field=FloatField())
+    return column, row
+
+
+def _version():
+    return CacheVersion.objects.filter(pk=VERSION_KEY).values_list('version', flat=True).first() or 0
+
+
+def invalidate():
+    """Drop every cached tile"""
+    bump = CacheVersion.objects.filter(pk=VERSION_KEY)
+    if not bump.update(version=F('version') + 1):
+        _, created = CacheVersion.objects.get_or_create(pk=VERSION_KEY, defaults={'version': 1})
+        if not created:
+            # Another process created it first; it may already be in use
+            bump.update(version=F('version') + 1)
+
+
+# This thread's pending invalidation, held weakly: a rollback discards the
+# callback, which lets the next write schedule another
+_scheduled = threading.local()
+
+
+def mark_changed():
+    """Drop the cached tiles once the current transaction commits"""
+    scheduled = getattr(_scheduled, 'callback', None)
+    if scheduled is not None and scheduled() is not None:
+        return
+
+    def callback():
+        _scheduled.callback = None
+        invalidate()
+
+    _scheduled.callback = weakref.ref(callback)
+    transaction.on_commit(callback)
+
+
+def compute_tile(assets, z, x, y, grid):
+    """Clusters of ``assets`` (an Asset queryset) in tile ``z/x/y``"""
+    west, south, east, north = tile_bounds(z, x, y)
+    locations = spatial.within(Location.objects.all(), [(west, south, east, north)])
+    assets = assets.filter(location__in=locations.values('pk')).order_by()
+
+    column, row = _cell(z, grid, prefix='location__')
+    cells = assets.annotate(column=column, row=row).values('column', 'row').annotate(
+        count=Count('pk'),
+        total_insured_value=Sum('insured_value_usd'),
+        latitude=Avg('location__latitude'),
+        longitude=Avg('location__longitude'),
+    )
+    # Zones are placed at their location too, so they fall in the same
+    # cells as that location's assets
+    risks = RiskZone.objects.filter(
+        location__in=assets.values('location')
+    ).order_by().annotate(column=column, row=row).values('column', 'row').annotate(
+        max_risk_score=Max('risk_score'),
+    )
+
+    # Points on the tile's east or south edge land in the next tile's
+    # cells; fold them into the edge cells
+    def key(cell):
+        return (min(max(int(cell['column']) - x * grid, 0), grid - 1),
+                min(max(int(cell['row']) - y * grid, 0), grid - 1))
+
+    clusters = {}
+    for cell in cells:
+        cluster = clusters.setdefault(key(cell), {
+            'count': 0, 'total_insured_value': 0, 'latitude': 0.0, 'longitude': 0.0,
+            'max_risk_score': None,
+        })
+        cluster['count'] += cell['count']
+        cluster['total_insured_value'] += cell['total_insured_value'] or 0
+        cluster['latitude'] += cell['latitude'] * cell['count']
+        cluster['longitude'] += cell['longitude'] * cell['count']
+    for cell in risks:
+        cluster = clusters.get(key(cell))
+        if cluster is not None and cell['max_risk_score'] is not None:
+            cluster['max_risk_score'] = max(cluster['max_risk_score'] or 0, cell['max_risk_score'])
+
+    result = []
+    for (cell_x, cell_y), cluster in sorted(clusters.items(), key=lambda item: item[0][::-1]):
+        cluster['latitude'] /= cluster['count']
+        cluster['longitude'] /= cluster['count']
+        result.append({'cell': [cell_x, cell_y], **cluster})
+    return result
+
+
+def get_tile(assets, z, x, y, variant=''):
+    """
+    Cached clusters of ``assets`` in tile ``z/x/y``. ``variant`` tells apart
+    differently filtered ``assets`` querysets (e.g. the request's filters).
+    """
+    grid = settings.ASSET_CLUSTER_GRID
+    variant = hashlib.md5(variant.encode()).hexdigest()
+    cache_key = f'asset-clusters:{_version()}:{grid}:{z}/{x}/{y}:{variant}'
+    clusters = cache.get(cache_key)
+    if clusters is None:
+        clusters = compute_tile(assets, z, x, y, grid)
+        cache.set(cache_key, clusters, settings.ASSET_CLUSTER_CACHE_TTL)
+    return {'z': z, 'x': x, 'y': y, 'grid': grid, 'bounds': tile_bounds(z, x, y),
+            'clusters': clusters}
@@ -0,0 +1,307 @@
+"""
+Damage analysis pipeline shared by the synchronous view and the job worker.
+"""
+import uuid
+from datetime import date
+from decimal import Decimal
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from . import (
+    batching, change_detection, detection_cache, model_registry, similarity, tiling
+)
+from .imaging import DecodedImage, decoded
+from .models import InsuranceClaim, DamageAnalysis
+
+
+# Predefined disaster severity factor
+DISASTER_SEVERITY = {
+    "flood": 0.7,
+    "wildfire": 0.8,
+    "storm": 0.6,
+    "earthquake": 0.9,
+}
+
+
+def get_disaster_score(disaster_type):
+    return DISASTER_SEVERITY.get(disaster_type.lower(), 0.5)
+
+
+def _predict_batch(images):
+    """
+    Run the configured detector once over a list of decoded images,
+    returning ``[x1, y1, x2, y2, conf, cls]`` rows per image
+    """
+    return model_registry.get_detector().predict_boxes(images)
+
+
+def detect_boxes(images):
+    """
+    Detect objects in several DecodedImages, returning one array of box
+    rows per image. Images from concurrent callers are grouped into shared
+    ``predict`` calls by the micro-batcher.
+
+    Results are looked up in the detection cache by image content first, so
+    a repeated image costs a hash rather than a decode and an inference.
+    Raises ``batching.QueueFull`` when the inference queue has no room for
+    the remaining images.
+    """
+    cache = detection_cache.get_cache()
+    version = f"{model_registry.model_version()}:boxes"
+    batcher = batching.get_batcher('yolo', _predict_batch)
+
+    results = {}
+    misses = {}
+    for image in images:
+        digest = image.digest
+        if digest in results or digest in misses:
+            continue
+        cached = cache.get(cache.key(digest, version)) if cache is not None else None
+        if cached is not None:
+            results[digest] = np.array(cached, dtype=np.float64).reshape(-1, 6)
+        elif image.color is None:
+            results[digest] = np.zeros((0, 6))
+        else:
+            misses[digest] = image.color
+
+    futures = zip(misses, batcher.submit_many(list(misses.values())))
+    for digest, future in futures:
+        results[digest] = future.result()
+        if cache is not None:
+            cache.put(cache.key(digest, version), results[digest].tolist())
+
+    return [results[image.digest] for image in images]
+
+
+def _ssim_damage(pre_image, post_image):
+    """Damage as 1 - SSIM, plus a block-wise dissimilarity heatmap if enabled"""
+    ssim_score, heatmap = similarity.compare(
+        pre_image, post_image,
+        max_side=settings.DAMAGE_SSIM_MAX_SIDE,
+        heatmap_blocks=settings.DAMAGE_SSIM_HEATMAP_BLOCKS,
+    )
+    if heatmap is not None:
+        heatmap = np.round(heatmap, 3).tolist()
+    return round(1 - ssim_score, 2), heatmap
+
+
+def _ssim_damage_tiled(pre_image, post_image):
+    """
+    ``_ssim_damage`` for large scenes, on overviews read through their tile
+    sources so the full-resolution scenes are never decoded whole
+    """
+    sources = []
+    try:
+        for image in (pre_image, post_image):
+            sources.append(tiling.open_tile_source(image))
+    except ValueError:
+        # Nothing detected and nothing readable to compare: no change found
+        for source in sources:
+            source.close()
+        return 0.0, None
+    try:
+        max_side = settings.DAMAGE_SSIM_MAX_SIDE or settings.DAMAGE_TILED_MIN_SIDE
+        width, height = similarity.target_size([source.shape for source in sources], max_side)
+        pre_gray, post_gray = (cv2.cvtColor(source.overview(width, height), cv2.COLOR_BGR2GRAY)
+                               for source in sources)
+    finally:
+        for source in sources:
+            source.close()
+    ssim_score, heatmap = similarity.ssim(pre_gray, post_gray,
+                                          heatmap_blocks=settings.DAMAGE_SSIM_HEATMAP_BLOCKS)
+    if heatmap is not None:
+        heatmap = np.round(heatmap, 3).tolist()
+    return round(1 - ssim_score, 2), heatmap
+
+
+def is_large_scene(image):
+    return max(image.dimensions) >= settings.DAMAGE_TILED_MIN_SIDE
+
+
+def detect_boxes_tiled(image):
+    """
+    Detections for a large scene, as scene-coordinate box rows, plus its
+    shape. The merged boxes are cached like ``detect_boxes``' under the
+    scene's content and the tiling settings, so re-analysing a scene
+    doesn't run every tile again.
+    """
+    cache = detection_cache.get_cache()
+    scales = ','.join(str(scale) for scale in settings.DAMAGE_TILE_SCALES)
+    version = (f"{model_registry.model_version()}:tiled:{settings.DAMAGE_TILE_SIZE}:"
+               f"{settings.DAMAGE_TILE_OVERLAP}:{scales}")
+    key = cache.key(image.digest, version) if cache is not None else None
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        return np.array(cached['boxes'], dtype=np.float64).reshape(-1, 6), tuple(cached['shape'])
+
+    source = tiling.open_tile_source(image)
+    try:
+        boxes = tiling.detect_tiled(
+            source, batching.get_batcher('yolo', _predict_batch).map,
+            tile_size=settings.DAMAGE_TILE_SIZE,
+            overlap=settings.DAMAGE_TILE_OVERLAP,
+            scales=settings.DAMAGE_TILE_SCALES,
+            batch_size=settings.DAMAGE_BATCH_MAX_SIZE,
+        )
+        shape = tuple(source.shape)
+    finally:
+        source.close()
+    if cache is not None:
+        cache.put(key, {'boxes': boxes.tolist(), 'shape': list(shape)})
+    return boxes, shape
+
+
+def _report(pre_image, post_image, pre_boxes, post_boxes, pre_shape, post_shape, tiled=False):
+    """Compare pre and post detections object by object"""
+    # If both images have no detected objects, fallback to SSIM
+    if not len(pre_boxes) and not len(post_boxes):
+        score, heatmap = (_ssim_damage_tiled if tiled else _ssim_damage)(pre_image, post_image)
+        return {
+            'score': score, 'changed_area_sqm': None,
+            'objects': None, 'tiles': [], 'heatmap': heatmap,
+        }
+
+    # Compare in the pre-disaster frame
+    post_boxes = tiling.scale_boxes(post_boxes, post_shape, pre_shape)
+    pre_status, post_matched = change_detection.classify(
+        pre_boxes, post_boxes,
+        match_threshold=settings.DAMAGE_MATCH_IOU,
+        intact_iou=settings.DAMAGE_INTACT_IOU,
+        method=settings.DAMAGE_MATCHING,
+    )
+    objects = change_detection.summarize(pre_boxes, pre_status, post_matched)
+    report = {
+        'score': min(max(objects['score'], 0), 1),
+        'changed_area_sqm': None,
+        'objects': objects,
+        'tiles': [],
+        'heatmap': None,
+    }
+    if tiled:
+        report['changed_area_sqm'] = (
+            objects['damaged_footprint_px'] * settings.DAMAGE_GROUND_SAMPLE_DISTANCE_M ** 2
+        )
+        report['tiles'] = change_detection.summarize_tiles(
+            pre_boxes, post_boxes, pre_status, post_matched, pre_shape, settings.DAMAGE_TILE_SIZE
+        )
+    return report
+
+
+def compute_damage_reports(pairs):
+    """
+    Assess a list of ``(pre_image, post_image)`` DecodedImage pairs.
+
+    Regular images are detected together in one batch; large scenes are
+    detected tile by tile. Each report holds the image damage ``score``, the
+    per-object change counts and, for tiled scenes, the measured
+    ``changed_area_sqm`` and per-tile ``tiles`` breakdown.
+    """
+    reports = [None] * len(pairs)
+    whole = []
+    for i, (pre_image, post_image) in enumerate(pairs):
+        if is_large_scene(pre_image) or is_large_scene(post_image):
+            pre_boxes, pre_shape = detect_boxes_tiled(pre_image)
+            post_boxes, post_shape = detect_boxes_tiled(post_image)
+            reports[i] = _report(pre_image, post_image, pre_boxes, post_boxes,
+                                 pre_shape, post_shape, tiled=True)
+        else:
+            whole.append(i)
+
+    detections = detect_boxes([image for i in whole for image in pairs[i]])
+    for n, i in enumerate(whole):
+        pre_image, post_image = pairs[i]
+        reports[i] = _report(pre_image, post_image, detections[2*n], detections[2*n + 1],
+                             pre_image.dimensions, post_image.dimensions)
+    return reports
+
+
+def compute_damage_report(pre_image, post_image):
+    with decoded(pre_image) as pre_image, decoded(post_image) as post_image:
+        return compute_damage_reports([(pre_image, post_image)])[0]
+
+
+def compute_damage_score(pre_image, post_image):
+    """
+    Compute damage score using YOLO object detection.
+    Returns float in [0,1] (1=max damage).
+    """
+    return compute_damage_report(pre_image, post_image)['score']
+
+
+def run_damage_analysis(pre_image, post_image, location_name, disaster_type,
+                        vegetation_dryness=0.5, sea_level_rise_m=0.0,
+                        historical_events=0, on_progress=None, report=None):
+    """
+    Score a pre/post image pair and persist the resulting claim and analysis.
+
+    The images may be uploaded files or DecodedImages; either way each is
+    decoded at most once and the original file is what gets stored.
+    ``on_progress`` is called with a percentage as the pipeline advances.
+    Pass ``report`` when the images were already assessed, e.g. as part of
+    a batch. Returns ``(claim, analysis)``.
+    """
+    def progress(percent):
+        if on_progress is not None:
+            on_progress(percent)
+
+    # Compute damage score using Vision API
+    if report is None:
+        report = compute_damage_report(pre_image, post_image)
+    image_damage_score = report['score']
+    if isinstance(pre_image, DecodedImage):
+        pre_image = pre_image.source
+    if isinstance(post_image, DecodedImage):
+        post_image = post_image.source
+    progress(70)
+    disaster_score = get_disaster_score(disaster_type)
+    location_score = min(vegetation_dryness + sea_level_rise_m/5 + historical_events/10, 3)/3
+
+    # Weighted combination
+    damage_score = 0.5*image_damage_score + 0.3*disaster_score + 0.2*location_score
+
+    # Measured changed area for tiled scenes, else estimate (max 5000 sqm)
+    if report['changed_area_sqm'] is not None:
+        affected_area = report['changed_area_sqm']
+    else:
+        affected_area = damage_score * 5000
+    confidence = 0.9  # fixed high-confidence for deterministic scoring
+
+    with transaction.atomic():
+        # Save InsuranceClaim under a placeholder id, then number it from its
+        # primary key: analyses running concurrently (job threads, requests)
+        # can't pick the same number, as they could from a row count
+        claim = InsuranceClaim.objects.create(
+            claim_id=f"pending-{uuid.uuid4().hex}",
+            policy_id='',
+            location_name=location_name,
+            disaster_type=disaster_type,
+            pre_image=pre_image,
+            post_image=post_image,
+            damage_score=float(damage_score),
+            claim_amount_usd=Decimal(affected_area*100),
+            claim_status='Approved' if damage_score >= 0.7 else 'Under Review',
+            auto_approved=damage_score >= 0.7,
+            date_filed=date.today()
+        )
+        claim.claim_id = f"C{1000 + claim.pk}"
+        claim.policy_id = f"P{5000 + claim.pk}"
+        InsuranceClaim.objects.filter(pk=claim.pk).update(
+            claim_id=claim.claim_id, policy_id=claim.policy_id
+        )
+
+        # Save DamageAnalysis
+        analysis = DamageAnalysis.objects.create(
+            claim=claim,
+            damage_percentage=Decimal(damage_score*100),
+            affected_area_sqm=Decimal(affected_area),
+            confidence_score=Decimal(confidence),
+            ai_model_used='Google Vision Object Comparator v1.0',
+            notes=f'Automated analysis using Vision API. Confidence: {confidence:.2%}',
+            details={key: report[key] for key in ('objects', 'tiles', 'heatmap') if report[key]}
+        )
+    progress(100)
+
+    return claim, analysis
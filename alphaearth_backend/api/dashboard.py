@@ -0,0 +1,228 @@
+"""
+Dashboard statistics.
+
+Each table's figures come from a single conditional-aggregation query and
+are stored in the ``DashboardSnapshot`` row. Saving or deleting a single
+risk zone, claim or trigger doesn't re-aggregate anything: the signals
+(see ``api/signals.py``) work out how the row's figures changed and the
+difference is added to the snapshot with one ``UPDATE`` once the
+transaction commits. Bulk writes, which skip signals, re-aggregate the
+tables they touched instead (``mark_changed``).
+
+Readers get the snapshot through the Django cache for
+``DASHBOARD_STATS_CACHE_TTL`` seconds. A snapshot older than
+``DASHBOARD_STATS_MAX_AGE`` is rebuilt on read, which also corrects any
+drift from writes that bypass both paths (``QuerySet.update()``, raw
+SQL); ``manage.py refresh_dashboard_stats`` rebuilds it on demand.
+"""
+import threading
+import weakref
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import DashboardSnapshot, InsuranceClaim, ParametricTrigger, RiskZone
+
+
+CACHE_KEY = 'dashboard-stats'
+
+# Snapshot fields aggregated from each table, as {model: {field: aggregate}}
+AGGREGATES = {
+    RiskZone: {
+        'total_locations': Count('pk'),
+        'high_risk_zones': Count('pk', filter=Q(risk_score__gte=70)),
+        'medium_risk_zones': Count('pk', filter=Q(risk_score__gte=50, risk_score__lt=70)),
+        'low_risk_zones': Count('pk', filter=Q(risk_score__lt=50)),
+    },
+    InsuranceClaim: {
+        'active_claims': Count('pk'),
+        'approved_claims': Count('pk', filter=Q(claim_status='Approved')),
+        'pending_claims': Count('pk', filter=Q(claim_status__in=['Pending', 'Under Review'])),
+        'total_claim_amount': Sum('claim_amount_usd'),
+    },
+    ParametricTrigger: {
+        'active_triggers': Count('pk', filter=Q(triggered=True)),
+    },
+}
+FIELDS = [field for aggregates in AGGREGATES.values() for field in aggregates]
+
+# Columns a row's share of AGGREGATES depends on
+TRACKED_FIELDS = {
+    RiskZone: ['risk_score'],
+    InsuranceClaim: ['claim_status', 'claim_amount_usd'],
+    ParametricTrigger: ['triggered'],
+}
+
+
+def contribution(model, values):
+    """
+    What one row with ``values`` (its TRACKED_FIELDS) adds to the
+    snapshot's figures; the per-row counterpart of AGGREGATES
+    """
+    if model is RiskZone:
+        score = values['risk_score']
+        return {
+            'total_locations': 1,
+            'high_risk_zones': int(score >= 70),
+            'medium_risk_zones': int(50 <= score < 70),
+            'low_risk_zones': int(score < 50),
+        }
+    if model is InsuranceClaim:
+        status = values['claim_status']
+        return {
+            'active_claims': 1,
+            'approved_claims': int(status == 'Approved'),
+            'pending_claims': int(status in ('Pending', 'Under Review')),
+            'total_claim_amount': Decimal(str(values['claim_amount_usd'] or 0)),
+        }
+    return {'active_triggers': int(bool(values['triggered']))}
+
+
+def stored_contribution(model, pk):
+    """``contribution`` of the row as it is in the database, or None"""
+    if pk is None:
+        return None
+    values = model.objects.filter(pk=pk).values(*TRACKED_FIELDS[model]).first()
+    return contribution(model, values) if values is not None else None
+
+
+def instance_contribution(instance):
+    """``contribution`` of a model instance, or None if it lacks the fields"""
+    model = type(instance)
+    if set(TRACKED_FIELDS[model]) & instance.get_deferred_fields():
+        return None
+    return contribution(model, {name: getattr(instance, name) for name in TRACKED_FIELDS[model]})
+
+
+def aggregate(models=None):
+    """Fresh statistics for ``models`` (default: all), one query per table"""
+    stats = {}
+    for model in models or AGGREGATES:
+        stats.update(model.objects.order_by().aggregate(**AGGREGATES[model]))
+    if 'total_claim_amount' in stats:
+        stats['total_claim_amount'] = stats['total_claim_amount'] or 0
+    return stats
+
+
+def _cache_snapshot(snapshot):
+    data = {field: getattr(snapshot, field) for field in FIELDS}
+    cache.set(CACHE_KEY, data, settings.DASHBOARD_STATS_CACHE_TTL)
+    return data
+
+
+def refresh(models=None):
+    """Re-aggregate ``models`` (default: all) into the snapshot and the cache"""
+    stats = aggregate(models)
+    if not models:
+        # Only a full rebuild resets the age that triggers the next one
+        stats['updated_at'] = timezone.now()
+    if DashboardSnapshot.objects.filter(pk=1).update(**stats):
+        if models:
+            # Only some figures were recomputed; read the rest from the row
+            return _cache_snapshot(DashboardSnapshot.objects.get(pk=1))
+    else:
+        if models:
+            stats.update(aggregate(set(AGGREGATES) - set(models)))
+        DashboardSnapshot.objects.create(pk=1, **stats)
+    return _cache_snapshot(DashboardSnapshot(**stats))
+
+
+def get_stats(fresh=False):
+    """Dashboard statistics from the cache, the snapshot or, if needed, the tables"""
+    if fresh:
+        return refresh()
+    data = cache.get(CACHE_KEY)
+    if data is not None:
+        return data
+    snapshot = DashboardSnapshot.objects.filter(pk=1).first()
+    max_age = timedelta(seconds=settings.DASHBOARD_STATS_MAX_AGE)
+    if snapshot is None or snapshot.updated_at < timezone.now() - max_age:
+        return refresh()
+    return _cache_snapshot(snapshot)
+
+
+# This thread's changes waiting for their transaction to commit
+_pending = threading.local()
+
+
+def _pending_changes():
+    changes = getattr(_pending, 'changes', None)
+    if changes is None:
+        changes = _pending.changes = weakref.WeakSet()
+    return changes
+
+
+class _Change:
+    """
+    on_commit callback for one write's share of the snapshot update: its
+    per-row ``deltas``, or the ``model`` to re-aggregate in full.
+
+    The pending set only holds changes weakly, and a rollback -- of the
+    transaction or of a savepoint -- discards the callbacks registered in
+    it, so the changes still pending when the transaction commits are the
+    writes that survived. The first of them to run applies them all with
+    one UPDATE; the rest find themselves done.
+    """
+
+    def __init__(self, deltas=None, model=None):
+        self.deltas = deltas or {}
+        self.model = model
+        self.done = False
+
+    def __call__(self):
+        if self.done:
+            return
+        changes = [change for change in _pending_changes() if not change.done]
+        models, deltas = set(), {}
+        for change in changes:
+            change.done = True
+            if change.model is not None:
+                models.add(change.model)
+            for field, delta in change.deltas.items():
+                deltas[field] = deltas.get(field, 0) + delta
+        _pending_changes().difference_update(changes)
+
+        refreshed = {field for model in models for field in AGGREGATES[model]}
+        updates = {
+            field: F(field) + delta for field, delta in deltas.items()
+            if delta and field not in refreshed
+        }
+        # No row yet: the next read builds it from the tables
+        if updates and DashboardSnapshot.objects.filter(pk=1).update(**updates):
+            cache.delete(CACHE_KEY)
+        if models:
+            refresh(models)
+
+
+def _schedule(change):
+    _pending_changes().add(change)
+    # Outside a transaction this runs it right away
+    transaction.on_commit(change)
+
+
+def row_changed(model, before, after):
+    """
+    Add the difference between a row's ``before`` and ``after``
+    contributions (None when it didn't / doesn't exist) to the snapshot
+    once the current transaction commits
+    """
+    deltas = dict(after or {})
+    for field, value in (before or {}).items():
+        deltas[field] = deltas.get(field, 0) - value
+    if any(deltas.values()):
+        _schedule(_Change(deltas=deltas))
+
+
+def mark_changed(model):
+    """
+    Schedule ``model``'s figures to be re-aggregated when the current
+    transaction commits, for writes that bypass the per-row signals. Many
+    writes in one transaction cost one refresh, and nothing is refreshed
+    if it rolls back.
+    """
+    _schedule(_Change(model=model))
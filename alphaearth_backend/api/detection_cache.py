@@ -0,0 +1,112 @@
+"""
+Persistent cache of detector output keyed by image content.
+
+Adjusters often resubmit the same baseline image for many claims, so the
+detector's box rows for an image (``[x1, y1, x2, y2, confidence, class]``;
+for a tiled scene, its merged boxes and shape) are stored as JSON in a
+small SQLite file under ``sha256(image) + model version`` and reused.
+The least recently used entries are evicted once
+``DAMAGE_DETECTION_CACHE_MAX_ENTRIES`` is exceeded.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+
+class DetectionCache:
+    def __init__(self, path, max_entries=10000):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS detections ('
+                ' key TEXT PRIMARY KEY, objects TEXT NOT NULL, last_used REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used)')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def key(digest, model_version):
+        return f"{model_version}/{digest}"
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """Cached detections for ``key``, or None"""
+        conn = self._connection()
+        row = conn.execute('SELECT objects FROM detections WHERE key = ?', (key,)).fetchone()
+        self._count(row is not None)
+        if row is None:
+            return None
+        conn.execute('UPDATE detections SET last_used = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, objects):
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO detections (key, objects, last_used) VALUES (?, ?, ?)',
+            (key, json.dumps(objects), time.time())
+        )
+        conn.execute(
+            'DELETE FROM detections WHERE key IN ('
+            ' SELECT key FROM detections ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM detections')
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        entries = self._connection().execute('SELECT COUNT(*) FROM detections').fetchone()[0]
+        return {
+            'path': self.path,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide detection cache, or None when disabled in settings"""
+    global _cache
+    if not settings.DAMAGE_DETECTION_CACHE_PATH:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DetectionCache(
+                    settings.DAMAGE_DETECTION_CACHE_PATH,
+                    max_entries=settings.DAMAGE_DETECTION_CACHE_MAX_ENTRIES,
+                )
+    return _cache
+
+
+def metrics():
+    cache = get_cache()
+    return cache.metrics() if cache is not None else None
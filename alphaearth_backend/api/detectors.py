@@ -0,0 +1,149 @@
+"""
+Detector backends for the damage pipeline.
+
+Every backend takes a list of BGR images and returns, per image, rows of
+``[x1, y1, x2, y2, conf, cls]`` in that image's pixel coordinates:
+
+- ``TorchDetector`` runs the ultralytics YOLO model with PyTorch.
+- ``OnnxDetector`` runs a YOLOv8 model exported to ONNX (optionally INT8
+  quantized, see ``manage.py export_detector``) with ONNX Runtime, with its
+  own letterboxing, output decoding and NMS mirroring ultralytics'
+  defaults so both backends give the same detections.
+"""
+import ast
+import threading
+
+import cv2
+import numpy as np
+
+from .tiling import nms
+
+
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+
+
+def boxes_from_result(result):
+    """Box rows from an ultralytics ``Results`` object"""
+    if not len(result.boxes):
+        return np.zeros((0, 6))
+    return np.column_stack([
+        result.boxes.xyxy.cpu().numpy(),
+        result.boxes.conf.cpu().numpy(),
+        result.boxes.cls.cpu().numpy(),
+    ])
+
+
+class TorchDetector:
+    backend = 'torch'
+
+    def __init__(self, weights, device='cpu'):
+        from ultralytics import YOLO
+
+        self.device = device
+        self.model = YOLO(weights).to(device)
+        # The ultralytics predictor keeps per-call state, so calls from
+        # several inference workers take turns
+        self._lock = threading.Lock()
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def predict_boxes(self, images):
+        with self._lock:
+            results = self.model.predict(
+                images, save=False, verbose=False, device=self.device,
+                conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, max_det=MAX_DETECTIONS
+            )
+        return [boxes_from_result(result) for result in results]
+
+
+def letterbox(image, size):
+    """
+    Resize ``image`` to fit a ``size`` x ``size`` square keeping its aspect
+    ratio and pad the rest with grey, like ultralytics does. Returns
+    ``(padded, gain, (pad_x, pad_y))``.
+    """
+    height, width = image.shape[:2]
+    gain = min(size / height, size / width)
+    new_w, new_h = int(round(width * gain)), int(round(height * gain))
+    if (new_w, new_h) != (width, height):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    dw, dh = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                                value=(114, 114, 114))
+    return padded, gain, (left, top)
+
+
+def decode_output(output, gain, pad, image_shape, conf_threshold=CONF_THRESHOLD,
+                  iou_threshold=IOU_THRESHOLD, max_detections=MAX_DETECTIONS):
+    """
+    Turn one image's raw YOLOv8 output, shaped ``(4 + classes, anchors)``
+    with centre-x, centre-y, width, height and per-class scores, into box
+    rows in the original image's coordinates.
+    """
+    preds = output.T
+    scores = preds[:, 4:]
+    cls = scores.argmax(axis=1)
+    conf = scores[np.arange(len(scores)), cls]
+    keep = conf > conf_threshold
+    if not keep.any():
+        return np.zeros((0, 6))
+
+    cx, cy, w, h = preds[keep, :4].T
+    rows = np.column_stack([
+        cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2, conf[keep], cls[keep]
+    ]).astype(np.float64)
+    rows = nms(rows, iou_threshold, metric='iou')[:max_detections]
+
+    rows[:, [0, 2]] = np.clip((rows[:, [0, 2]] - pad[0]) / gain, 0, image_shape[1])
+    rows[:, [1, 3]] = np.clip((rows[:, [1, 3]] - pad[1]) / gain, 0, image_shape[0])
+    return rows
+
+
+class OnnxDetector:
+    backend = 'onnx'
+
+    def __init__(self, path, intra_op_threads=0, inter_op_threads=0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(path), sess_options=options, providers=['CPUExecutionProvider']
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, _ = model_input.shape
+        self.size = height if isinstance(height, int) else 640
+        # Models exported without dynamic axes take one image per run
+        self.max_batch = batch if isinstance(batch, int) else None
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+
+    def _run(self, blob):
+        if self.max_batch is None:
+            return self.session.run(None, {self.input_name: blob})[0]
+        return np.concatenate([
+            self.session.run(None, {self.input_name: blob[i:i + self.max_batch]})[0]
+            for i in range(0, len(blob), self.max_batch)
+        ])
+
+    def predict_boxes(self, images):
+        if not images:
+            return []
+        prepared = [letterbox(image, self.size) for image in images]
+        blob = np.stack([padded for padded, _, _ in prepared])
+        # BGR HWC uint8 -> RGB CHW float in [0, 1]
+        blob = np.ascontiguousarray(blob[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255
+        outputs = self._run(blob)
+        return [
+            decode_output(output, gain, pad, image.shape)
+            for output, (_, gain, pad), image in zip(outputs, prepared, images)
+        ]
@@ -0,0 +1,247 @@
+"""
+Decode-once image handling for the damage pipeline.
+"""
+import hashlib
+import io
+import mmap
+import struct
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+# Formats the pipeline can decode (OpenCV) or read window by window (rasterio)
+SCENE_FORMATS = {'JPEG', 'PNG', 'TIFF', 'WEBP', 'BMP', 'JPEG2000'}
+
+
+class ImageTooLarge(ValueError):
+    def __init__(self, pixels, max_pixels):
+        super().__init__(f"Image has {pixels} pixels, more than {max_pixels}")
+        self.pixels = pixels
+        self.max_pixels = max_pixels
+
+
+def _is_tiff_name(source):
+    return str(getattr(source, 'name', '') or '').lower().endswith(('.tif', '.tiff'))
+
+
+def _raster_header(source):
+    """Header of a TIFF Pillow can't open (e.g. a GeoTIFF with float bands), through rasterio"""
+    import rasterio
+
+    path = source.temporary_file_path() if hasattr(source, 'temporary_file_path') else None
+    source.seek(0)
+    with rasterio.open(path or source) as dataset:
+        return 'TIFF', (dataset.height, dataset.width)
+
+
+def _open_header(source):
+    """
+    What ``Image.open`` returns, minus its decompression-bomb check: the
+    format plugins parse the header only and decode nothing until load().
+    Pillow's limit (``Image.MAX_IMAGE_PIXELS``) is process-wide, so it is
+    left alone for the rest of the process rather than lifted for a read.
+    """
+    prefix = source.read(16)
+    tried = set()
+    for load_plugins in (Image.preinit, Image.init):
+        load_plugins()
+        for format_id in [format_id for format_id in Image.ID if format_id not in tried]:
+            tried.add(format_id)
+            factory, accept = Image.OPEN[format_id]
+            result = not accept or accept(prefix)
+            if not result or isinstance(result, str):
+                continue
+            source.seek(0)
+            try:
+                return factory(source, getattr(source, 'name', '') or '')
+            except (SyntaxError, IndexError, TypeError, struct.error):
+                continue
+    raise ValueError("cannot identify image file")
+
+
+def read_header(source, max_pixels=None):
+    """
+    ``(format, (height, width))`` of an image file, read from its header
+    without decoding the pixels. Raises ValueError if ``source`` isn't an
+    image, and ImageTooLarge if it has more than ``max_pixels`` pixels.
+
+    ``max_pixels`` takes the place of Pillow's decompression-bomb limit
+    (Pillow refuses files over ~179M pixels), so satellite scenes larger
+    than that can be inspected; None means no limit.
+    """
+    try:
+        source.seek(0)
+        with _open_header(source) as header:
+            image_format, (width, height) = header.format, header.size
+    except (OSError, ValueError) as exc:
+        if not _is_tiff_name(source):
+            raise ValueError(f"Not an image: {exc}") from exc
+        try:
+            image_format, (height, width) = _raster_header(source)
+        except Exception as raster_exc:
+            raise ValueError(f"Not an image: {exc}") from raster_exc
+    finally:
+        source.seek(0)
+    if max_pixels is not None and width * height > max_pixels:
+        raise ImageTooLarge(width * height, max_pixels)
+    return image_format, (height, width)
+
+
+def _open_buffer(source):
+    """
+    Expose the bytes of ``source`` as a memoryview, avoiding a copy where
+    possible: in-memory uploads share the BytesIO buffer and files on disk
+    are memory-mapped. Returns ``(view, mapping)``.
+    """
+    file = getattr(source, 'file', source)
+    if isinstance(file, io.BytesIO):
+        return file.getbuffer(), None
+    try:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        source.seek(0)
+        data = source.read()
+        source.seek(0)
+        return memoryview(data), None
+    return memoryview(mapping), mapping
+
+
+def pyramid_down(image, width, height):
+    """Halve ``image`` with pyrDown while it stays at least twice the target, then resize"""
+    while image.shape[1] >= 2 * width and image.shape[0] >= 2 * height:
+        image = cv2.pyrDown(image)
+    if image.shape[:2] != (height, width):
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    return image
+
+
+class DecodedImage:
+    """
+    An uploaded image decoded at most once per request.
+
+    The colour array is decoded lazily from the raw bytes; grayscale and
+    resized variants are derived from it and cached. ``source`` is the
+    original file, kept so it can be persisted unchanged.
+
+    Use as a context manager (or call ``release()``) so the shared buffer
+    is let go before the upload is closed.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._buffer, self._mapping = _open_buffer(source)
+        self._color = None
+        self._decoded = False
+        self._gray = None
+        self._resized = {}
+        self._digest = None
+        self._header = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    @property
+    def name(self):
+        return getattr(self.source, 'name', None)
+
+    @property
+    def nbytes(self):
+        return self._buffer.nbytes if self._buffer is not None else 0
+
+    @property
+    def buffer(self):
+        """Raw encoded bytes as a read-only memoryview"""
+        return self._buffer
+
+    @property
+    def digest(self):
+        """SHA-256 of the raw bytes, for content-addressed caching"""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self._buffer).hexdigest()
+        return self._digest
+
+    @property
+    def color(self):
+        """BGR array, or None if the bytes could not be decoded"""
+        if not self._decoded:
+            self._color = cv2.imdecode(np.frombuffer(self._buffer, np.uint8), cv2.IMREAD_COLOR)
+            self._decoded = True
+        return self._color
+
+    @property
+    def gray(self):
+        if self._gray is None and self.color is not None:
+            self._gray = cv2.cvtColor(self.color, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def shape(self):
+        return self.color.shape[:2] if self.color is not None else None
+
+    def _read_header(self):
+        if self._header is None:
+            try:
+                self._header = read_header(self.source)
+            except (AttributeError, ValueError):
+                self._header = (None, None)
+        return self._header
+
+    @property
+    def format(self):
+        """Format name from the file header ('PNG', 'TIFF', ...), or None"""
+        return self._read_header()[0]
+
+    @property
+    def dimensions(self):
+        """(height, width), read from the file header if not decoded yet"""
+        if not self._decoded:
+            dimensions = self._read_header()[1]
+            if dimensions is not None:
+                return dimensions
+        return self.shape
+
+    def resized(self, width, height, gray=True):
+        """Variant scaled to ``width`` x ``height``, derived from the decoded array"""
+        base = self.gray if gray else self.color
+        if base is None or base.shape[:2] == (height, width):
+            return base
+        key = (width, height, gray)
+        if key not in self._resized:
+            self._resized[key] = cv2.resize(base, (width, height))
+        return self._resized[key]
+
+    def downsampled(self, width, height, gray=True):
+        """Like ``resized`` but walks down an image pyramid first, for large reductions"""
+        base = self.gray if gray else self.color
+        if base is None or base.shape[:2] == (height, width):
+            return base
+        key = ('pyramid', width, height, gray)
+        if key not in self._resized:
+            self._resized[key] = pyramid_down(base, width, height)
+        return self._resized[key]
+
+    def release(self):
+        """Drop the raw buffer; decoded arrays stay usable"""
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+        self._resized.clear()
+
+
+@contextmanager
+def decoded(image):
+    """Yield ``image`` as a DecodedImage, releasing it afterwards if created here"""
+    if isinstance(image, DecodedImage):
+        yield image
+        return
+    with DecodedImage(image) as image:
+        yield image
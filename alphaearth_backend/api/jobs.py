@@ -0,0 +1,204 @@
+"""
+DB-backed queue for asynchronous damage analysis.
+
+Jobs are rows in ``DamageAnalysisJob``. A job is claimed by atomically
+flipping its status from Queued to Running, so the in-process thread pool
+and any number of ``run_damage_worker`` processes can drain the same queue
+without an external broker.
+
+The queue lives in the database, not in the pool: a claimed job holds a
+lease (``DAMAGE_JOB_LEASE_SECONDS``, renewed on progress) and is queued
+again once the lease runs out, e.g. because its process died; ``start()``
+has a process's pool drain whatever is queued when it comes up, and every
+pool thread keeps draining after the job it was handed. The uploaded
+images are deleted once the job completes or fails.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .batching import QueueFull
+from .damage import run_damage_analysis
+from .models import DamageAnalysisJob
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_started = False
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.DAMAGE_JOB_WORKERS,
+                    thread_name_prefix='damage-job',
+                )
+    return _executor
+
+
+def start():
+    """
+    Have this process's pool drain the jobs already queued, e.g. those a
+    previous process accepted but never ran. Called from ``wsgi.py``.
+    """
+    global _started
+    _started = True
+    for _ in range(settings.DAMAGE_JOB_WORKERS):
+        _get_executor().submit(_run_in_thread, None)
+
+
+def _after_fork():
+    # The parent's pool threads don't exist in a forked child (gunicorn
+    # --preload): start a pool of its own
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    if _started:
+        start()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _lease():
+    return timezone.now() + timedelta(seconds=settings.DAMAGE_JOB_LEASE_SECONDS)
+
+
+def _delete_uploads(job):
+    # The claim keeps its own copy of both images
+    job.pre_image.delete(save=False)
+    job.post_image.delete(save=False)
+
+
+def requeue_stale():
+    """
+    Queue again the Running jobs whose lease ran out, or fail them after
+    ``DAMAGE_JOB_MAX_ATTEMPTS`` runs. Returns how many were requeued.
+    """
+    stale = DamageAnalysisJob.objects.filter(status='Running', lease_expires_at__lt=timezone.now())
+    for job in stale.filter(attempts__gte=settings.DAMAGE_JOB_MAX_ATTEMPTS):
+        abandoned = stale.filter(pk=job.pk).update(
+            status='Failed', error='Abandoned: the worker running it stopped responding',
+            pre_image='', post_image='', lease_expires_at=None, finished_at=timezone.now()
+        )
+        if abandoned:
+            _delete_uploads(job)
+    return stale.update(status='Queued', progress=0, lease_expires_at=None)
+
+
+def enqueue(pre_image, post_image, location_name, disaster_type, **parameters):
+    """Persist the uploads as a queued job and hand it to the worker pool"""
+    job = DamageAnalysisJob.objects.create(
+        pre_image=pre_image,
+        post_image=post_image,
+        location_name=location_name,
+        disaster_type=disaster_type,
+        parameters=parameters,
+    )
+    if settings.DAMAGE_JOB_WORKERS > 0:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.pk))
+    return job
+
+
+def claim_job(job_id=None):
+    """
+    Mark a queued job as running and return it, or None if there is nothing
+    to do. Without ``job_id`` the oldest queued job is claimed; abandoned
+    jobs are requeued first.
+    """
+    requeue_stale()
+    candidates = DamageAnalysisJob.objects.filter(status='Queued')
+    if job_id is not None:
+        candidates = candidates.filter(pk=job_id)
+    for pk in candidates.order_by('created_at').values_list('pk', flat=True)[:5]:
+        claimed = DamageAnalysisJob.objects.filter(pk=pk, status='Queued').update(
+            status='Running', progress=5, started_at=timezone.now(),
+            attempts=F('attempts') + 1, lease_expires_at=_lease()
+        )
+        if claimed:
+            return DamageAnalysisJob.objects.get(pk=pk)
+    return None
+
+
+def process_job(job):
+    """Run the damage pipeline for a claimed job and record the outcome"""
+    # Only the run holding the job records its outcome, not one that
+    # outlived its lease while the job was run again
+    own = DamageAnalysisJob.objects.filter(pk=job.pk, status='Running', attempts=job.attempts)
+
+    def on_progress(percent):
+        own.update(progress=percent, lease_expires_at=_lease())
+
+    def analyse():
+        with job.pre_image.open('rb') as pre_image, job.post_image.open('rb') as post_image:
+            return run_damage_analysis(
+                pre_image, post_image, job.location_name, job.disaster_type,
+                on_progress=on_progress, **job.parameters
+            )
+
+    try:
+        while True:
+            try:
+                claim, analysis = analyse()
+                break
+            except QueueFull as exc:
+                # Jobs have no client waiting on them, so wait for room
+                # instead of failing, holding on to the job meanwhile
+                if not own.update(lease_expires_at=_lease()):
+                    return False
+                time.sleep(exc.retry_after)
+    except Exception as exc:
+        logger.exception("Damage analysis job %s failed", job.pk)
+        if own.update(status='Failed', error=str(exc), pre_image='', post_image='',
+                      lease_expires_at=None, finished_at=timezone.now()):
+            _delete_uploads(job)
+        return False
+
+    if own.update(status='Completed', progress=100, claim=claim, analysis=analysis,
+                  pre_image='', post_image='', lease_expires_at=None, finished_at=timezone.now()):
+        _delete_uploads(job)
+    return True
+
+
+def process_next_job(job_id=None):
+    """Claim and process one job. Returns False when the queue is empty."""
+    job = claim_job(job_id)
+    if job is None:
+        return False
+    process_job(job)
+    return True
+
+
+def drain():
+    """Process queued jobs until there are none. Returns how many were processed."""
+    processed = 0
+    while process_next_job():
+        processed += 1
+    return processed
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        if job_id is not None:
+            process_next_job(job_id)
+        # Then whatever else is waiting, including jobs requeued from a
+        # process that died
+        drain()
+    except Exception:
+        logger.exception("Damage analysis job thread failed")
+    finally:
+        close_old_connections()
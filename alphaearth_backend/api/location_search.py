@@ -0,0 +1,172 @@
+"""
+Ranked location search for the ``by_location`` actions.
+
+``search(term)`` matches the normalized term against ``Location.key``
+through an index instead of a ``LIKE '%x%'`` scan:
+
+- PostgreSQL uses the ``pg_trgm`` GIN index on ``api_location.key``, which
+  serves both the substring match and the fuzzy ``%`` (trigram similarity)
+  match.
+- SQLite uses the ``api_location_fts`` FTS5 table (trigram tokenizer),
+  kept in step with ``api_location`` by triggers. When nothing contains the
+  term, the locations sharing most of its trigrams are the fuzzy matches.
+- Other databases, or a SQLite build without the trigram tokenizer, fall
+  back to a plain substring match.
+
+Results are ranked exact match first, then prefix matches, matches at the
+start of a word, and the rest by relevance. ``search`` returns every
+match, since its ids are used as a filter; ``suggest`` returns the best
+``LOCATION_SEARCH_LIMIT`` for autocompletion, and ``rank_by`` orders a
+queryset filtered on the ids the way they were ranked (the best
+``LOCATION_RANK_LIMIT`` of them). Both migrations
+live in ``0010_location_search``.
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, IntegerField, Value, When
+
+from .models import Location
+
+
+FTS_TABLE = 'api_location_fts'
+
+# Minimum trigram similarity of a fuzzy match, pg_trgm's default threshold
+SIMILARITY_THRESHOLD = 0.3
+
+# Fuzzy candidates read from the FTS table per result returned
+FUZZY_CANDIDATES = 4
+
+_fts_tables = {}
+
+
+def trigrams(text):
+    """pg_trgm-style trigrams of ``text``: each word padded with two leading and one trailing space"""
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """Share of trigrams ``a`` and ``b`` have in common, from 0 to 1"""
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _has_fts(connection):
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _fts_tables:
+        _fts_tables[key] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_tables[key]
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def search(term, limit=None, using='default'):
+    """Ids of the Locations matching ``term``, best match first; all of them unless ``limit``"""
+    key = Location.normalize(term or '')
+    if not key:
+        return []
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(connection, key, limit)
+    # The trigram tokenizer can't match fewer than three characters
+    if connection.vendor == 'sqlite' and len(key) >= 3 and _has_fts(connection):
+        return _search_sqlite(connection, key, limit)
+    return _search_like(key, limit, using)
+
+
+def suggest(term, using='default'):
+    """The best ``LOCATION_SEARCH_LIMIT`` Locations matching ``term``, for autocompletion"""
+    ids = search(term, settings.LOCATION_SEARCH_LIMIT, using)
+    locations = Location.objects.using(using).in_bulk(ids)
+    return [locations[pk] for pk in ids if pk in locations]
+
+
+def rank_by(queryset, ids, field='location'):
+    """
+    ``queryset`` narrowed to the rows whose ``field`` is one of ``ids``
+    (from ``search``), best-ranked location first and then in the
+    queryset's own order. Only the first ``LOCATION_RANK_LIMIT`` ids are
+    ranked one by one, which bounds the size of the CASE; rows of the
+    other matches follow them in the queryset's order.
+    """
+    if len(ids) <= 1:
+        return queryset.filter(**{f'{field}__in': ids})
+    ranked = ids[:settings.LOCATION_RANK_LIMIT]
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    return queryset.filter(**{f'{field}__in': ids}).alias(location_rank=Case(
+        *[When(**{f'{field}_id': pk}, then=Value(rank)) for rank, pk in enumerate(ranked)],
+        default=Value(len(ranked)),
+        output_field=IntegerField(),
+    )).order_by('location_rank', *ordering)
+
+
+def _search_postgresql(connection, key, limit):
+    pattern = key.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT id FROM api_location
+            WHERE key LIKE %s OR key %% %s
+            ORDER BY key = %s DESC,
+                     left(key, length(%s)) = %s DESC,
+                     position(%s in ' ' || key) > 0 DESC,
+                     key LIKE %s DESC,
+                     similarity(key, %s) DESC,
+                     name
+            LIMIT %s
+            """,
+            [f'%{pattern}%', key, key, key, key, ' ' + key, f'%{pattern}%', key, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_sqlite(connection, key, limit):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT location.id FROM {FTS_TABLE} JOIN api_location location
+                ON location.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s
+            ORDER BY location.key = %s DESC,
+                     substr(location.key, 1, length(%s)) = %s DESC,
+                     instr(' ' || location.key, %s) > 0 DESC,
+                     {FTS_TABLE}.rank,
+                     location.name
+            LIMIT %s
+            """,
+            [_fts_phrase(key), key, key, key, ' ' + key, limit or -1],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        if ids:
+            return ids
+
+        # Nothing contains the term: rank the locations sharing any of its
+        # trigrams by how many they share
+        query = ' OR '.join(sorted(_fts_phrase(key[i:i + 3]) for i in range(len(key) - 2)))
+        cursor.execute(
+            f'SELECT rowid, key FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s',
+            [query, limit * FUZZY_CANDIDATES if limit else -1],
+        )
+        scored = [(similarity(key, candidate), pk) for pk, candidate in cursor.fetchall()]
+    scored = sorted((-score, pk) for score, pk in scored if score >= SIMILARITY_THRESHOLD)
+    return [pk for _, pk in scored[:limit]]
+
+
+def _search_like(key, limit, using):
+    return list(
+        Location.objects.using(using).filter(key__contains=key)
+        .annotate(rank=Case(
+            When(key=key, then=Value(0)),
+            When(key__startswith=key, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ))
+        .order_by('rank', 'name').values_list('pk', flat=True)[:limit]
+    )
@@ -0,0 +1,85 @@
+# api/management/commands/benchmark_detector.py
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from api import change_detection, model_registry
+from api.imaging import DecodedImage
+
+
+def load_images(paths, count, size, seed=0):
+    if paths:
+        images = []
+        for path in paths:
+            with open(path, "rb") as f:
+                image = DecodedImage(f)
+                images.append(image.color)
+                image.release()
+        return images
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def parity(reference, boxes, iou=0.5):
+    """Share of reference detections matched by a same-class box at ``iou``"""
+    if not len(reference):
+        return 1.0 if not len(boxes) else 0.0
+    status, _ = change_detection.classify(reference, boxes, match_threshold=iou, intact_iou=iou,
+                                          min_conf_ratio=0)
+    return float(np.mean(status == change_detection.INTACT))
+
+
+class Command(BaseCommand):
+    help = "Compare latency and detections of the torch and onnx detector backends"
+
+    def add_arguments(self, parser):
+        parser.add_argument("images", nargs="*", help="Image files (default: synthetic noise)")
+        parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+        parser.add_argument("--onnx", nargs="*", default=[],
+                            help="Extra ONNX models to compare, e.g. an INT8 export")
+        parser.add_argument("--batch-size", type=int, default=1)
+        parser.add_argument("--count", type=int, default=8)
+        parser.add_argument("--size", type=int, default=640)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--warmup", type=int, default=2)
+
+    def handle(self, *args, **options):
+        images = load_images(options["images"], options["count"], options["size"])
+        batch_size = options["batch_size"]
+        batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+        runs = [(backend, None) for backend in options["backends"]]
+        runs += [("onnx", path) for path in options["onnx"]]
+
+        reference = None
+        for backend, weights in runs:
+            try:
+                detector = model_registry.get_detector(backend, weights)
+            except (ImportError, OSError) as exc:
+                self.stderr.write(f"{backend:5} {weights or ''}: skipped ({exc})")
+                continue
+
+            for batch in batches[:options["warmup"]]:
+                detector.predict_boxes(batch)
+            latencies = []
+            for _ in range(options["repeat"]):
+                for batch in batches:
+                    started = time.perf_counter()
+                    detector.predict_boxes(batch)
+                    latencies.append(time.perf_counter() - started)
+            latencies = np.array(latencies) * 1000
+            results = [boxes for batch in batches for boxes in detector.predict_boxes(batch)]
+
+            line = (
+                f"{backend:5} {weights or model_registry.model_version(backend):40} "
+                f"p50={np.percentile(latencies, 50):8.1f} ms  p95={np.percentile(latencies, 95):8.1f} ms  "
+                f"{len(images) * options['repeat'] / latencies.sum() * 1000:7.1f} img/s  "
+                f"boxes={sum(len(boxes) for boxes in results)}"
+            )
+            if reference is None:
+                reference = results
+            else:
+                agreement = np.mean([parity(ref, boxes) for ref, boxes in zip(reference, results)])
+                line += f"  parity={agreement:.3f}"
+            self.stdout.write(line)
+
+        if reference is None:
+            raise CommandError("No detector backend could be loaded")
@@ -0,0 +1,77 @@
+# api/management/commands/benchmark_ssim.py
+import time
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand
+from skimage.metrics import structural_similarity
+from api import similarity
+from api.imaging import DecodedImage, pyramid_down
+
+
+def synthetic_pair(size, seed=0):
+    """Textured 'pre' scene and a 'post' copy with some blocks wiped out"""
+    rng = np.random.default_rng(seed)
+    pre = cv2.GaussianBlur(rng.integers(0, 256, (size, size), dtype=np.uint8), (5, 5), 0)
+    post = pre.copy()
+    for _ in range(20):
+        y, x = rng.integers(0, size - size // 10, 2)
+        post[y:y + size // 10, x:x + size // 10] = rng.integers(0, 256)
+    return pre, post
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = "Compare the fast SSIM fallback against skimage's structural_similarity"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[512, 2048, 4096])
+        parser.add_argument("--max-sides", type=int, nargs="+", default=[0, 2048, 1024, 512])
+        parser.add_argument("--pre", help="Pre-disaster image file (overrides --sizes)")
+        parser.add_argument("--post", help="Post-disaster image file")
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        if options["pre"] and options["post"]:
+            pairs = [(options["pre"], options["post"])]
+        else:
+            pairs = [synthetic_pair(size) for size in options["sizes"]]
+
+        for pre, post in pairs:
+            if isinstance(pre, str):
+                with open(pre, "rb") as pre_file, open(post, "rb") as post_file:
+                    pre_image, post_image = DecodedImage(pre_file), DecodedImage(post_file)
+                    pre, post = pre_image.gray, post_image.gray
+                    pre_image.release()
+                    post_image.release()
+            h, w = min(pre.shape[0], post.shape[0]), min(pre.shape[1], post.shape[1])
+            pre, post = cv2.resize(pre, (w, h)), cv2.resize(post, (w, h))
+
+            self.stdout.write(f"=== {w}x{h} ===")
+            base_time, (base_score, _) = timed(
+                lambda: structural_similarity(pre, post, full=True), options["repeat"]
+            )
+            self.stdout.write(f"skimage            {base_time * 1000:9.1f} ms  ssim={base_score:.4f}")
+
+            for max_side in options["max_sides"]:
+                width, height = similarity.target_size([pre.shape], max_side)
+
+                def run():
+                    small_pre = pyramid_down(pre, width, height)
+                    small_post = pyramid_down(post, width, height)
+                    return similarity.ssim(small_pre, small_post, heatmap_blocks=8)
+
+                fast_time, (score, _) = timed(run, options["repeat"])
+                label = f"fast max_side={max_side or 'full'}"
+                self.stdout.write(
+                    f"{label:18} {fast_time * 1000:9.1f} ms  ssim={score:.4f}  "
+                    f"|diff|={abs(score - base_score):.4f}  speedup={base_time / fast_time:5.1f}x"
+                )
+
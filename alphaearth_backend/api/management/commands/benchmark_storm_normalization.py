@@ -0,0 +1,84 @@
+# api/management/commands/benchmark_storm_normalization.py
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api import storm_events
+
+EVENT_TYPES = [
+    "Thunderstorm Wind", "Hail", "Flash Flood", "Flood", "Tornado", "Winter Storm",
+    "Wildfire", "Heavy Rain", "Drought", "High Wind", "Tropical Storm",
+    "Hurricane (Typhoon)", "Coastal Flood", "Lightning", "Marine Thunderstorm Wind",
+]
+DAMAGES = ["", "0.00K", "0", "1.00K", "2.50K", "5.00K", "10.00K", "25K", "150.00K", "1.5M", "20.00M", "1.2B"]
+STATES = ["FLORIDA", "TEXAS", "KANSAS", "OKLAHOMA", "IOWA", "CALIFORNIA", "GEORGIA", "OHIO"]
+
+
+def synthetic_columns(count, seed=0):
+    """StormEvents-like columns with NOAA's mix of event types, damage strings and dates"""
+    rng = random.Random(seed)
+    year_months = [f"{rng.randint(1996, 2024)}{rng.randint(1, 12):02d}" for _ in range(count)]
+    return {
+        "EVENT_ID": [str(1_000_000 + i) for i in range(count)],
+        "STATE": [rng.choice(STATES) for _ in range(count)],
+        "CZ_NAME": [f"COUNTY {rng.randint(1, 250)}" for _ in range(count)],
+        "EVENT_TYPE": [rng.choice(EVENT_TYPES) for _ in range(count)],
+        "BEGIN_YEARMONTH": year_months,
+        "BEGIN_DAY": [str(rng.randint(1, 28)) for _ in range(count)],
+        "BEGIN_DATE_TIME": [""] * count,
+        "DAMAGE_PROPERTY": [rng.choice(DAMAGES) for _ in range(count)],
+    }
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = "Compare per-row and columnar (chunked NumPy) normalization of StormEvents rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200_000)
+        parser.add_argument("--file", help="StormEvents_details CSV to read rows from instead of synthetic ones")
+        parser.add_argument("--chunk-size", type=int, default=storm_events.CHUNK_ROWS)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        if options["file"]:
+            chunks = storm_events.read_chunks(options["file"], options["rows"])
+            columns = next(chunks, None)
+            if columns is None:
+                raise CommandError(f"No rows in {options['file']}")
+        else:
+            columns = synthetic_columns(options["rows"])
+        count = len(next(iter(columns.values())))
+        rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        size = options["chunk_size"]
+        chunks = [
+            {name: values[start:start + size] for name, values in columns.items()}
+            for start in range(0, count, size)
+        ]
+
+        def per_row():
+            return [event for event in map(storm_events.normalize, rows) if event is not None]
+
+        def columnar():
+            return [storm_events.normalize_chunk(chunk) for chunk in chunks]
+
+        def columnar_rows():
+            return [event for chunk in columnar() for event in storm_events.iter_events(chunk)]
+
+        row_time, row_events = timed(per_row, options["repeat"])
+        chunk_time, _ = timed(columnar, options["repeat"])
+        chunk_rows_time, chunk_events = timed(columnar_rows, options["repeat"])
+        if row_events != chunk_events:
+            raise CommandError("Per-row and columnar normalization disagree")
+
+        self.stdout.write(f"{count} rows, {len(row_events)} claims, chunks of {size}")
+        self.stdout.write(f"per-row:             {count / row_time:>12,.0f} rows/s")
+        for label, seconds in [("columnar:", chunk_time), ("columnar, as dicts:", chunk_rows_time)]:
+            self.stdout.write(f"{label:<20} {count / seconds:>12,.0f} rows/s ({row_time / seconds:.1f}x)")
@@ -0,0 +1,42 @@
+# api/management/commands/export_detector.py
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Export the PyTorch detector to ONNX for the onnx backend, optionally INT8-quantized"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--weights", default=settings.DAMAGE_DETECTOR_WEIGHTS)
+        parser.add_argument("--output", default=settings.DAMAGE_DETECTOR_ONNX_PATH)
+        parser.add_argument("--imgsz", type=int, default=640)
+        parser.add_argument("--opset", type=int, default=None)
+        parser.add_argument("--quantize", action="store_true",
+                            help="Apply dynamic INT8 weight quantization after export")
+
+    def handle(self, *args, **options):
+        try:
+            from ultralytics import YOLO
+        except ImportError:
+            raise CommandError("ultralytics is required to export the detector")
+
+        # Dynamic axes let the micro-batcher send batches of any size
+        exported = YOLO(options["weights"]).export(
+            format="onnx", imgsz=options["imgsz"], dynamic=True, simplify=True,
+            opset=options["opset"]
+        )
+        output = Path(options["output"])
+
+        if options["quantize"]:
+            try:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+            except ImportError:
+                raise CommandError("onnxruntime is required for --quantize")
+            # Dynamic quantization keeps the model's metadata (class names)
+            quantize_dynamic(exported, output, weight_type=QuantType.QUInt8)
+        elif Path(exported).resolve() != output.resolve():
+            Path(exported).replace(output)
+
+        size_mb = output.stat().st_size / 1e6
+        self.stdout.write(self.style.SUCCESS(f"Exported {options['weights']} to {output} ({size_mb:.1f} MB)"))
@@ -0,0 +1,62 @@
+# api/management/commands/import_storm_events.py
+import os
+from django.core.management.base import BaseCommand, CommandError
+from api import dashboard, storm_events
+from api.models import Asset, InsuranceClaim
+
+
+class Command(BaseCommand):
+    help = "Import NOAA StormEvents details CSVs (.csv or .csv.gz, paths, globs, directories or URLs) as InsuranceClaims"
+
+    def add_arguments(self, parser):
+        parser.add_argument("sources", nargs="+",
+                            help="StormEvents_details files, globs, directories holding them, or http(s) URLs")
+        parser.add_argument("--workers", type=int, default=0,
+                            help="Processes parsing files in parallel (0: one per CPU, 1: stream in this process)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per bulk INSERT")
+        parser.add_argument("--chunk-size", type=int, default=20000, help="Rows per transaction")
+        parser.add_argument("--limit", type=int, default=0, help="Stop after this many claims (0: all)")
+
+    def report(self, writer):
+        self.stdout.write(f"{writer.written} claims written ({writer.rate:,.0f} rows/s)")
+
+    def chunks(self, sources, workers):
+        """Normalized chunks of every source, counting the rows read in self.read"""
+        if workers <= 1:
+            # One chunk at a time straight from the (decompressing) stream
+            for source in sources:
+                for columns in storm_events.read_chunks(source):
+                    self.read += len(next(iter(columns.values())))
+                    yield storm_events.normalize_chunk(columns)
+                self.stdout.write(f"Read {source}")
+            return
+        for source, read, chunks in storm_events.normalize_files(sources, workers):
+            self.read += read
+            claims = sum(len(chunk["event_id"]) for chunk in chunks)
+            self.stdout.write(f"Read {source}: {claims} of {read} rows are claims")
+            yield from chunks
+
+    def handle(self, *args, **options):
+        sources = storm_events.expand_sources(options["sources"])
+        if not sources:
+            raise CommandError("No StormEvents files found")
+        workers = min(options["workers"] or os.cpu_count() or 1, len(sources))
+
+        policy_ids = Asset.objects.order_by("asset_id").values_list("asset_id", flat=True)
+        self.read = imported = 0
+        with storm_events.ClaimWriter(policy_ids, options["batch_size"], options["chunk_size"],
+                                      progress=self.report) as writer:
+            for chunk in self.chunks(sources, workers):
+                if options["limit"]:
+                    chunk = {field: values[:options["limit"] - imported] for field, values in chunk.items()}
+                writer.add_chunk(chunk)
+                imported += len(chunk["event_id"])
+                if options["limit"] and imported >= options["limit"]:
+                    break
+
+        # bulk_create skips the signals that keep the dashboard current
+        dashboard.refresh([InsuranceClaim])
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {writer.written} claims from {self.read} rows of {len(sources)} files "
+            f"with {workers} workers at {writer.rate:,.0f} rows/s"
+        ))
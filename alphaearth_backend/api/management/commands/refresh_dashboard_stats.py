@@ -0,0 +1,11 @@
+# api/management/commands/refresh_dashboard_stats.py
+from django.core.management.base import BaseCommand
+from api import dashboard
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dashboard statistics snapshot (e.g. from cron after bulk imports)"
+
+    def handle(self, *args, **options):
+        stats = dashboard.refresh()
+        self.stdout.write(self.style.SUCCESS(f"Dashboard snapshot refreshed: {stats}"))
@@ -0,0 +1,24 @@
+# api/management/commands/run_damage_worker.py
+import time
+from django.core.management.base import BaseCommand
+from api.jobs import process_next_job
+
+
+class Command(BaseCommand):
+    help = "Process queued damage analysis jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+
+    def handle(self, *args, **options):
+        processed = 0
+        self.stdout.write("=== Damage analysis worker started ===")
+        while True:
+            if process_next_job():
+                processed += 1
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["poll_interval"])
+        self.stdout.write(f"Processed {processed} jobs")
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:09
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DamageAnalysisJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('Queued', 'Queued'), ('Running', 'Running'), ('Completed', 'Completed'), ('Failed', 'Failed')], default='Queued', max_length=20)),
+                ('progress', models.IntegerField(default=0, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('pre_image', models.ImageField(upload_to='jobs/pre/')),
+                ('post_image', models.ImageField(upload_to='jobs/post/')),
+                ('location_name', models.CharField(max_length=200)),
+                ('disaster_type', models.CharField(choices=[('Flood', 'Flood'), ('Wildfire', 'Wildfire'), ('Storm', 'Storm'), ('Earthquake', 'Earthquake'), ('Drought', 'Drought')], max_length=50)),
+                ('parameters', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('analysis', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='api.damageanalysis')),
+                ('claim', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='api.insuranceclaim')),
+            ],
+            options={
+                'verbose_name': 'Damage Analysis Job',
+                'verbose_name_plural': 'Damage Analysis Jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='api_damagea_status_3fa21d_idx')],
+            },
+        ),
+    ]
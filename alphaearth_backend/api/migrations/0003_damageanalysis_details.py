@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_damageanalysisjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='damageanalysis',
+            name='details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_damageanalysis_details'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_locations', models.IntegerField(default=0)),
+                ('active_claims', models.IntegerField(default=0)),
+                ('approved_claims', models.IntegerField(default=0)),
+                ('pending_claims', models.IntegerField(default=0)),
+                ('total_claim_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('active_triggers', models.IntegerField(default=0)),
+                ('high_risk_zones', models.IntegerField(default=0)),
+                ('medium_risk_zones', models.IntegerField(default=0)),
+                ('low_risk_zones', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Dashboard Snapshot',
+                'verbose_name_plural': 'Dashboard Snapshots',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_dashboardsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='riskzone',
+            index=models.Index(fields=['location_name', '-risk_score'], name='api_riskzon_locatio_6b282e_idx'),
+        ),
+    ]
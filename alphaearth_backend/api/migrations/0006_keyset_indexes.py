@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_riskzone_location_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['-insured_value_usd', '-id'], name='api_asset_insured_49c003_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insuranceclaim',
+            index=models.Index(fields=['-date_filed', '-id'], name='api_insuran_date_fi_77bb7c_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['location_name'], name='api_asset_locatio_f05fde_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['asset_type', '-insured_value_usd'], name='api_asset_asset_t_4bf5b7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(condition=models.Q(('active', True)), fields=['-insured_value_usd'], name='asset_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insuranceclaim',
+            index=models.Index(fields=['claim_status', '-date_filed'], name='api_insuran_claim_s_9c6808_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insuranceclaim',
+            index=models.Index(fields=['disaster_type', '-date_filed'], name='api_insuran_disaste_26838b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insuranceclaim',
+            index=models.Index(fields=['location_name', '-date_filed'], name='api_insuran_locatio_d27a12_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='insuranceclaim',
+            index=models.Index(condition=models.Q(('auto_approved', True)), fields=['-date_filed'], name='claim_auto_approved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parametrictrigger',
+            index=models.Index(fields=['-date_checked'], name='api_paramet_date_ch_094d71_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parametrictrigger',
+            index=models.Index(fields=['location_name', '-date_checked'], name='api_paramet_locatio_6cc47f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parametrictrigger',
+            index=models.Index(fields=['parameter', '-date_checked'], name='api_paramet_paramet_63d875_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='parametrictrigger',
+            index=models.Index(condition=models.Q(('triggered', True)), fields=['-date_checked'], name='trigger_triggered_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='riskzone',
+            index=models.Index(fields=['-risk_score'], name='api_riskzon_risk_sc_27a849_idx'),
+        ),
+    ]
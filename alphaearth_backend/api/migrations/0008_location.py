@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('key', models.CharField(max_length=200, unique=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Location',
+                'verbose_name_plural': 'Locations',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='asset',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assets', to='api.location'),
+        ),
+        migrations.AddField(
+            model_name='insuranceclaim',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claims', to='api.location'),
+        ),
+        migrations.AddField(
+            model_name='parametrictrigger',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='triggers', to='api.location'),
+        ),
+        migrations.AddField(
+            model_name='riskzone',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='risk_zones', to='api.location'),
+        ),
+        migrations.AddIndex(
+            model_name='riskzone',
+            index=models.Index(fields=['location', '-risk_score'], name='api_riskzon_locatio_f792b8_idx'),
+        ),
+    ]
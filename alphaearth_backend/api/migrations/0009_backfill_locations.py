@@ -0,0 +1,63 @@
+import re
+
+from django.db import migrations
+
+
+LOCATED_MODELS = ['RiskZone', 'InsuranceClaim', 'ParametricTrigger', 'Asset']
+
+
+def normalize(name):
+    # Same as Location.normalize at the time of writing
+    return ' '.join(re.sub(r'[^\w\s]', ' ', name.casefold()).split())
+
+
+def backfill_locations(apps, schema_editor):
+    Location = apps.get_model('api', 'Location')
+
+    # Risk zones go first so their coordinates seed the locations
+    coordinates = {}
+    for name, latitude, longitude in apps.get_model('api', 'RiskZone').objects.values_list(
+            'location_name', 'latitude', 'longitude'):
+        coordinates.setdefault(normalize(name), (name.strip(), latitude, longitude))
+
+    names = {}
+    for model_name in LOCATED_MODELS:
+        model = apps.get_model('api', model_name)
+        for name in model.objects.values_list('location_name', flat=True).distinct():
+            if name:
+                names.setdefault(normalize(name), set()).add(name)
+
+    existing = set(Location.objects.values_list('key', flat=True))
+    Location.objects.bulk_create(
+        Location(
+            key=key,
+            name=coordinates.get(key, (sorted(variants)[0].strip(),))[0],
+            latitude=coordinates.get(key, (None, None, None))[1],
+            longitude=coordinates.get(key, (None, None, None))[2],
+        )
+        for key, variants in names.items() if key not in existing
+    )
+    ids = dict(Location.objects.values_list('key', 'id'))
+
+    # One UPDATE per distinct spelling and table
+    for model_name in LOCATED_MODELS:
+        model = apps.get_model('api', model_name)
+        for key, variants in names.items():
+            model.objects.filter(location_name__in=variants).update(location_id=ids[key])
+
+
+def clear_locations(apps, schema_editor):
+    for model_name in LOCATED_MODELS:
+        apps.get_model('api', model_name).objects.update(location=None)
+    apps.get_model('api', 'Location').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_locations, clear_locations),
+    ]
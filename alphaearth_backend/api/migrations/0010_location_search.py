@@ -0,0 +1,66 @@
+import sqlite3
+
+from django.db import migrations
+
+
+# SQLite: an external-content FTS5 table over api_location.key with the
+# trigram tokenizer, so substring matches are index lookups, kept in step
+# with api_location by triggers (bulk_create included)
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE api_location_fts USING fts5(
+        key, content='api_location', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER api_location_fts_insert AFTER INSERT ON api_location BEGIN
+        INSERT INTO api_location_fts(rowid, key) VALUES (new.id, new.key);
+    END""",
+    """CREATE TRIGGER api_location_fts_delete AFTER DELETE ON api_location BEGIN
+        INSERT INTO api_location_fts(api_location_fts, rowid, key) VALUES ('delete', old.id, old.key);
+    END""",
+    """CREATE TRIGGER api_location_fts_update AFTER UPDATE OF key ON api_location BEGIN
+        INSERT INTO api_location_fts(api_location_fts, rowid, key) VALUES ('delete', old.id, old.key);
+        INSERT INTO api_location_fts(rowid, key) VALUES (new.id, new.key);
+    END""",
+    "INSERT INTO api_location_fts(api_location_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS api_location_fts_insert',
+    'DROP TRIGGER IF EXISTS api_location_fts_delete',
+    'DROP TRIGGER IF EXISTS api_location_fts_update',
+    'DROP TABLE IF EXISTS api_location_fts',
+]
+
+# PostgreSQL: a pg_trgm GIN index, used by both LIKE '%x%' and similarity
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS api_location_key_trgm ON api_location USING gin (key gin_trgm_ops)',
+]
+
+POSTGRESQL_REVERSE = [
+    'DROP INDEX IF EXISTS api_location_key_trgm',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == 'sqlite' and sqlite3.sqlite_version_info < (3, 34):
+            # No trigram tokenizer; searches fall back to LIKE
+            return
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_backfill_locations'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRESQL_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,80 @@
+from django.db import migrations
+
+
+INDEXED_TABLES = ['api_riskzone', 'api_location']
+
+
+def sqlite_forward(table):
+    # A point is a zero-sized box; api_location rows without coordinates
+    # stay out of the tree
+    rtree = f'{table}_rtree'
+    point = 'new.id, new.longitude, new.longitude, new.latitude, new.latitude'
+    located = 'new.latitude IS NOT NULL AND new.longitude IS NOT NULL'
+    return [
+        f'CREATE VIRTUAL TABLE {rtree} USING rtree(id, min_lon, max_lon, min_lat, max_lat)',
+        f"""CREATE TRIGGER {rtree}_insert AFTER INSERT ON {table} WHEN {located} BEGIN
+            INSERT INTO {rtree} VALUES ({point});
+        END""",
+        f"""CREATE TRIGGER {rtree}_update AFTER UPDATE OF latitude, longitude ON {table} BEGIN
+            DELETE FROM {rtree} WHERE id = old.id;
+            INSERT INTO {rtree} SELECT {point} WHERE {located};
+        END""",
+        f"""CREATE TRIGGER {rtree}_delete AFTER DELETE ON {table} BEGIN
+            DELETE FROM {rtree} WHERE id = old.id;
+        END""",
+        f"""INSERT INTO {rtree}
+            SELECT id, longitude, longitude, latitude, latitude FROM {table}
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL""",
+    ]
+
+
+def sqlite_reverse(table):
+    rtree = f'{table}_rtree'
+    return [
+        f'DROP TRIGGER IF EXISTS {rtree}_insert',
+        f'DROP TRIGGER IF EXISTS {rtree}_update',
+        f'DROP TRIGGER IF EXISTS {rtree}_delete',
+        f'DROP TABLE IF EXISTS {rtree}',
+    ]
+
+
+def postgresql_forward(table):
+    return [
+        f'CREATE INDEX IF NOT EXISTS {table}_point_gist ON {table} USING gist (point(longitude, latitude))',
+    ]
+
+
+def postgresql_reverse(table):
+    return [f'DROP INDEX IF EXISTS {table}_point_gist']
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT sqlite_compileoption_used('ENABLE_RTREE')")
+                if not cursor.fetchone()[0]:
+                    # No R-tree module; spatial filters fall back to range filters
+                    return
+        build = statements.get(connection.vendor)
+        if build is None:
+            return
+        for table in INDEXED_TABLES:
+            for statement in build(table):
+                schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_location_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': sqlite_forward, 'postgresql': postgresql_forward}),
+            run({'sqlite': sqlite_reverse, 'postgresql': postgresql_reverse}),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_spatial_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='damageanalysisjob',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='damageanalysisjob',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,173 @@
+"""
+Lazy registry for the damage-analysis detectors.
+
+``DAMAGE_DETECTOR_BACKEND`` picks the backend: 'torch' runs the
+ultralytics weights in ``DAMAGE_DETECTOR_WEIGHTS``, 'onnx' runs the
+exported model in ``DAMAGE_DETECTOR_ONNX_PATH`` with ONNX Runtime on CPU
+(see ``api/detectors.py``).
+
+Detector weights are loaded on first use instead of at import time, so
+``manage.py`` commands and requests that never touch damage analysis don't
+pay for them. Call ``prewarm()`` before the server forks its workers (see
+``wsgi.py``) to load the weights once in the parent and share them
+copy-on-write with every child.
+"""
+import gc
+import os
+import resource
+import threading
+import time
+
+from django.conf import settings
+
+
+_lock = threading.Lock()
+_models = {}
+_metrics = {}
+_device = None
+
+
+def _rss_bytes():
+    """Current resident set size of this process, in bytes"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_device():
+    """Torch device used by the torch backend ('cuda' when available, else 'cpu')"""
+    global _device
+    if _device is None:
+        import torch
+        _device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    return _device
+
+
+def limit_threads(backend):
+    """
+    Cap the threads torch and OpenCV use per call (``DAMAGE_TORCH_THREADS``,
+    ``DAMAGE_OPENCV_THREADS``; 0 keeps the library default), so the
+    inference workers of several processes don't oversubscribe the CPU.
+    """
+    if settings.DAMAGE_OPENCV_THREADS:
+        import cv2
+        cv2.setNumThreads(settings.DAMAGE_OPENCV_THREADS)
+    if settings.DAMAGE_TORCH_THREADS and backend == 'torch':
+        import torch
+        torch.set_num_threads(settings.DAMAGE_TORCH_THREADS)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Only allowed before torch has started any parallel work
+            pass
+
+
+def _backend():
+    return settings.DAMAGE_DETECTOR_BACKEND
+
+
+def _weights_for(backend):
+    if backend == 'onnx':
+        return settings.DAMAGE_DETECTOR_ONNX_PATH
+    return settings.DAMAGE_DETECTOR_WEIGHTS
+
+
+def _load(backend, weights):
+    from .detectors import OnnxDetector, TorchDetector
+
+    limit_threads(backend)
+    rss_before = _rss_bytes()
+    started = time.perf_counter()
+    if backend == 'onnx':
+        detector = OnnxDetector(
+            weights,
+            intra_op_threads=settings.DAMAGE_ONNX_INTRA_OP_THREADS,
+            inter_op_threads=settings.DAMAGE_ONNX_INTER_OP_THREADS,
+        )
+        device = 'cpu'
+    elif backend == 'torch':
+        device = get_device()
+        detector = TorchDetector(weights, device)
+    else:
+        raise ValueError(f"Unknown detector backend {backend!r}")
+    _metrics[(backend, weights)] = {
+        'backend': backend,
+        'weights': weights,
+        'device': device,
+        'load_seconds': round(time.perf_counter() - started, 3),
+        'rss_delta_bytes': max(_rss_bytes() - rss_before, 0),
+        'loaded_at': time.time(),
+        'pid': os.getpid(),
+    }
+    return detector
+
+
+def get_detector(backend=None, weights=None):
+    """
+    Return the detector for ``backend`` ('torch' or 'onnx', default
+    ``DAMAGE_DETECTOR_BACKEND``) and ``weights``, loading it on first use
+    """
+    backend = backend or _backend()
+    weights = weights or _weights_for(backend)
+    key = (backend, weights)
+    detector = _models.get(key)
+    if detector is None:
+        with _lock:
+            detector = _models.get(key)
+            if detector is None:
+                detector = _models[key] = _load(backend, weights)
+    return detector
+
+
+def model_version(backend=None, weights=None):
+    """
+    Identifier for the detector's backend and weights, used to key cached
+    detections. Includes the file's size and mtime when the weights exist
+    locally, so replacing the file invalidates old results.
+    """
+    backend = backend or _backend()
+    weights = weights or _weights_for(backend)
+    try:
+        stat = os.stat(weights)
+    except OSError:
+        return f"{backend}:{weights}"
+    return f"{backend}:{weights}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def is_loaded(backend=None, weights=None):
+    backend = backend or _backend()
+    return (backend, weights or _weights_for(backend)) in _models
+
+
+def prewarm(backend=None):
+    """
+    Load the configured detector up front, e.g. in the parent process
+    before forking.
+
+    Objects that exist at this point are moved to the permanent GC
+    generation so the collector never writes to their pages in the
+    children, keeping the weights shared copy-on-write.
+    """
+    get_detector(backend)
+    gc.freeze()
+
+
+def unload(backend=None, weights=None):
+    """Drop a loaded detector (mostly useful in tests)"""
+    backend = backend or _backend()
+    key = (backend, weights or _weights_for(backend))
+    with _lock:
+        _models.pop(key, None)
+        _metrics.pop(key, None)
+
+
+def metrics():
+    """Load time and memory cost of every detector loaded in this process"""
+    return {
+        'pid': os.getpid(),
+        'rss_bytes': _rss_bytes(),
+        'models': list(_metrics.values()),
+    }
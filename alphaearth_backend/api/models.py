@@ -1,10 +1,74 @@
+import re
+
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
+class Location(models.Model):
+    """A place shared by risk zones, claims, triggers and assets"""
+    name = models.CharField(max_length=200)
+    key = models.CharField(max_length=200, unique=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Location'
+        verbose_name_plural = 'Locations'
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def normalize(name):
+        """Case-, punctuation- and whitespace-insensitive key for a location name"""
+        return ' '.join(re.sub(r'[^\w\s]', ' ', name.casefold()).split())
+
+    @classmethod
+    def resolve(cls, name, latitude=None, longitude=None):
+        """The Location for ``name``, created on first use"""
+        location, created = cls.objects.get_or_create(
+            key=cls.normalize(name),
+            defaults={'name': name.strip(), 'latitude': latitude, 'longitude': longitude},
+        )
+        if not created and location.latitude is None and latitude is not None:
+            location.latitude, location.longitude = latitude, longitude
+            location.save(update_fields=['latitude', 'longitude'])
+        return location
+
+    @classmethod
+    def assign(cls, objs):
+        """
+        Set ``location`` on many unsaved objects from their ``location_name``
+        in a couple of queries. ``bulk_create`` skips the pre_save signal
+        that does this for single saves, so call this first.
+        """
+        names = {}
+        for obj in objs:
+            if obj.location_name:
+                names.setdefault(cls.normalize(obj.location_name), obj)
+        locations = {location.key: location for location in cls.objects.filter(key__in=names)}
+        missing = [
+            cls(key=key, name=obj.location_name.strip(),
+                latitude=getattr(obj, 'latitude', None), longitude=getattr(obj, 'longitude', None))
+            for key, obj in names.items() if key not in locations
+        ]
+        if missing:
+            cls.objects.bulk_create(missing, ignore_conflicts=True)
+            locations.update(
+                (location.key, location)
+                for location in cls.objects.filter(key__in=[location.key for location in missing])
+            )
+        for obj in objs:
+            obj.location = locations[cls.normalize(obj.location_name)] if obj.location_name else None
+        return objs
+
+
 class RiskZone(models.Model):
     """Risk assessment for geographical locations"""
     location_name = models.CharField(max_length=200)
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='risk_zones')
     latitude = models.FloatField()
     longitude = models.FloatField()
     flood_risk = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(1.0)])
@@ -20,6 +84,12 @@ class RiskZone(models.Model):
 
     class Meta:
         ordering = ['-risk_score']
+        indexes = [
+            models.Index(fields=['-risk_score']),
+            models.Index(fields=['location_name', '-risk_score']),
+            # Serves the per-location risk score lookup in AssetViewSet
+            models.Index(fields=['location', '-risk_score']),
+        ]
         verbose_name = 'Risk Zone'
         verbose_name_plural = 'Risk Zones'
 
@@ -48,6 +118,7 @@ class InsuranceClaim(models.Model):
     claim_id = models.CharField(max_length=50, unique=True)
     policy_id = models.CharField(max_length=50)
     location_name = models.CharField(max_length=200)
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='claims')
     disaster_type = models.CharField(max_length=50, choices=DISASTER_TYPES)
     pre_image = models.ImageField(upload_to='claims/pre/', null=True, blank=True)
     post_image = models.ImageField(upload_to='claims/post/', null=True, blank=True)
@@ -63,6 +134,16 @@ class InsuranceClaim(models.Model):
 
     class Meta:
         ordering = ['-date_filed']
+        # Filters keep the default order so filtered pages read in index order
+        indexes = [
+            # Keyset pagination walks (date_filed, id)
+            models.Index(fields=['-date_filed', '-id']),
+            models.Index(fields=['claim_status', '-date_filed']),
+            models.Index(fields=['disaster_type', '-date_filed']),
+            models.Index(fields=['location_name', '-date_filed']),
+            models.Index(fields=['-date_filed'], condition=models.Q(auto_approved=True),
+                         name='claim_auto_approved_idx'),
+        ]
         verbose_name = 'Insurance Claim'
         verbose_name_plural = 'Insurance Claims'
 
@@ -79,12 +160,20 @@ class ParametricTrigger(models.Model):
     current_value = models.FloatField()
     triggered = models.BooleanField(default=False)
     location_name = models.CharField(max_length=200)
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='triggers')
     date_checked = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-date_checked']
+        indexes = [
+            models.Index(fields=['-date_checked']),
+            models.Index(fields=['location_name', '-date_checked']),
+            models.Index(fields=['parameter', '-date_checked']),
+            models.Index(fields=['-date_checked'], condition=models.Q(triggered=True),
+                         name='trigger_triggered_idx'),
+        ]
         verbose_name = 'Parametric Trigger'
         verbose_name_plural = 'Parametric Triggers'
 
@@ -112,6 +201,7 @@ class Asset(models.Model):
     owner = models.CharField(max_length=200)
     asset_type = models.CharField(max_length=100, choices=ASSET_TYPES)
     location_name = models.CharField(max_length=200)
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True, related_name='assets')
     insured_value_usd = models.DecimalField(max_digits=12, decimal_places=2)
     policy_start_date = models.DateField()
     policy_end_date = models.DateField()
@@ -121,6 +211,14 @@ class Asset(models.Model):
 
     class Meta:
         ordering = ['-insured_value_usd']
+        indexes = [
+            # Keyset pagination walks (insured_value_usd, id)
+            models.Index(fields=['-insured_value_usd', '-id']),
+            models.Index(fields=['location_name']),
+            models.Index(fields=['asset_type', '-insured_value_usd']),
+            models.Index(fields=['-insured_value_usd'], condition=models.Q(active=True),
+                         name='asset_active_idx'),
+        ]
         verbose_name = 'Asset'
         verbose_name_plural = 'Assets'
 
@@ -158,6 +256,7 @@ class DamageAnalysis(models.Model):
     confidence_score = models.FloatField(validators=[MinValueValidator(0.0), MaxValueValidator(1.0)])
     ai_model_used = models.CharField(max_length=200)
     notes = models.TextField(blank=True)
+    details = models.JSONField(default=dict, blank=True)
 
     class Meta:
         ordering = ['-analysis_date']
@@ -166,3 +265,77 @@ class DamageAnalysis(models.Model):
 
     def __str__(self):
         return f"Analysis for {self.claim.claim_id} - {self.damage_percentage}%"
+
+
+class DamageAnalysisJob(models.Model):
+    """Queued damage analysis processed by the background worker pool"""
+
+    STATUS_CHOICES = [
+        ('Queued', 'Queued'),
+        ('Running', 'Running'),
+        ('Completed', 'Completed'),
+        ('Failed', 'Failed'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Queued')
+    progress = models.IntegerField(default=0, validators=[MinValueValidator(0), MaxValueValidator(100)])
+    pre_image = models.ImageField(upload_to='jobs/pre/')
+    post_image = models.ImageField(upload_to='jobs/post/')
+    location_name = models.CharField(max_length=200)
+    disaster_type = models.CharField(max_length=50, choices=InsuranceClaim.DISASTER_TYPES)
+    parameters = models.JSONField(default=dict, blank=True)
+    claim = models.ForeignKey(InsuranceClaim, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    analysis = models.ForeignKey(DamageAnalysis, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField(default=0)
+    # A Running job whose lease runs out is assumed abandoned and requeued
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        verbose_name = 'Damage Analysis Job'
+        verbose_name_plural = 'Damage Analysis Jobs'
+
+    def __str__(self):
+        return f"Job {self.pk} - {self.status} ({self.progress}%)"
+
+
+class DashboardSnapshot(models.Model):
+    """Materialized dashboard statistics, kept up to date by api.signals"""
+    total_locations = models.IntegerField(default=0)
+    active_claims = models.IntegerField(default=0)
+    approved_claims = models.IntegerField(default=0)
+    pending_claims = models.IntegerField(default=0)
+    total_claim_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    active_triggers = models.IntegerField(default=0)
+    high_risk_zones = models.IntegerField(default=0)
+    medium_risk_zones = models.IntegerField(default=0)
+    low_risk_zones = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Dashboard Snapshot'
+        verbose_name_plural = 'Dashboard Snapshots'
+
+    def __str__(self):
+        return f"Dashboard snapshot ({self.updated_at})"
+
+
+class CacheVersion(models.Model):
+    """
+    Version counter for a family of cache keys, kept in the database so
+    bumping it reaches every process whatever the cache backend
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Cache Version'
+        verbose_name_plural = 'Cache Versions'
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,160 @@
+"""
+Pagination for the large, ordered tables.
+
+``PageOrKeysetPagination`` keeps the default page-number behaviour and
+adds a keyset mode, selected with ``?pagination=cursor`` (or any request
+carrying a ``cursor``). Keyset pages filter on the view's
+``keyset_ordering`` field plus ``id`` -- e.g. ``date_filed < d OR
+(date_filed = d AND id < i)`` -- against a matching composite index, so
+every page costs O(page size) however deep it is, and no ``COUNT(*)``
+runs unless asked for with ``?count=exact`` or ``?count=approx``.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Approximate row count of ``queryset``: the planner's estimate on
+    PostgreSQL, an exact ``COUNT(*)`` on other databases
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering, page_size=None):
+        self.descending = ordering.startswith('-')
+        self.field = ordering.lstrip('-')
+        if page_size:
+            self.page_size = page_size
+
+    def encode_cursor(self, row, reverse=False):
+        position = {'v': getattr(row, self.field), 'id': row.pk, 'r': reverse}
+        data = json.dumps(position, cls=DjangoJSONEncoder).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            value = model._meta.get_field(self.field).to_python(position['v'])
+            return value, int(position['id']), bool(position.get('r'))
+        except (TypeError, ValueError, KeyError, AttributeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = cursor is not None and cursor[2]
+
+        self.count = None
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode == 'exact':
+            self.count = queryset.count()
+        elif count_mode == 'approx':
+            self.count = estimate_count(queryset)
+
+        # Walking backwards flips the direction of both the order and the
+        # comparison; the page is put back in display order below
+        descending = self.descending != reverse
+        sign = '-' if descending else ''
+        queryset = queryset.order_by(f'{sign}{self.field}', f'{sign}pk')
+        if cursor is not None:
+            value, pk, _ = cursor
+            op = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{op}': value}) | Q(**{self.field: value, f'pk__{op}': pk})
+            )
+
+        fields, defer = queryset.query.deferred_loading
+        if fields and not defer:
+            # Projected with .only(); the cursor still needs the key
+            queryset = queryset.only(*fields, self.field)
+
+        rows = list(queryset[:page_size + 1])
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+        self.has_next = more if not reverse else True
+        self.has_previous = more if reverse else cursor is not None
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   self.encode_cursor(self.page[0], reverse=True))
+
+    def get_paginated_response(self, data):
+        fields = [('next', self.get_next_link()), ('previous', self.get_previous_link())]
+        if self.count is not None:
+            fields.insert(0, ('count', self.count))
+        return Response(OrderedDict(fields + [('results', data)]))
+
+
+class PageOrKeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination by default; keyset pagination over the view's
+    ``keyset_ordering`` with ``?pagination=cursor``
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'keyset_ordering', None)
+        self.keyset = None
+        if ordering and (request.query_params.get('pagination') == 'cursor'
+                         or KeysetPagination.cursor_query_param in request.query_params):
+            self.keyset = KeysetPagination(ordering, page_size=self.page_size)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,15 +1,120 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.fields import SkipField, empty
+from rest_framework.settings import api_settings
+from . import imaging
 from .models import (
-    RiskZone, InsuranceClaim, ParametricTrigger, 
-    Asset, AIModelInsight, DamageAnalysis
+    Location, RiskZone, InsuranceClaim, ParametricTrigger, 
+    Asset, AIModelInsight, DamageAnalysis, DamageAnalysisJob
 )
 
 
-class RiskZoneSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """
+    Lets GET requests trim the representation to the fields named in
+    ``?fields=a,b``; unknown names are ignored.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = requested_fields(self.context.get('request'))
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+
+def requested_fields(request):
+    """Field names asked for with ``?fields=`` on a GET request, or None"""
+    if request is None or request.method != 'GET':
+        return None
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    ``many=True`` serializer of the ``/bulk/`` actions. Each row is
+    validated on its own, field by field (the child's serializer-level
+    validation is skipped): the valid ones are kept and the others' errors
+    collected in ``row_errors`` as ``(position, errors)``. Saving upserts
+    the valid rows on the child's ``Meta.bulk_key`` with one
+    ``INSERT ... ON CONFLICT DO UPDATE`` per set of fields the rows give:
+    fields a row leaves out keep their value if the key exists.
+    """
+
+    def to_internal_value(self, data):
+        fields = [(field.field_name, field) for field in self.child._writable_fields]
+        invalid = self.child.error_messages['invalid']
+        self.row_errors = []
+        rows = []
+        for position, item in enumerate(data):
+            if not isinstance(item, dict):
+                message = invalid.format(datatype=type(item).__name__)
+                self.row_errors.append((position, {api_settings.NON_FIELD_ERRORS_KEY: [message]}))
+                continue
+            row, errors = {}, {}
+            for name, field in fields:
+                try:
+                    row[name] = field.run_validation(item.get(name, empty))
+                except serializers.ValidationError as exc:
+                    errors[name] = exc.detail
+                except SkipField:
+                    pass
+            if errors:
+                self.row_errors.append((position, errors))
+            else:
+                rows.append(row)
+        return rows
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        key = self.child.Meta.bulk_key
+        # Later rows for a key win, as they would posted one by one
+        rows = {row[key]: row for row in validated_data}
+
+        upserts = {}
+        for row in rows.values():
+            obj = model(**row)
+            fields = self.child.prepare_bulk(obj) or []
+            fields = tuple(sorted({*row, *fields, 'location', 'updated_at'} - {key}))
+            upserts.setdefault(fields, []).append(obj)
+
+        objs = [obj for group in upserts.values() for obj in group]
+        Location.assign(objs)
+        for fields, group in upserts.items():
+            model.objects.bulk_create(group, update_conflicts=True, unique_fields=[key],
+                                      update_fields=fields)
+        return objs
+
+
+class BulkSerializerMixin:
+    """Child serializer of a ``BulkListSerializer``"""
+
+    def prepare_bulk(self, obj):
+        """
+        Adjust a row about to be bulk written the way ``save()`` or
+        ``create()`` would have. Values it sets are inserted for new keys;
+        it returns the fields among them to overwrite on existing ones too.
+        """
+        return []
+
+
+class LocationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Location
+        fields = ['id', 'name', 'latitude', 'longitude']
+        read_only_fields = fields
+
+
+class RiskZoneSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    location = LocationSerializer(read_only=True)
+
     class Meta:
         model = RiskZone
         fields = [
-            'id', 'location_name', 'latitude', 'longitude',
+            'id', 'location_name', 'location', 'latitude', 'longitude',
             'flood_risk', 'wildfire_risk', 'storm_risk',
             'vegetation_dryness', 'avg_temp_c', 'sea_level_rise_m',
             'historical_events', 'risk_score', 'created_at', 'updated_at'
@@ -22,18 +127,20 @@ class DamageAnalysisSerializer(serializers.ModelSerializer):
         model = DamageAnalysis
         fields = [
             'id', 'claim', 'analysis_date', 'damage_percentage',
-            'affected_area_sqm', 'confidence_score', 'ai_model_used', 'notes'
+            'affected_area_sqm', 'confidence_score', 'ai_model_used', 'notes',
+            'details'
         ]
         read_only_fields = ['analysis_date']
 
 
-class InsuranceClaimSerializer(serializers.ModelSerializer):
+class InsuranceClaimSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    location = LocationSerializer(read_only=True)
     analyses = DamageAnalysisSerializer(many=True, read_only=True)
     
     class Meta:
         model = InsuranceClaim
         fields = [
-            'id', 'claim_id', 'policy_id', 'location_name',
+            'id', 'claim_id', 'policy_id', 'location_name', 'location',
             'disaster_type', 'pre_image', 'post_image',
             'pre_image_url', 'post_image_url', 'damage_score',
             'claim_amount_usd', 'claim_status', 'auto_approved',
@@ -42,6 +149,19 @@ class InsuranceClaimSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
 
+class InsuranceClaimSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Compact claim for list tables (?view=summary), without analyses or images"""
+
+    class Meta:
+        model = InsuranceClaim
+        fields = [
+            'id', 'claim_id', 'policy_id', 'location_name',
+            'disaster_type', 'damage_score', 'claim_amount_usd',
+            'claim_status', 'auto_approved', 'date_filed'
+        ]
+        read_only_fields = fields
+
+
 class InsuranceClaimCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating new claims with image upload"""
     
@@ -63,37 +183,101 @@ class InsuranceClaimCreateSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class ParametricTriggerSerializer(serializers.ModelSerializer):
+class InsuranceClaimBulkSerializer(BulkSerializerMixin, serializers.ModelSerializer):
+    """Claim rows of ``POST /api/claims/bulk/``, upserted on ``claim_id``"""
+
+    class Meta:
+        model = InsuranceClaim
+        list_serializer_class = BulkListSerializer
+        bulk_key = 'claim_id'
+        fields = [
+            'claim_id', 'policy_id', 'location_name', 'disaster_type',
+            'pre_image_url', 'post_image_url', 'damage_score',
+            'claim_amount_usd', 'claim_status', 'auto_approved', 'date_filed'
+        ]
+        # Existing claim_ids are updated, not rejected (and not looked up one by one)
+        extra_kwargs = {'claim_id': {'validators': []}}
+
+    def prepare_bulk(self, obj):
+        # Same auto-approval as InsuranceClaimCreateSerializer.create; it
+        # reaches existing claims only through the fields the row gives
+        if obj.damage_score >= 0.7:
+            obj.auto_approved = True
+            obj.claim_status = 'Approved'
+        return []
+
+
+class ParametricTriggerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    location = LocationSerializer(read_only=True)
+
     class Meta:
         model = ParametricTrigger
         fields = [
             'id', 'trigger_id', 'parameter', 'threshold',
-            'current_value', 'triggered', 'location_name',
+            'current_value', 'triggered', 'location_name', 'location',
             'date_checked', 'created_at', 'updated_at'
         ]
         read_only_fields = ['triggered', 'created_at', 'updated_at']
 
 
-class AssetSerializer(serializers.ModelSerializer):
+class ParametricTriggerBulkSerializer(BulkSerializerMixin, serializers.ModelSerializer):
+    """Trigger rows of ``POST /api/triggers/bulk/``, upserted on ``trigger_id``"""
+
+    class Meta:
+        model = ParametricTrigger
+        list_serializer_class = BulkListSerializer
+        bulk_key = 'trigger_id'
+        fields = [
+            'trigger_id', 'parameter', 'threshold', 'current_value',
+            'location_name', 'date_checked'
+        ]
+        extra_kwargs = {'trigger_id': {'validators': []}}
+
+    def prepare_bulk(self, obj):
+        # What ParametricTrigger.save() does
+        obj.triggered = obj.current_value >= obj.threshold
+        return ['triggered']
+
+
+class AssetSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    location = LocationSerializer(read_only=True)
     risk_score = serializers.SerializerMethodField()
     
     class Meta:
         model = Asset
         fields = [
             'id', 'asset_id', 'owner', 'asset_type',
-            'location_name', 'insured_value_usd',
+            'location_name', 'location', 'insured_value_usd',
             'policy_start_date', 'policy_end_date',
             'active', 'risk_score', 'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
     
     def get_risk_score(self, obj):
-        """Get risk score for the asset's location"""
-        try:
-            risk_zone = RiskZone.objects.filter(location_name=obj.location_name).first()
-            return risk_zone.risk_score if risk_zone else None
-        except:
+        """
+        Get risk score for the asset's location. List views annotate it as
+        ``zone_risk_score`` (see ``AssetViewSet``); single objects look it up.
+        """
+        if hasattr(obj, 'zone_risk_score'):
+            return obj.zone_risk_score
+        if obj.location_id is None:
             return None
+        risk_zone = RiskZone.objects.filter(location_id=obj.location_id).first()
+        return risk_zone.risk_score if risk_zone else None
+
+
+class AssetBulkSerializer(BulkSerializerMixin, serializers.ModelSerializer):
+    """Asset rows of ``POST /api/assets/bulk/``, upserted on ``asset_id``"""
+
+    class Meta:
+        model = Asset
+        list_serializer_class = BulkListSerializer
+        bulk_key = 'asset_id'
+        fields = [
+            'asset_id', 'owner', 'asset_type', 'location_name',
+            'insured_value_usd', 'policy_start_date', 'policy_end_date', 'active'
+        ]
+        extra_kwargs = {'asset_id': {'validators': []}}
 
 
 class AIModelInsightSerializer(serializers.ModelSerializer):
@@ -119,12 +303,79 @@ class DashboardStatsSerializer(serializers.Serializer):
     low_risk_zones = serializers.IntegerField()
 
 
+class SceneImageField(serializers.FileField):
+    """
+    Image upload for damage analysis. Unlike ImageField, which has Pillow
+    load the whole image (and refuses anything over its ~179M pixel bomb
+    limit), only the header is checked: the format must be one the
+    pipeline reads (GeoTIFFs included) and the size at most
+    ``DAMAGE_SCENE_MAX_PIXELS``.
+    """
+    default_error_messages = {
+        'invalid_image': 'Upload a valid image. The file you uploaded was either not an image or a corrupted image.',
+        'unsupported_format': 'Unsupported image format {format}.',
+        'too_large': 'Image has {pixels} pixels; at most {max_pixels} can be analysed.',
+    }
+
+    def to_internal_value(self, data):
+        file = super().to_internal_value(data)
+        try:
+            image_format, _ = imaging.read_header(file, settings.DAMAGE_SCENE_MAX_PIXELS)
+        except imaging.ImageTooLarge as exc:
+            self.fail('too_large', pixels=exc.pixels, max_pixels=exc.max_pixels)
+        except ValueError:
+            self.fail('invalid_image')
+        if image_format not in imaging.SCENE_FORMATS:
+            self.fail('unsupported_format', format=image_format)
+        return file
+
+
 class ImageUploadSerializer(serializers.Serializer):
     """Serializer for image upload and damage analysis"""
-    pre_image = serializers.ImageField(required=True)
-    post_image = serializers.ImageField(required=True)
+    pre_image = SceneImageField(required=True)
+    post_image = SceneImageField(required=True)
     location_name = serializers.CharField(max_length=200, required=True)
     disaster_type = serializers.ChoiceField(
         choices=InsuranceClaim.DISASTER_TYPES,
         required=True
     )
+
+
+class BatchImageUploadSerializer(serializers.Serializer):
+    """Serializer for analysing several claims in one request, paired by index"""
+    pre_images = serializers.ListField(child=SceneImageField(), allow_empty=False)
+    post_images = serializers.ListField(child=SceneImageField(), allow_empty=False)
+    location_names = serializers.ListField(
+        child=serializers.CharField(max_length=200), allow_empty=False
+    )
+    disaster_types = serializers.ListField(
+        child=serializers.ChoiceField(choices=InsuranceClaim.DISASTER_TYPES),
+        allow_empty=False
+    )
+
+    def validate(self, attrs):
+        count = len(attrs['pre_images'])
+        if any(len(attrs[name]) != count for name in ('post_images', 'location_names', 'disaster_types')):
+            raise serializers.ValidationError(
+                'pre_images, post_images, location_names and disaster_types must have the same length'
+            )
+        if count > settings.DAMAGE_BATCH_MAX_CLAIMS:
+            raise serializers.ValidationError(
+                f'At most {settings.DAMAGE_BATCH_MAX_CLAIMS} claims can be analysed per request'
+            )
+        return attrs
+
+
+class DamageAnalysisJobSerializer(serializers.ModelSerializer):
+    """Serializer for polling asynchronous damage analysis jobs"""
+    claim = InsuranceClaimSerializer(read_only=True)
+    analysis = DamageAnalysisSerializer(read_only=True)
+
+    class Meta:
+        model = DamageAnalysisJob
+        fields = [
+            'id', 'status', 'progress', 'location_name', 'disaster_type',
+            'claim', 'analysis', 'error', 'created_at', 'started_at',
+            'finished_at'
+        ]
+        read_only_fields = fields
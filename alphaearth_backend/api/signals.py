@@ -0,0 +1,61 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import clusters, dashboard
+from .models import Asset, InsuranceClaim, Location, ParametricTrigger, RiskZone
+
+
+@receiver(pre_save, sender=RiskZone)
+@receiver(pre_save, sender=InsuranceClaim)
+@receiver(pre_save, sender=ParametricTrigger)
+def remember_dashboard_contribution(sender, instance, **kwargs):
+    """What the row counted for in the dashboard before this save"""
+    instance._dashboard_before = dashboard.stored_contribution(sender, instance.pk)
+
+
+@receiver(post_save, sender=RiskZone)
+@receiver(post_save, sender=InsuranceClaim)
+@receiver(post_save, sender=ParametricTrigger)
+def update_dashboard_snapshot(sender, instance, **kwargs):
+    after = dashboard.instance_contribution(instance)
+    if after is None:
+        dashboard.mark_changed(sender)
+        return
+    dashboard.row_changed(sender, getattr(instance, '_dashboard_before', None), after)
+
+
+@receiver(post_delete, sender=RiskZone)
+@receiver(post_delete, sender=InsuranceClaim)
+@receiver(post_delete, sender=ParametricTrigger)
+def remove_from_dashboard_snapshot(sender, instance, **kwargs):
+    before = dashboard.instance_contribution(instance)
+    if before is None:
+        dashboard.mark_changed(sender)
+        return
+    dashboard.row_changed(sender, before, None)
+
+
+@receiver([post_save, post_delete], sender=Asset)
+@receiver([post_save, post_delete], sender=RiskZone)
+@receiver([post_save, post_delete], sender=Location)
+def clear_asset_clusters(sender, **kwargs):
+    clusters.mark_changed()
+
+
+@receiver(pre_save, sender=RiskZone)
+@receiver(pre_save, sender=InsuranceClaim)
+@receiver(pre_save, sender=ParametricTrigger)
+@receiver(pre_save, sender=Asset)
+def link_location(sender, instance, **kwargs):
+    """Point ``location`` at the Location matching ``location_name``"""
+    if not instance.location_name:
+        instance.location = None
+        return
+    key = Location.normalize(instance.location_name)
+    cached = sender._meta.get_field('location').get_cached_value(instance, None)
+    if cached is not None and cached.key == key:
+        return
+    instance.location = Location.resolve(
+        instance.location_name,
+        getattr(instance, 'latitude', None), getattr(instance, 'longitude', None),
+    )
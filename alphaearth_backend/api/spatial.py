@@ -0,0 +1,171 @@
+"""
+Viewport and radius filters for the map endpoints.
+
+``filter_queryset`` narrows a queryset of located rows with either
+
+- ``?bbox=west,south,east,north`` in degrees. A box whose west edge is
+  greater than its east edge crosses the antimeridian and is split in two.
+- ``?near=lat,lon&radius_km=r``. The circle's bounding box (split the same
+  way, or spanning every longitude when it reaches a pole) goes through
+  the index, and the great-circle distance refines the result.
+
+The bounding boxes are looked up through a spatial index on the row
+coordinates rather than scanning the table: an R-tree table kept in step
+by triggers on SQLite, a GiST index on ``point(longitude, latitude)`` on
+PostgreSQL (both created by ``0011_spatial_index``). Other databases get
+the plain coordinate range filters.
+"""
+import math
+
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+from rest_framework.exceptions import ValidationError
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+# SQLite R-tree tables by the table they index
+RTREE_TABLES = {
+    'api_riskzone': 'api_riskzone_rtree',
+    'api_location': 'api_location_rtree',
+}
+
+_tables = {}
+
+
+def _floats(value, count, param):
+    try:
+        numbers = [float(part) for part in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or not all(math.isfinite(number) for number in numbers):
+        raise ValidationError({param: f'Expected {count} comma-separated numbers'})
+    return numbers
+
+
+def split_antimeridian(west, south, east, north):
+    """``(west, south, east, north)`` boxes covering the area, none crossing the antimeridian"""
+    if west <= east:
+        return [(west, south, east, north)]
+    return [(west, south, 180.0, north), (-180.0, south, east, north)]
+
+
+def parse_bbox(value):
+    """Boxes for a ``west,south,east,north`` parameter"""
+    west, south, east, north = _floats(value, 4, 'bbox')
+    if not (-180 <= west <= 180 and -180 <= east <= 180):
+        raise ValidationError({'bbox': 'Longitudes must be between -180 and 180'})
+    if not -90 <= south <= north <= 90:
+        raise ValidationError({'bbox': 'Latitudes must be between -90 and 90, south first'})
+    return split_antimeridian(west, south, east, north)
+
+
+def circle_boxes(latitude, longitude, radius_km):
+    """Boxes covering every point within ``radius_km`` of a point"""
+    angle = radius_km / EARTH_RADIUS_KM
+    south = latitude - math.degrees(angle)
+    north = latitude + math.degrees(angle)
+    if south <= -90 or north >= 90:
+        # Takes in a pole, so every longitude
+        return [(-180.0, max(south, -90.0), 180.0, min(north, 90.0))]
+
+    ratio = math.sin(angle) / math.cos(math.radians(latitude))
+    if ratio >= 1:
+        return [(-180.0, south, 180.0, north)]
+    spread = math.degrees(math.asin(ratio))
+    west, east = longitude - spread, longitude + spread
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return split_antimeridian(west, south, east, north)
+
+
+def distance_km(latitude, longitude, latitude_field='latitude', longitude_field='longitude'):
+    """Great-circle (haversine) distance from a point to each row, as an expression"""
+    lat1, lon1 = Radians(Value(latitude)), Radians(Value(longitude))
+    lat2, lon2 = Radians(F(latitude_field)), Radians(F(longitude_field))
+    a = (
+        Power(Sin((lat2 - lat1) / 2), 2)
+        + Cos(lat1) * Cos(lat2) * Power(Sin((lon2 - lon1) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(Least(Value(1.0), a)), output_field=FloatField())
+
+
+def _has_table(connection, table):
+    key = (connection.alias, connection.settings_dict['NAME'], table)
+    if key not in _tables:
+        _tables[key] = table in connection.introspection.table_names()
+    return _tables[key]
+
+
+def _index_lookup(queryset, boxes):
+    """Ids of the rows in ``boxes`` through the database's spatial index, or None"""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    params = []
+    if connection.vendor == 'sqlite' and table in RTREE_TABLES:
+        rtree = RTREE_TABLES[table]
+        if not _has_table(connection, rtree):
+            return None
+        for west, south, east, north in boxes:
+            params += [east, west, north, south]
+        where = ' OR '.join(
+            '(min_lon <= %s AND max_lon >= %s AND min_lat <= %s AND max_lat >= %s)'
+            for _ in boxes
+        )
+        return RawSQL(f'SELECT id FROM {rtree} WHERE {where}', params)
+    if connection.vendor == 'postgresql' and table in RTREE_TABLES:
+        for box in boxes:
+            params += box
+        where = ' OR '.join(
+            'point(longitude, latitude) <@ box(point(%s, %s), point(%s, %s))' for _ in boxes
+        )
+        return RawSQL(f'SELECT id FROM {table} WHERE {where}', params)
+    return None
+
+
+def within(queryset, boxes):
+    """Rows of ``queryset`` whose coordinates fall in any of ``boxes``"""
+    exact = Q()
+    for west, south, east, north in boxes:
+        exact |= Q(latitude__range=(south, north), longitude__range=(west, east))
+    lookup = _index_lookup(queryset, boxes)
+    if lookup is not None:
+        queryset = queryset.filter(pk__in=lookup)
+    return queryset.filter(exact)
+
+
+def filter_queryset(queryset, request, through=None):
+    """
+    Apply ``?bbox=`` or ``?near=&radius_km=`` to ``queryset``, whose rows
+    have ``latitude``/``longitude`` columns or, with ``through``, a foreign
+    key to a model that does
+    """
+    params = request.query_params
+    if 'bbox' in params:
+        boxes, near = parse_bbox(params['bbox']), None
+    elif 'near' in params:
+        latitude, longitude = near = _floats(params['near'], 2, 'near')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValidationError({'near': 'Expected a latitude and a longitude'})
+        [radius] = _floats(params.get('radius_km', ''), 1, 'radius_km')
+        if not 0 < radius <= math.pi * EARTH_RADIUS_KM:
+            raise ValidationError({'radius_km': 'Must be positive and at most half the Earth around'})
+        boxes = circle_boxes(latitude, longitude, radius)
+    else:
+        return queryset
+
+    if through is None:
+        points = queryset
+    else:
+        model = queryset.model._meta.get_field(through).related_model
+        points = model._default_manager.db_manager(queryset.db).all()
+    points = within(points, boxes)
+    if near is not None:
+        points = points.alias(distance_km=distance_km(*near)).filter(distance_km__lte=radius)
+    if through is None:
+        return points
+    return queryset.filter(**{f'{through}__in': points.values('pk')})
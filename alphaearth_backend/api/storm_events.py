@@ -0,0 +1,365 @@
+"""
+NOAA StormEvents ingestion.
+
+``read_rows`` streams a StormEvents details CSV (plain or gzipped, from a
+local path or a URL) row by row, decompressing as it reads, so a file is
+never held in memory. ``normalize`` turns a row into claim fields, and
+``ClaimWriter`` upserts them on ``claim_id`` with ``bulk_create`` in
+batches, committing every ``chunk_size`` rows. Claims are keyed on the
+NOAA event id, so re-importing a file updates its claims in place.
+
+Rows are read and normalized a chunk at a time: ``read_chunks`` yields
+each chunk as columns and ``normalize_chunk`` converts the damage strings,
+dates and event types of a whole column at once with NumPy. Those columns
+repeat a handful of distinct values, so each distinct string is parsed once
+and the results are broadcast back. ``normalize`` is the same conversion
+for a single row (see ``manage.py benchmark_storm_normalization``).
+
+NOAA publishes one details file per year; ``normalize_files`` parses and
+normalizes several of them in a process pool and hands each file's events
+back in order to the single writer.
+"""
+import collections
+import csv
+import datetime
+import glob
+import gzip
+import io
+import itertools
+import os
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+import numpy as np
+from django.db import transaction
+
+from .models import InsuranceClaim, Location
+
+
+CLAIM_ID_PREFIX = 'NOAA-'
+
+# DAMAGE_PROPERTY suffixes, e.g. "25K", "1.5M"
+DAMAGE_UNITS = {'H': 100, 'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+
+# Rows normalized together
+CHUNK_ROWS = 10000
+
+DATE_COLUMNS = ['BEGIN_YEARMONTH', 'BEGIN_DAY', 'BEGIN_DATE_TIME']
+
+# Largest amount InsuranceClaim.claim_amount_usd holds
+MAX_CLAIM_AMOUNT = Decimal('9999999999.99')
+
+# Fields a re-import overwrites; the claim's status stays as reviewed
+UPSERT_FIELDS = [
+    'policy_id', 'location_name', 'location', 'disaster_type',
+    'claim_amount_usd', 'damage_score', 'date_filed', 'updated_at',
+]
+
+
+def open_source(source):
+    """Binary stream of a local path or an http(s) URL"""
+    if source.startswith(('http://', 'https://')):
+        return urllib.request.urlopen(source)
+    return open(source, 'rb')
+
+
+def read_chunks(source, size=CHUNK_ROWS):
+    """
+    A StormEvents CSV, decompressed on the fly if gzipped, as chunks of up
+    to ``size`` rows in ``{column: values}`` form
+    """
+    with open_source(source) as raw:
+        stream = gzip.GzipFile(fileobj=raw) if source.endswith('.gz') else raw
+        reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8', errors='replace', newline=''))
+        header = next(reader, None)
+        if not header:
+            return
+        width = len(header)
+        while True:
+            rows = list(itertools.islice(reader, size))
+            if not rows:
+                return
+            # Ragged lines are padded or cut so each column has a value per row
+            rows = [row if len(row) == width else (row + [''] * width)[:width] for row in rows]
+            yield dict(zip(header, zip(*rows)))
+
+
+def classify_disaster(event_type):
+    """Claim disaster type of a NOAA event type, or None for the ones not covered"""
+    event_type = event_type.lower()
+    if 'flood' in event_type:
+        return 'Flood'
+    if 'fire' in event_type:
+        return 'Wildfire'
+    if 'storm' in event_type or 'tornado' in event_type or 'hurricane' in event_type:
+        return 'Storm'
+    return None
+
+
+def parse_damage(value):
+    """Dollar amount of a DAMAGE_PROPERTY string like "25K" or "1.5M" (0 if blank or unreadable)"""
+    value = value.replace('$', '').replace(',', '').strip().upper()
+    if not value:
+        return 0.0
+    multiplier = DAMAGE_UNITS.get(value[-1])
+    if multiplier is not None:
+        value = value[:-1] or '1'
+    try:
+        return float(value) * (multiplier or 1)
+    except ValueError:
+        return 0.0
+
+
+def parse_date(row):
+    """Begin date of an event, from BEGIN_YEARMONTH/BEGIN_DAY or BEGIN_DATE_TIME"""
+    try:
+        year_month = row['BEGIN_YEARMONTH'].strip()
+        return datetime.date(int(year_month[:4]), int(year_month[4:]), int(row['BEGIN_DAY']))
+    except (KeyError, ValueError):
+        pass
+    try:
+        # Two-digit years; prefer the fields above when present
+        return datetime.datetime.strptime(row['BEGIN_DATE_TIME'].strip(), '%d-%b-%y %H:%M:%S').date()
+    except (KeyError, ValueError):
+        return None
+
+
+def normalize(row):
+    """
+    Claim fields of a StormEvents row, or None for rows that aren't a
+    covered disaster or lack an event id, location or date
+    """
+    disaster_type = classify_disaster(row.get('EVENT_TYPE') or '')
+    event_id = (row.get('EVENT_ID') or '').strip()
+    state, county = (row.get('STATE') or '').strip(), (row.get('CZ_NAME') or '').strip()
+    if disaster_type is None or not event_id or not state or not county:
+        return None
+    date_filed = parse_date(row)
+    if date_filed is None:
+        return None
+    damage = parse_damage(row.get('DAMAGE_PROPERTY') or '')
+    return {
+        'event_id': event_id,
+        'location_name': f'{county}, {state}',
+        'disaster_type': disaster_type,
+        'claim_amount_usd': damage,
+        'damage_score': min(damage / 1_000_000, 1.0),
+        'date_filed': date_filed,
+    }
+
+
+# Columns of a normalized chunk, as ``normalize`` names the fields of an event
+EVENT_FIELDS = [
+    'event_id', 'location_name', 'disaster_type', 'claim_amount_usd', 'damage_score', 'date_filed',
+]
+
+
+def _column(columns, name, size):
+    """A column as an object array of stripped strings ('' where the column is missing)"""
+    values = columns.get(name)
+    if values is None:
+        return np.full(size, '', dtype=object)
+    return np.fromiter(map(str.strip, values), dtype=object, count=size)
+
+
+def _map_distinct(values, func, dtype):
+    """
+    ``func`` applied to every element of ``values``, calling it once per
+    distinct value; these columns repeat a few dozen values
+    """
+    results = {value: func(value) for value in set(values)}
+    return np.array(list(map(results.__getitem__, values)), dtype=dtype)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return -1
+
+
+def parse_dates(year_months, days, date_times):
+    """Begin dates as ``datetime64[D]`` (NaT where unreadable) from arrays of the three date columns"""
+    year_month = _map_distinct(year_months, _to_int, np.int64)
+    day = _map_distinct(days, _to_int, np.int64)
+    month = year_month % 100
+    valid = (year_month > 0) & (month >= 1) & (month <= 12) & (day >= 1)
+    months = np.where(valid, (year_month // 100 - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+    dates = months.astype('datetime64[D]') + np.maximum(day - 1, 0)
+    # Day 31 of a 30-day month and the like
+    valid &= dates < (months + 1).astype('datetime64[D]')
+    dates[~valid] = np.datetime64('NaT')
+
+    missing = np.flatnonzero(~valid)
+    if missing.size:
+        # Older layouts only have BEGIN_DATE_TIME
+        dates[missing] = _map_distinct(
+            date_times[missing], lambda value: parse_date({'BEGIN_DATE_TIME': value}),
+            'datetime64[D]',
+        )
+    return dates
+
+
+def normalize_chunk(columns):
+    """
+    The columnar ``normalize``: claim fields of the covered events in a
+    chunk of StormEvents rows given as ``{column: values}``, returned as
+    ``{field: list}`` over ``EVENT_FIELDS`` (see ``iter_events`` for rows)
+    """
+    size = len(next(iter(columns.values()), ()))
+    disaster_types = _map_distinct(_column(columns, 'EVENT_TYPE', size), classify_disaster, object)
+    event_ids = _column(columns, 'EVENT_ID', size)
+    states = _column(columns, 'STATE', size)
+    counties = _column(columns, 'CZ_NAME', size)
+    keep = (disaster_types != None) & (event_ids != '') & (states != '') & (counties != '')  # noqa: E711
+
+    dates = np.full(size, np.datetime64('NaT'), dtype='datetime64[D]')
+    if keep.any():
+        dates[keep] = parse_dates(*(
+            _column(columns, name, size)[keep]
+            for name in ['BEGIN_YEARMONTH', 'BEGIN_DAY', 'BEGIN_DATE_TIME']
+        ))
+    keep &= ~np.isnat(dates)
+
+    damage = _map_distinct(_column(columns, 'DAMAGE_PROPERTY', size)[keep], parse_damage, np.float64)
+    location_names = counties[keep] + ', ' + states[keep]
+    return {
+        'event_id': event_ids[keep].tolist(),
+        'location_name': location_names.tolist(),
+        'disaster_type': disaster_types[keep].tolist(),
+        'claim_amount_usd': damage.tolist(),
+        'damage_score': np.minimum(damage / 1_000_000, 1.0).tolist(),
+        'date_filed': dates[keep].tolist(),
+    }
+
+
+def iter_events(events):
+    """The events of a ``normalize_chunk`` result one dict at a time, as ``normalize`` gives them"""
+    for values in zip(*(events[field] for field in EVENT_FIELDS)):
+        yield dict(zip(EVENT_FIELDS, values))
+
+
+def expand_sources(sources):
+    """Files named by paths, URLs, globs or directories (of StormEvents_details-*.csv[.gz] files)"""
+    expanded = []
+    for source in sources:
+        if source.startswith(('http://', 'https://')):
+            expanded.append(source)
+        elif os.path.isdir(source):
+            expanded += sorted(glob.glob(os.path.join(source, 'StormEvents_details-*.csv*')))
+        elif glob.has_magic(source):
+            expanded += sorted(glob.glob(source))
+        else:
+            expanded.append(source)
+    return expanded
+
+
+def normalize_file(source):
+    """
+    ``(rows read, normalized chunks)`` of one file; the unit of work of a
+    pool worker. Columns pickle back to the parent far faster than rows.
+    """
+    read, chunks = 0, []
+    for columns in read_chunks(source):
+        read += len(next(iter(columns.values())))
+        chunks.append(normalize_chunk(columns))
+    return read, chunks
+
+
+def normalize_files(sources, workers):
+    """
+    ``(source, rows read, normalized chunks)`` for each of ``sources``, in
+    order, the files parsed in a pool of ``workers`` processes. At most
+    ``workers + 1`` files are ahead of the consumer, so memory stays
+    bounded by a few files' events.
+    """
+    # The initializer lets spawned (not only forked) workers import the models
+    with ProcessPoolExecutor(workers, initializer=django.setup) as pool:
+        pending = collections.deque()
+        for source in sources:
+            pending.append((source, pool.submit(normalize_file, source)))
+            if len(pending) > workers:
+                source, future = pending.popleft()
+                yield (source, *future.result())
+        while pending:
+            source, future = pending.popleft()
+            yield (source, *future.result())
+
+
+class ClaimWriter:
+    """
+    Upserts normalized events as InsuranceClaims: ``add`` queues one,
+    every ``batch_size`` are written with one ``bulk_create`` and every
+    ``chunk_size`` are committed together. Use as a context manager, or
+    call ``close`` to write the rest.
+    """
+
+    def __init__(self, policy_ids=(), batch_size=1000, chunk_size=20000, progress=None):
+        self.policy_ids = list(policy_ids) or ['NOAA']
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.pending = []
+        self.written = 0
+        self.started = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+
+    @property
+    def rate(self):
+        """Rows written per second so far"""
+        return self.written / max(time.monotonic() - self.started, 1e-9)
+
+    def claim(self, event):
+        event_id = event['event_id']
+        # The same event always lands on the same policy
+        policy = self.policy_ids[int(event_id) % len(self.policy_ids) if event_id.isdigit() else 0]
+        return InsuranceClaim(
+            claim_id=CLAIM_ID_PREFIX + event_id,
+            policy_id=policy,
+            location_name=event['location_name'],
+            disaster_type=event['disaster_type'],
+            claim_amount_usd=min(Decimal(event['claim_amount_usd']).quantize(Decimal('0.01')),
+                                 MAX_CLAIM_AMOUNT),
+            damage_score=event['damage_score'],
+            date_filed=event['date_filed'],
+        )
+
+    def add(self, event):
+        self.pending.append(event)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def add_chunk(self, events):
+        """Queue the events of a ``normalize_chunk`` result"""
+        for event in iter_events(events):
+            self.add(event)
+
+    def flush(self):
+        """Write and commit the queued events"""
+        if not self.pending:
+            return
+        # Later rows for an event win, as they would with one save each
+        claims = list({claim.claim_id: claim for claim in map(self.claim, self.pending)}.values())
+        with transaction.atomic():
+            for start in range(0, len(claims), self.batch_size):
+                batch = Location.assign(claims[start:start + self.batch_size])
+                InsuranceClaim.objects.bulk_create(
+                    batch, update_conflicts=True, unique_fields=['claim_id'],
+                    update_fields=UPSERT_FIELDS,
+                )
+        self.written += len(self.pending)
+        self.pending = []
+        if self.progress:
+            self.progress(self)
+
+    def close(self):
+        self.flush()
@@ -1,3 +1,1638 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import hashlib
+import importlib.util
+import io
+import itertools
+import json
+import os
+import re
+import tempfile
+import struct
+import threading
+import unittest
+import zlib
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework import serializers as drf_serializers
+
+from . import (
+    batching, change_detection, clusters, damage, dashboard, detection_cache, imaging, jobs,
+    location_search, similarity, spatial, storm_events, tiling
+)
+from .detectors import decode_output, letterbox
+from .imaging import DecodedImage
+from .models import (
+    Asset, CacheVersion, DamageAnalysis, DamageAnalysisJob, DashboardSnapshot, InsuranceClaim,
+    Location, ParametricTrigger, RiskZone
+)
+
+
+class LetterboxTests(SimpleTestCase):
+    def test_pads_to_square_keeping_aspect_ratio(self):
+        image = np.zeros((320, 640, 3), dtype=np.uint8)
+        padded, gain, (pad_x, pad_y) = letterbox(image, 640)
+        self.assertEqual(padded.shape, (640, 640, 3))
+        self.assertEqual(gain, 1.0)
+        self.assertEqual((pad_x, pad_y), (0, 160))
+        self.assertEqual(padded[0, 0, 0], 114)
+        self.assertEqual(padded[320, 320, 0], 0)
+
+
+class DecodeOutputTests(SimpleTestCase):
+    def raw_output(self, rows, classes=3, anchors=10):
+        """YOLOv8-style (4 + classes, anchors) output from (cx, cy, w, h, cls, score) rows"""
+        output = np.zeros((4 + classes, anchors), dtype=np.float32)
+        for anchor, (cx, cy, w, h, cls, score) in enumerate(rows):
+            output[:4, anchor] = cx, cy, w, h
+            output[4 + cls, anchor] = score
+        return output
+
+    def test_maps_boxes_back_to_image_coordinates(self):
+        output = self.raw_output([(320, 320, 100, 50, 2, 0.9)])
+        boxes = decode_output(output, gain=0.5, pad=(0, 160), image_shape=(640, 1280))
+        np.testing.assert_allclose(boxes, [[540, 270, 740, 370, 0.9, 2]], rtol=1e-6)
+
+    def test_drops_low_confidence_and_suppresses_overlaps(self):
+        output = self.raw_output([
+            (100, 100, 50, 50, 0, 0.9),
+            (102, 100, 50, 50, 0, 0.8),  # same object, same class
+            (102, 100, 50, 50, 1, 0.8),  # same place, other class
+            (400, 400, 50, 50, 0, 0.1),  # below the confidence threshold
+        ])
+        boxes = decode_output(output, gain=1.0, pad=(0, 0), image_shape=(640, 640))
+        self.assertEqual(len(boxes), 2)
+        self.assertEqual(sorted(boxes[:, 5]), [0, 1])
+
+    def test_empty_output(self):
+        boxes = decode_output(self.raw_output([]), gain=1.0, pad=(0, 0), image_shape=(640, 640))
+        self.assertEqual(boxes.shape, (0, 6))
+
+    def test_matches_ultralytics_post_processing(self):
+        # Clusters of overlapping candidates over three classes, as a
+        # 640 x 640 letterboxed input would produce them
+        rng = np.random.default_rng(0)
+        anchors = 2000
+        centres = rng.uniform(40, 600, (40, 2))[rng.integers(0, 40, anchors)]
+        output = np.zeros((7, anchors), dtype=np.float32)
+        output[:2] = (centres + rng.normal(0, 6, centres.shape)).T
+        output[2:4] = rng.uniform(20, 80, (2, anchors))
+        output[4:] = rng.uniform(0, 0.6, (3, anchors)) ** 2 * 2.5
+        image_shape = (333, 500)
+
+        _, gain, pad = letterbox(np.zeros((*image_shape, 3), dtype=np.uint8), 640)
+        self.assertGreater(len(ultralytics_post_process(output, (640, 640), image_shape)), 25)
+        # Also when max_detections cuts the kept boxes short
+        for max_detections in [300, 25]:
+            boxes = decode_output(output, gain, pad, image_shape, max_detections=max_detections)
+            expected = ultralytics_post_process(output, (640, 640), image_shape, max_det=max_detections)
+            np.testing.assert_allclose(boxes, expected, rtol=1e-5, atol=1e-3)
+
+
+def ultralytics_post_process(output, input_shape, image_shape, conf_thres=0.25, iou_thres=0.7,
+                             max_det=300, max_wh=7680):
+    """
+    NumPy transcription of what ultralytics does to one image's raw YOLOv8
+    output: ``ops.non_max_suppression`` (class-aware, one label per box,
+    torchvision's NMS) then ``ops.scale_boxes`` back to the original image
+    """
+    x = output.T.astype(np.float64)
+    x = x[x[:, 4:].max(axis=1) > conf_thres]
+    cx, cy, w, h = x[:, :4].T
+    box = np.column_stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+    conf, j = x[:, 4:].max(axis=1), x[:, 4:].argmax(axis=1)
+
+    # torchvision.ops.nms on boxes offset by class
+    offset = box + j[:, None] * max_wh
+    areas = (offset[:, 2] - offset[:, 0]) * (offset[:, 3] - offset[:, 1])
+    order, keep = list(np.argsort(-conf, kind='stable')), []
+    while order:
+        best, order = order[0], order[1:]
+        keep.append(best)
+        rest = offset[order]
+        top_left = np.maximum(rest[:, :2], offset[best, :2])
+        bottom_right = np.minimum(rest[:, 2:], offset[best, 2:])
+        inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        iou = inter / (areas[order] + areas[best] - inter)
+        order = [index for index, overlap in zip(order, iou) if overlap <= iou_thres]
+    keep = keep[:max_det]
+    rows = np.column_stack([box[keep], conf[keep], j[keep]])
+
+    gain = min(input_shape[0] / image_shape[0], input_shape[1] / image_shape[1])
+    pad_x = round((input_shape[1] - image_shape[1] * gain) / 2 - 0.1)
+    pad_y = round((input_shape[0] - image_shape[0] * gain) / 2 - 0.1)
+    rows[:, [0, 2]] = np.clip((rows[:, [0, 2]] - pad_x) / gain, 0, image_shape[1])
+    rows[:, [1, 3]] = np.clip((rows[:, [1, 3]] - pad_y) / gain, 0, image_shape[0])
+    return rows
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def batcher(self, predict_batch, **options):
+        self.batches = []
+
+        def predict(items):
+            self.batches.append(list(items))
+            return predict_batch(items)
+
+        return batching.MicroBatcher(predict, **{'max_wait': 0.2, **options})
+
+    def test_groups_submissions_into_batches_and_keeps_order(self):
+        batcher = self.batcher(lambda items: [item * 10 for item in items], max_batch_size=2)
+        self.assertEqual(batcher.map([1, 2, 3, 4, 5]), [10, 20, 30, 40, 50])
+        self.assertEqual(self.batches, [[1, 2], [3, 4], [5]])
+        metrics = batcher.metrics()
+        self.assertEqual((metrics['batches'], metrics['images'], metrics['largest_batch']), (3, 5, 2))
+
+    def test_concurrent_submissions_share_a_batch(self):
+        batcher = self.batcher(lambda items: items, max_batch_size=8)
+        futures = [batcher.submit(n) for n in range(3)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 1, 2])
+        self.assertEqual(self.batches, [[0, 1, 2]])
+
+    def test_a_failed_batch_fails_each_of_its_futures(self):
+        def fail(items):
+            raise RuntimeError('detector crashed')
+
+        futures = self.batcher(fail).submit_many(['a', 'b'])
+        for future in futures:
+            with self.assertRaisesMessage(RuntimeError, 'detector crashed'):
+                future.result(timeout=5)
+
+    def test_too_few_results_is_an_error(self):
+        future = self.batcher(lambda items: items[:1]).submit_many(['a', 'b'])[1]
+        with self.assertRaisesMessage(RuntimeError, '1 results for 2 items'):
+            future.result(timeout=5)
+
+    def test_a_full_queue_refuses_the_whole_request(self):
+        started, release = threading.Event(), threading.Event()
+        self.addCleanup(release.set)
+
+        def predict(items):
+            started.set()
+            release.wait(5)
+            return items
+
+        batcher = self.batcher(predict, max_batch_size=1, max_wait=0, max_queue=3)
+        busy = batcher.submit('busy')
+        self.assertTrue(started.wait(5))
+        queued = batcher.submit_many(['a', 'b'])
+        with self.assertRaises(batching.QueueFull) as raised:
+            batcher.submit_many(['c', 'd'])
+        self.assertEqual(raised.exception.depth, 2)
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        # Neither image was queued; one more still fits
+        self.assertEqual((batcher.metrics()['queued'], batcher.metrics()['rejected']), (2, 1))
+        queued.append(batcher.submit('c'))
+        release.set()
+        self.assertEqual([future.result(timeout=5) for future in [busy, *queued]],
+                         ['busy', 'a', 'b', 'c'])
+
+    def test_a_request_bigger_than_the_queue_is_admitted_when_it_is_empty(self):
+        batcher = self.batcher(lambda items: items, max_batch_size=8, max_queue=3)
+        self.assertEqual(batcher.map(list(range(5))), [0, 1, 2, 3, 4])
+
+
+class InferenceBusyTests(SimpleTestCase):
+    def upload(self, name):
+        return SimpleUploadedFile(name, encode_png(np.zeros((8, 8, 3), dtype=np.uint8)), 'image/png')
+
+    def test_damage_analysis_answers_429_with_retry_after(self):
+        with mock.patch('api.views.run_damage_analysis', side_effect=batching.QueueFull(6, 7)):
+            response = self.client.post(reverse('damage-analysis') + '?async=0', {
+                'pre_image': self.upload('pre.png'), 'post_image': self.upload('post.png'),
+                'location_name': 'Miami', 'disaster_type': 'Flood',
+            })
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(response.json()['retry_after'], 7)
+
+    def test_batch_analysis_answers_429_with_retry_after(self):
+        with mock.patch('api.views.compute_damage_reports', side_effect=batching.QueueFull(6, 3)):
+            response = self.client.post(reverse('damage-analysis-batch'), {
+                'pre_images': [self.upload('pre.png')], 'post_images': [self.upload('post.png')],
+                'location_names': ['Miami'], 'disaster_types': ['Flood'],
+            })
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3')
+
+
+class ChangeDetectionTests(SimpleTestCase):
+    # Pre A overlaps post X (0.9) and Y (0.8); pre B only overlaps X (0.7)
+    PAIRS = np.array([0, 0, 1]), np.array([0, 1, 0]), np.array([0.9, 0.8, 0.7])
+
+    def test_greedy_takes_the_best_pair_first(self):
+        rows, cols, vals = change_detection.match_greedy(*self.PAIRS)
+        self.assertEqual(list(zip(rows, cols)), [(0, 0)])
+        self.assertAlmostEqual(vals.sum(), 0.9)
+
+    @unittest.skipUnless(importlib.util.find_spec('scipy'), 'needs scipy')
+    def test_hungarian_maximizes_the_total_iou(self):
+        rows, cols, vals = change_detection.match_hungarian(*self.PAIRS, n_pre=2, n_post=2)
+        self.assertEqual(sorted(zip(rows, cols)), [(0, 1), (1, 0)])
+        self.assertAlmostEqual(vals.sum(), 1.5)
+
+    def test_greedy_matches_sorting_every_pair(self):
+        rng = np.random.default_rng(0)
+        rows, cols = rng.integers(0, 30, 200), rng.integers(0, 30, 200)
+        vals = rng.random(200)
+        expected, used_rows, used_cols = set(), set(), set()
+        for index in sorted(range(200), key=lambda index: (-vals[index], index)):
+            if rows[index] not in used_rows and cols[index] not in used_cols:
+                expected.add((rows[index], cols[index]))
+                used_rows.add(rows[index])
+                used_cols.add(cols[index])
+        matched_rows, matched_cols, _ = change_detection.match_greedy(rows, cols, vals)
+        self.assertEqual(set(zip(matched_rows, matched_cols)), expected)
+
+    def test_classify_and_summarize(self):
+        pre = [
+            [0, 0, 10, 10, 0.9, 0],    # unchanged: intact
+            [20, 0, 30, 10, 0.9, 0],   # shrank to IoU 0.7: damaged
+            [40, 0, 50, 10, 0.9, 0],   # detector lost confidence: damaged
+            [60, 0, 70, 10, 0.9, 0],   # gone: disappeared
+            [80, 0, 90, 10, 0.9, 1],   # another class there now: disappeared
+        ]
+        post = [
+            [0, 0, 10, 10, 0.9, 0],
+            [23, 0, 30, 10, 0.9, 0],
+            [40, 0, 50, 10, 0.3, 0],
+            [80, 0, 90, 10, 0.9, 0],   # new
+            [100, 0, 110, 10, 0.8, 0],  # new
+        ]
+        intact, damaged, disappeared = (change_detection.INTACT, change_detection.DAMAGED,
+                                        change_detection.DISAPPEARED)
+        methods = ['greedy', 'hungarian'] if importlib.util.find_spec('scipy') else ['greedy']
+        for method in methods:
+            pre_status, post_matched = change_detection.classify(pre, post, method=method)
+            self.assertEqual(pre_status.tolist(),
+                             [intact, damaged, damaged, disappeared, disappeared], method)
+            self.assertEqual(post_matched.tolist(), [True, True, True, False, False], method)
+
+        summary = change_detection.summarize(pre, pre_status, post_matched)
+        self.assertEqual(summary, {
+            'pre_objects': 5, 'post_objects': 5, 'intact': 1, 'damaged': 2, 'disappeared': 2,
+            'new': 2, 'damaged_footprint_px': 400.0, 'score': (2 + 0.5 * 2 + 2) / 7,
+        })
+
+    def test_no_boxes_on_either_side(self):
+        pre_status, post_matched = change_detection.classify([], [[0, 0, 10, 10, 0.9, 0]])
+        summary = change_detection.summarize([], pre_status, post_matched)
+        self.assertEqual((summary['pre_objects'], summary['new'], summary['score']), (0, 1, 1.0))
+
+
+class SimilarityTests(SimpleTestCase):
+    def reference_ssim(self, x, y):
+        """skimage's default SSIM written out window by window"""
+        windows = lambda image: np.lib.stride_tricks.sliding_window_view(image.astype(np.float64), (7, 7))
+        wx, wy = windows(x), windows(y)
+        ux, uy = wx.mean(axis=(2, 3)), wy.mean(axis=(2, 3))
+        vx, vy = wx.var(axis=(2, 3), ddof=1), wy.var(axis=(2, 3), ddof=1)
+        vxy = ((wx - ux[..., None, None]) * (wy - uy[..., None, None])).sum(axis=(2, 3)) / 48
+        c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+        values = ((2 * ux * uy + c1) * (2 * vxy + c2)
+                  / ((ux ** 2 + uy ** 2 + c1) * (vx + vy + c2)))
+        return values.mean()
+
+    def test_ssim_matches_the_windowed_definition(self):
+        rng = np.random.default_rng(0)
+        x = rng.integers(0, 256, (40, 50), dtype=np.uint8)
+        y = np.clip(x + rng.normal(0, 30, x.shape), 0, 255).astype(np.uint8)
+        score, _ = similarity.ssim(x, y)
+        self.assertAlmostEqual(score, self.reference_ssim(x, y), places=4)
+        self.assertEqual(similarity.ssim(x, x)[0], 1.0)
+
+    @unittest.skipUnless(importlib.util.find_spec('skimage'), 'needs scikit-image')
+    def test_ssim_matches_skimage(self):
+        from skimage.metrics import structural_similarity
+
+        rng = np.random.default_rng(2)
+        x = rng.integers(0, 256, (60, 45), dtype=np.uint8)
+        y = cv2.GaussianBlur(x, (5, 5), 0)
+        self.assertAlmostEqual(similarity.ssim(x, y)[0], structural_similarity(x, y), places=4)
+
+    def test_ssim_map_of_flat_images(self):
+        # No variance anywhere: only the luminance term is left
+        x, y = np.full((16, 16), 100, np.uint8), np.full((16, 16), 150, np.uint8)
+        c1 = (0.01 * 255) ** 2
+        np.testing.assert_allclose(similarity.ssim_map(x, y),
+                                   (2 * 100 * 150 + c1) / (100 ** 2 + 150 ** 2 + c1), rtol=1e-5)
+
+    def test_compare_brings_images_to_a_common_size(self):
+        rng = np.random.default_rng(1)
+        scene = rng.integers(0, 256, (64, 96, 3), dtype=np.uint8)
+        changed = scene.copy()
+        changed[:32, :48] = 0
+        with DecodedImage(SimpleUploadedFile('pre.png', encode_png(scene))) as pre, \
+                DecodedImage(SimpleUploadedFile('post.png', encode_png(changed))) as post:
+            self.assertEqual(similarity.compare(pre, pre, max_side=0), (1.0, None))
+            score, heatmap = similarity.compare(pre, post, max_side=48, heatmap_blocks=2)
+            width, height = similarity.target_size([pre.shape, post.shape], max_side=48)
+            expected = self.reference_ssim(pre.downsampled(width, height), post.downsampled(width, height))
+        self.assertEqual((width, height), (48, 32))
+        self.assertAlmostEqual(score, expected, places=4)
+        # Only the top-left quarter changed
+        self.assertEqual(heatmap.shape, (2, 2))
+        self.assertEqual(np.unravel_index(heatmap.argmax(), heatmap.shape), (0, 0))
+
+
+def png_scene(width, height):
+    """A blank 1-bit PNG of any size, cheap to build and to upload"""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    compressor = zlib.compressobj(9)
+    row = bytes(1 + (width + 7) // 8)
+    data = b''.join(compressor.compress(row) for _ in range(height)) + compressor.flush()
+    header = struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', data)
+            + chunk(b'IEND', b''))
+
+
+def encode_png(array):
+    return cv2.imencode('.png', array)[1].tobytes()
+
+
+class DecodedImageTests(SimpleTestCase):
+    def setUp(self):
+        row = np.linspace(0, 255, 64, dtype=np.uint8)
+        self.array = np.dstack([np.tile(row, (48, 1))] * 3)
+        self.data = encode_png(self.array)
+
+    def test_digest_is_the_sha256_of_the_bytes_in_memory_or_on_disk(self):
+        expected = hashlib.sha256(self.data).hexdigest()
+        with DecodedImage(SimpleUploadedFile('scene.png', self.data)) as image:
+            self.assertEqual(image.digest, expected)
+        with tempfile.TemporaryFile() as file:
+            file.write(self.data)
+            file.flush()
+            with DecodedImage(file) as image:
+                self.assertEqual((image.digest, image.nbytes), (expected, len(self.data)))
+
+    def test_decodes_once_and_derives_gray(self):
+        with mock.patch.object(cv2, 'imdecode', wraps=cv2.imdecode) as imdecode, \
+                DecodedImage(SimpleUploadedFile('scene.png', self.data)) as image:
+            # The header is enough for the size
+            self.assertEqual((image.format, image.dimensions), ('PNG', (48, 64)))
+            self.assertEqual(imdecode.call_count, 0)
+            np.testing.assert_array_equal(image.color, self.array)
+            np.testing.assert_array_equal(image.gray, cv2.cvtColor(self.array, cv2.COLOR_BGR2GRAY))
+            self.assertIs(image.gray, image.gray)
+            self.assertEqual(imdecode.call_count, 1)
+        # Decoded arrays outlive the buffer
+        self.assertIsNone(image.buffer)
+        self.assertEqual(image.shape, (48, 64))
+
+    def test_downsampled_walks_the_pyramid_and_is_cached(self):
+        with DecodedImage(SimpleUploadedFile('scene.png', self.data)) as image:
+            small = image.downsampled(16, 12)
+            self.assertEqual(small.shape, (12, 16))
+            self.assertIs(image.downsampled(16, 12), small)
+            # Exactly a quarter of the size: two pyramid levels, no resize
+            np.testing.assert_array_equal(small, cv2.pyrDown(cv2.pyrDown(image.gray)))
+            self.assertEqual(image.downsampled(20, 15).shape, (15, 20))
+            self.assertEqual(image.downsampled(16, 12, gray=False).shape, (12, 16, 3))
+            # Already the right size: the array itself
+            self.assertIs(image.downsampled(64, 48), image.gray)
+
+    def test_undecodable_bytes(self):
+        with DecodedImage(SimpleUploadedFile('scene.png', b'not an image')) as image:
+            self.assertIsNone(image.color)
+            self.assertIsNone(image.gray)
+            self.assertIsNone(image.downsampled(16, 12))
+            self.assertEqual((image.format, image.dimensions), (None, None))
+
+    def test_header_reads_leave_pillows_pixel_limit_alone(self):
+        scene = io.BytesIO(png_scene(20000, 20000))
+        limits = []
+        preinit = Image.preinit
+
+        def spy():
+            limits.append(Image.MAX_IMAGE_PIXELS)
+            preinit()
+
+        # Other threads opening images meanwhile must still get the bomb check
+        with mock.patch.object(Image, 'preinit', spy):
+            self.assertEqual(imaging.read_header(scene), ('PNG', (20000, 20000)))
+        self.assertEqual(limits, [Image.MAX_IMAGE_PIXELS])
+        self.assertIsNotNone(Image.MAX_IMAGE_PIXELS)
+        with self.assertRaises(Image.DecompressionBombError):
+            Image.open(scene)
+        with self.assertRaises(imaging.ImageTooLarge):
+            imaging.read_header(scene, max_pixels=20000 * 20000 - 1)
+
+
+class SceneUploadTests(TestCase):
+    def setUp(self):
+        media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(MEDIA_ROOT=media))
+
+    def post_scene(self, scene):
+        return self.client.post(reverse('damage-analysis') + '?async=1', {
+            'pre_image': SimpleUploadedFile('pre.png', scene, 'image/png'),
+            'post_image': SimpleUploadedFile('post.png', scene, 'image/png'),
+            'location_name': 'Miami', 'disaster_type': 'Flood',
+        })
+
+    def test_accepts_scenes_over_pillows_pixel_limit(self):
+        scene = png_scene(20000, 20000)
+        self.assertGreater(20000 * 20000, 2 * Image.MAX_IMAGE_PIXELS)
+        # What ImageField made of it
+        with self.assertRaises(DjangoValidationError):
+            drf_serializers.ImageField().run_validation(SimpleUploadedFile('scene.png', scene))
+
+        response = self.post_scene(scene)
+        self.assertEqual(response.status_code, 202, response.content)
+        job = DamageAnalysisJob.objects.get(pk=response.json()['job_id'])
+        with job.pre_image.open('rb') as upload, DecodedImage(upload) as image:
+            self.assertEqual((image.format, image.dimensions), ('PNG', (20000, 20000)))
+            self.assertTrue(damage.is_large_scene(image))
+
+    def test_rejects_scenes_over_the_configured_limit_and_non_images(self):
+        with self.settings(DAMAGE_SCENE_MAX_PIXELS=100 * 100):
+            response = self.post_scene(png_scene(101, 100))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('10100 pixels', response.json()['pre_image'][0])
+        self.assertEqual(self.post_scene(b'not an image').status_code, 400)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(MEDIA_ROOT=media, DAMAGE_JOB_MAX_ATTEMPTS=3))
+        self.image = encode_png(np.zeros((8, 8, 3), dtype=np.uint8))
+
+    def make_job(self, **fields):
+        return DamageAnalysisJob.objects.create(
+            pre_image=SimpleUploadedFile('pre.png', self.image),
+            post_image=SimpleUploadedFile('post.png', self.image),
+            location_name='Miami', disaster_type='Flood', **fields
+        )
+
+    def fake_analysis(self):
+        [claim] = make_claims(1)
+
+        def analyse(*args, on_progress=None, **kwargs):
+            on_progress(70)
+            return claim, claim.analyses.first()
+
+        return mock.patch.object(jobs, 'run_damage_analysis', side_effect=analyse)
+
+    def test_requeues_running_jobs_whose_lease_ran_out(self):
+        expired = timezone.now() - timedelta(seconds=1)
+        abandoned = self.make_job(status='Running', attempts=1, lease_expires_at=expired)
+        exhausted = self.make_job(status='Running', attempts=3, lease_expires_at=expired)
+        running = self.make_job(status='Running', attempts=1,
+                                lease_expires_at=timezone.now() + timedelta(minutes=5))
+
+        job = jobs.claim_job()
+        self.assertEqual((job.pk, job.status, job.attempts), (abandoned.pk, 'Running', 2))
+        self.assertGreater(job.lease_expires_at, timezone.now())
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, 'Failed')
+        self.assertEqual(DamageAnalysisJob.objects.get(pk=running.pk).status, 'Running')
+        self.assertIsNone(jobs.claim_job())
+
+    def test_drain_processes_every_queued_job(self):
+        queued = [self.make_job(), self.make_job()]
+        with self.fake_analysis():
+            self.assertEqual(jobs.drain(), 2)
+        for job in queued:
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.progress, job.attempts), ('Completed', 100, 1))
+            self.assertIsNotNone(job.claim_id)
+            self.assertIsNone(job.lease_expires_at)
+
+    def test_a_run_that_lost_its_lease_records_nothing(self):
+        self.make_job()
+        job = jobs.claim_job()
+        # Meanwhile the lease ran out and another worker took the job over
+        DamageAnalysisJob.objects.filter(pk=job.pk).update(attempts=2)
+        with self.fake_analysis():
+            jobs.process_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.claim_id), ('Running', 5, None))
+
+    def uploads(self, job):
+        return [job.pre_image.storage.exists(field.name) for field in (job.pre_image, job.post_image)]
+
+    def test_uploads_are_deleted_once_the_job_is_done(self):
+        completed, failed = self.make_job(), self.make_job()
+        expired = timezone.now() - timedelta(seconds=1)
+        exhausted = self.make_job(status='Running', attempts=3, lease_expires_at=expired)
+        with self.fake_analysis():
+            jobs.process_next_job(completed.pk)
+        with mock.patch.object(jobs, 'run_damage_analysis', side_effect=ValueError('bad scene')), \
+                self.assertLogs(jobs.logger, 'ERROR'):
+            jobs.process_next_job(failed.pk)
+        for job, status in [(completed, 'Completed'), (failed, 'Failed'), (exhausted, 'Failed')]:
+            self.assertEqual(self.uploads(job), [False, False])
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.pre_image.name, job.post_image.name), (status, '', ''))
+
+    def test_waits_for_room_in_the_inference_queue_holding_its_lease(self):
+        self.make_job()
+        job = jobs.claim_job()
+        leases = []
+
+        def expire():
+            # As if the wait outlasted the lease
+            DamageAnalysisJob.objects.filter(pk=job.pk).update(
+                lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        def sleep(seconds):
+            leases.append(DamageAnalysisJob.objects.get(pk=job.pk).lease_expires_at)
+            expire()
+
+        expire()
+
+        [claim] = make_claims(1)
+        results = [batching.QueueFull(8, 1), batching.QueueFull(8, 1), (claim, None)]
+        with mock.patch.object(jobs, 'run_damage_analysis', side_effect=results), \
+                mock.patch.object(jobs.time, 'sleep', side_effect=sleep):
+            self.assertTrue(jobs.process_job(job))
+        self.assertEqual(len(leases), 2)
+        self.assertTrue(all(lease > timezone.now() for lease in leases))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('Completed', 1))
+
+    def test_a_run_that_lost_its_lease_stops_waiting(self):
+        self.make_job()
+        job = jobs.claim_job()
+        DamageAnalysisJob.objects.filter(pk=job.pk).update(attempts=2)
+        with mock.patch.object(jobs, 'run_damage_analysis', side_effect=batching.QueueFull(8, 1)), \
+                mock.patch.object(jobs.time, 'sleep') as sleep:
+            self.assertFalse(jobs.process_job(job))
+        sleep.assert_not_called()
+        # The run that holds the job still needs the images
+        self.assertEqual(self.uploads(job), [True, True])
+
+    def test_claim_ids_stay_unique_after_deletes(self):
+        report = {'score': 0.5, 'changed_area_sqm': None, 'objects': None, 'tiles': [],
+                  'heatmap': None}
+
+        def analyse():
+            claim, _ = damage.run_damage_analysis(
+                SimpleUploadedFile('pre.png', self.image), SimpleUploadedFile('post.png', self.image),
+                'Miami', 'Flood', report=report
+            )
+            return claim
+
+        first, second = analyse(), analyse()
+        first.delete()
+        # A count-based id would repeat second's
+        third = analyse()
+        self.assertEqual(third.claim_id, f'C{1000 + third.pk}')
+        self.assertEqual(third.policy_id, f'P{5000 + third.pk}')
+        self.assertEqual(len({second.claim_id, third.claim_id}), 2)
+        self.assertEqual(InsuranceClaim.objects.get(pk=third.pk).claim_id, third.claim_id)
+
+    def test_start_has_the_pool_drain_the_queue(self):
+        executor = mock.Mock()
+        with mock.patch.object(jobs, '_get_executor', return_value=executor), \
+                mock.patch.object(jobs, '_started', False), self.settings(DAMAGE_JOB_WORKERS=2):
+            jobs.start()
+        self.assertEqual(executor.submit.call_args_list,
+                         [mock.call(jobs._run_in_thread, None)] * 2)
+
+
+class DetectionCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        # A strictly increasing clock, so no two entries tie on last_used
+        clock = mock.Mock(time=itertools.count(1).__next__)
+        patcher = mock.patch.object(detection_cache, 'time', clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hits_misses_and_evicts_the_least_recently_used(self):
+        cache = detection_cache.DetectionCache(self.path, max_entries=2)
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', [[1, 1, 5, 5, 0.9, 0]])
+        cache.put('b', [])
+        self.assertEqual(cache.get('a'), [[1, 1, 5, 5, 0.9, 0]])
+        # 'a' was just used, so 'b' makes room
+        cache.put('c', [])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), [])
+        metrics = cache.metrics()
+        self.assertEqual((metrics['entries'], metrics['hits'], metrics['misses']), (2, 2, 2))
+        self.assertEqual(metrics['hit_rate'], 0.5)
+
+    def detect_twice(self):
+        predicted = []
+
+        def predict(images):
+            predicted.extend(images)
+            return [np.array([[1, 1, 5, 5, 0.9, 0]]) for _ in images]
+
+        scene = encode_png(np.full((16, 16, 3), 200, dtype=np.uint8))
+        with mock.patch.object(batching, 'get_batcher', return_value=batching.MicroBatcher(predict)):
+            for name in ['first.png', 'again.png']:
+                with DecodedImage(SimpleUploadedFile(name, scene)) as image:
+                    [boxes] = damage.detect_boxes([image])
+                np.testing.assert_array_equal(boxes, [[1, 1, 5, 5, 0.9, 0]])
+        return len(predicted)
+
+    def test_detect_boxes_reuses_cached_boxes(self):
+        with mock.patch.object(detection_cache, '_cache', detection_cache.DetectionCache(self.path)):
+            self.assertEqual(self.detect_twice(), 1)
+            self.assertEqual(detection_cache.metrics()['hits'], 1)
+
+    def test_an_empty_path_disables_the_cache(self):
+        with self.settings(DAMAGE_DETECTION_CACHE_PATH=''):
+            self.assertIsNone(detection_cache.get_cache())
+            self.assertIsNone(detection_cache.metrics())
+            self.assertEqual(self.detect_twice(), 2)
+
+
+class TiledDetectionCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = detection_cache.DetectionCache(os.path.join(directory.name, 'cache.sqlite3'))
+        patcher = mock.patch.object(detection_cache, '_cache', cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tiles = 0
+
+        def predict(tiles):
+            self.tiles += len(tiles)
+            return [np.array([[1, 1, 5, 5, 0.9, 0]]) for _ in tiles]
+
+        batcher = mock.Mock(map=predict)
+        patcher = mock.patch.object(batching, 'get_batcher', return_value=batcher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reanalysing_a_scene_reuses_the_merged_boxes(self):
+        scene = encode_png(np.random.default_rng(0).integers(0, 256, (96, 96, 3), dtype=np.uint8))
+        with self.settings(DAMAGE_TILE_SIZE=32, DAMAGE_TILE_OVERLAP=0, DAMAGE_TILE_SCALES=[1.0]):
+            with DecodedImage(SimpleUploadedFile('scene.png', scene)) as image:
+                boxes, shape = damage.detect_boxes_tiled(image)
+            self.assertEqual((self.tiles, shape), (9, (96, 96)))
+            with DecodedImage(SimpleUploadedFile('again.png', scene)) as image:
+                cached_boxes, cached_shape = damage.detect_boxes_tiled(image)
+            self.assertEqual(self.tiles, 9)
+            np.testing.assert_array_equal(cached_boxes, boxes)
+            self.assertEqual(cached_shape, shape)
+
+        # Other tiling settings are another cache entry
+        with self.settings(DAMAGE_TILE_SIZE=48, DAMAGE_TILE_OVERLAP=0, DAMAGE_TILE_SCALES=[1.0]):
+            with DecodedImage(SimpleUploadedFile('scene.png', scene)) as image:
+                damage.detect_boxes_tiled(image)
+        self.assertEqual(self.tiles, 13)
+
+
+class TiledSceneTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cache = detection_cache.DetectionCache(os.path.join(directory.name, 'cache.sqlite3'))
+        for patcher in [mock.patch.object(detection_cache, '_cache', cache),
+                        mock.patch.object(batching, 'get_batcher',
+                                          return_value=batching.MicroBatcher(self.predict))]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.enterContext(self.settings(DAMAGE_TILED_MIN_SIDE=64, DAMAGE_TILE_SIZE=32,
+                                        DAMAGE_TILE_OVERLAP=8, DAMAGE_TILE_SCALES=[1.0],
+                                        DAMAGE_SSIM_MAX_SIDE=32, DAMAGE_SSIM_HEATMAP_BLOCKS=2))
+
+    def predict(self, tiles):
+        """Stub detector: a box per bright blob, surer of bigger ones"""
+        results = []
+        for tile in tiles:
+            _, _, stats, _ = cv2.connectedComponentsWithStats((tile[..., 0] > 200).astype(np.uint8))
+            results.append(np.array([[x, y, x + w, y + h, min(area / 36, 1) * 0.9, 0]
+                                     for x, y, w, h, area in stats[1:]]).reshape(-1, 6))
+        return results
+
+    def scene(self, objects):
+        scene = np.full((96, 128, 3), 50, dtype=np.uint8)
+        for y0, x0, y1, x1 in objects:
+            scene[y0:y1, x0:x1] = 255
+        return scene
+
+    def test_windows_overlap_and_cover_the_edges(self):
+        windows = list(tiling.iter_windows(100, 70, 32, overlap=8))
+        covered = np.zeros((100, 70), dtype=int)
+        for y0, x0, y1, x1 in windows:
+            self.assertEqual((y1 - y0, x1 - x0), (32, 32))
+            covered[y0:y1, x0:x1] += 1
+        self.assertTrue(covered.all())
+        self.assertEqual(sorted({y0 for y0, _, _, _ in windows}), [0, 24, 48, 68])
+        self.assertEqual(sorted({x0 for _, x0, _, _ in windows}), [0, 24, 38])
+        # A scene smaller than a tile is one window
+        self.assertEqual(list(tiling.iter_windows(20, 10, 32, overlap=8)), [(0, 0, 20, 10)])
+
+    def test_nms_drops_cross_tile_duplicates_per_class(self):
+        boxes = np.array([
+            [10, 10, 20, 20, 0.9, 0],
+            [10, 10, 15, 20, 0.6, 0],   # half of it, cut by a tile edge
+            [10, 10, 20, 20, 0.8, 1],   # same place, other class
+            [30, 30, 40, 40, 0.5, 0],
+        ])
+        kept = tiling.nms(boxes, 0.5)
+        np.testing.assert_array_equal(kept, boxes[[0, 2, 3]])
+        # By IoU the half box overlaps too little to count as a duplicate
+        self.assertEqual(len(tiling.nms(boxes, 0.5, metric='iou')), 4)
+
+    def test_detect_tiled_maps_boxes_back_to_the_scene(self):
+        # (2, 26) sits in the overlap of the first two tile columns
+        source = tiling.ArraySource(self.scene([(2, 26, 8, 32), (60, 100, 66, 106)]))
+        boxes = tiling.detect_tiled(source, self.predict, tile_size=32, overlap=8, batch_size=3)
+        np.testing.assert_array_equal(boxes[:, :4], [[26, 2, 32, 8], [100, 60, 106, 66]])
+
+        # Boxes found on 64 pixel windows scaled by 0.5 are scaled back up;
+        # the last row of windows is flush with the bottom edge
+        fixed = lambda tiles: [np.array([[0, 0, 4, 4, 0.9, 0]]) for _ in tiles]
+        boxes = tiling.detect_tiled(source, fixed, tile_size=32, overlap=0, scales=[0.5])
+        self.assertEqual(boxes[:, :4].tolist(), [[0, 0, 8, 8], [64, 0, 72, 8], [0, 32, 8, 40],
+                                                 [64, 32, 72, 40]])
+
+    def test_scale_boxes(self):
+        boxes = np.array([[10, 20, 30, 40, 0.9, 0]])
+        np.testing.assert_array_equal(tiling.scale_boxes(boxes, (100, 200), (50, 100)),
+                                      [[5, 10, 15, 20, 0.9, 0]])
+        self.assertIs(tiling.scale_boxes(boxes, (100, 200), (100, 200)), boxes)
+
+    def test_per_tile_counts_and_changed_area(self):
+        pre = self.scene([(2, 26, 8, 32), (60, 100, 66, 106), (40, 10, 46, 16)])
+        # The first object is intact, the second gone, the third shrank
+        post = self.scene([(2, 26, 8, 32), (40, 10, 46, 14)])
+        with DecodedImage(SimpleUploadedFile('pre.png', encode_png(pre))) as pre_image, \
+                DecodedImage(SimpleUploadedFile('post.png', encode_png(post))) as post_image:
+            [report] = damage.compute_damage_reports([(pre_image, post_image)])
+        objects = report['objects']
+        self.assertEqual((objects['pre_objects'], objects['intact'], objects['damaged'],
+                          objects['disappeared'], objects['new']), (3, 1, 1, 1, 0))
+        self.assertEqual(objects['damaged_footprint_px'], 72)
+        self.assertEqual(report['changed_area_sqm'], 72 * settings.DAMAGE_GROUND_SAMPLE_DISTANCE_M ** 2)
+        self.assertEqual(
+            [(tile['window'], tile['damaged'], tile['disappeared'], tile['damaged_footprint_px'])
+             for tile in report['tiles']],
+            [([0, 0, 32, 32], 0, 0, 0), ([32, 0, 64, 32], 1, 0, 36), ([32, 96, 64, 128], 0, 1, 36)],
+        )
+
+    def test_nothing_detected_compares_overviews_of_the_scenes(self):
+        pre = np.full((96, 128, 3), 100, dtype=np.uint8)
+        post = pre.copy()
+        post[:48, :64] = 0
+        with DecodedImage(SimpleUploadedFile('pre.png', encode_png(pre))) as pre_image, \
+                DecodedImage(SimpleUploadedFile('post.png', encode_png(post))) as post_image, \
+                mock.patch.object(similarity, 'compare', side_effect=AssertionError('whole-image SSIM')):
+            [report] = damage.compute_damage_reports([(pre_image, post_image)])
+        self.assertIsNone(report['objects'])
+        self.assertGreater(report['score'], 0)
+        # The darkened quarter is the most changed block of the 2 x 2 heatmap
+        self.assertEqual(np.argmax(report['heatmap']), 0)
+
+
+def _parity_available():
+    return (
+        importlib.util.find_spec('onnxruntime') is not None
+        and importlib.util.find_spec('ultralytics') is not None
+        and os.path.exists(settings.DAMAGE_DETECTOR_WEIGHTS)
+        and os.path.exists(settings.DAMAGE_DETECTOR_ONNX_PATH)
+    )
+
+
+@unittest.skipUnless(_parity_available(), 'needs onnxruntime, ultralytics and both exported models')
+class BackendParityTests(SimpleTestCase):
+    def test_onnx_matches_torch(self):
+        from ultralytics.utils import ASSETS
+
+        from . import model_registry
+
+        # Real photos: on noise YOLO finds nothing and there is nothing to compare
+        images = [cv2.imread(str(ASSETS / name)) for name in ('bus.jpg', 'zidane.jpg')]
+        images.append(cv2.resize(images[0], (640, 480)))
+        torch_boxes = model_registry.get_detector('torch').predict_boxes(images)
+        onnx_boxes = model_registry.get_detector('onnx').predict_boxes(images)
+        self.assertEqual(len(torch_boxes), len(onnx_boxes))
+        for expected, actual in zip(torch_boxes, onnx_boxes):
+            self.assertGreater(len(expected), 0)
+            self.assertGreater(len(actual), 0, 'torch found objects onnx missed')
+            status, _ = change_detection.classify(expected, actual, match_threshold=0.9,
+                                                  intact_iou=0.9, min_conf_ratio=0)
+            self.assertGreaterEqual(np.mean(status == change_detection.INTACT), 0.9)
+
+
+def make_risk_zone(location_name, risk_score, latitude=0, longitude=0):
+    return RiskZone.objects.create(
+        location_name=location_name, latitude=latitude, longitude=longitude,
+        flood_risk=0.5, wildfire_risk=0.5, storm_risk=0.5, vegetation_dryness=0.5,
+        avg_temp_c=20, risk_score=risk_score,
+    )
+
+
+def make_assets(count, location_names):
+    Asset.objects.bulk_create(Location.assign([
+        Asset(
+            asset_id=f'A{Asset.objects.count() + i}', owner='Owner',
+            asset_type='Port', location_name=location_names[i % len(location_names)],
+            insured_value_usd=1000 + i, policy_start_date=date(2024, 1, 1),
+            policy_end_date=date(2025, 1, 1),
+        )
+        for i in range(count)
+    ]))
+
+
+class AssetRiskScoreTests(TestCase):
+    def setUp(self):
+        make_risk_zone('Miami', 60)
+        make_risk_zone('Miami', 80)
+        make_risk_zone('Houston', 40)
+
+    def list_assets(self, url, queries):
+        with self.assertNumQueries(queries):
+            return self.client.get(url).json()
+
+    def test_list_query_count_is_constant(self):
+        # Page count query + page query, however many assets are listed
+        make_assets(3, ['Miami', 'Houston', 'Nowhere'])
+        self.list_assets(reverse('asset-list'), 2)
+        make_assets(30, ['Miami', 'Houston', 'Nowhere'])
+        data = self.list_assets(reverse('asset-list'), 2)
+        self.assertEqual(data['count'], 33)
+
+    def test_active_query_count_is_constant(self):
+        make_assets(30, ['Miami'])
+        self.assertEqual(self.list_assets(reverse('asset-active'), 2)['count'], 30)
+
+    def test_risk_scores_match_highest_zone(self):
+        make_assets(3, ['Miami', 'Houston', 'Nowhere'])
+        scores = {
+            asset['location_name']: asset['risk_score']
+            for asset in self.client.get(reverse('asset-list')).json()['results']
+        }
+        self.assertEqual(scores, {'Miami': 80, 'Houston': 40, 'Nowhere': None})
+        asset = Asset.objects.get(location_name='Miami')
+        detail = self.client.get(reverse('asset-detail', args=[asset.pk])).json()
+        self.assertEqual(detail['risk_score'], 80)
+
+
+def make_claims(count, statuses=('Approved', 'Pending', 'Under Review')):
+    start = InsuranceClaim.objects.count()
+    claims = InsuranceClaim.objects.bulk_create(Location.assign([
+        InsuranceClaim(
+            claim_id=f'C{start + i}', policy_id='P1', location_name='Miami',
+            disaster_type='Flood', damage_score=0.5, claim_amount_usd=1000,
+            claim_status=statuses[i % len(statuses)], date_filed=date(2024, 1, 1),
+        )
+        for i in range(count)
+    ]))
+    DamageAnalysis.objects.bulk_create(
+        DamageAnalysis(claim=claim, damage_percentage=50, affected_area_sqm=100,
+                       confidence_score=0.9, ai_model_used='test')
+        for claim in claims for _ in range(2)
+    )
+    return claims
+
+
+class InsuranceClaimQueryTests(TestCase):
+    def assert_constant_queries(self, url, queries):
+        """``url`` costs ``queries`` queries with 3 claims and with 30"""
+        make_claims(3)
+        with self.assertNumQueries(queries):
+            self.client.get(url)
+        make_claims(27)
+        with self.assertNumQueries(queries):
+            return self.client.get(url).json()
+
+    def test_list_prefetches_analyses(self):
+        # count, page, analyses
+        data = self.assert_constant_queries(reverse('claim-list'), 3)
+        self.assertEqual(len(data['results'][0]['analyses']), 2)
+
+    def test_approved_prefetches_analyses(self):
+        data = self.assert_constant_queries(reverse('claim-approved'), 3)
+        self.assertEqual(data['count'], 10)
+        self.assertEqual(len(data['results'][0]['analyses']), 2)
+
+    def test_pending_prefetches_analyses(self):
+        data = self.assert_constant_queries(reverse('claim-pending'), 3)
+        self.assertEqual(data['count'], 20)
+
+    def test_summary_view_skips_analyses(self):
+        data = self.assert_constant_queries(reverse('claim-list') + '?view=summary', 2)
+        claim = data['results'][0]
+        self.assertNotIn('analyses', claim)
+        self.assertNotIn('pre_image', claim)
+        self.assertIn('claim_status', claim)
+
+    def test_fields_selects_representation(self):
+        url = reverse('claim-pending') + '?fields=claim_id,claim_status'
+        data = self.assert_constant_queries(url, 2)
+        self.assertEqual(set(data['results'][0]), {'claim_id', 'claim_status'})
+
+        url = reverse('claim-approved') + '?fields=claim_id,analyses'
+        data = self.client.get(url).json()
+        self.assertEqual(set(data['results'][0]), {'claim_id', 'analyses'})
+
+    def test_fields_projects_columns(self):
+        make_claims(3)
+        url = reverse('claim-approved') + '?fields=claim_id,claim_status'
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        page_query = queries.captured_queries[-1]['sql']
+        self.assertIn('"claim_id"', page_query)
+        self.assertNotIn('"location_name"', page_query)
+
+    def test_retrieve(self):
+        claim = make_claims(1)[0]
+        with self.assertNumQueries(2):
+            data = self.client.get(reverse('claim-detail', args=[claim.pk])).json()
+        self.assertEqual(len(data['analyses']), 2)
+
+
+class DashboardSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        make_risk_zone('Miami', 80)
+        make_risk_zone('Houston', 55)
+        make_claims(3)
+        # TestCase never commits: drop the fixtures' pending snapshot updates
+        connection.run_on_commit.clear()
+
+    def stats(self, query=''):
+        return self.client.get(reverse('dashboard-stats') + query).json()
+
+    def snapshot(self):
+        snapshot = DashboardSnapshot.objects.get()
+        return {field: getattr(snapshot, field) for field in dashboard.FIELDS}
+
+    def test_first_read_builds_the_snapshot_and_later_reads_hit_the_cache(self):
+        stats = self.stats()
+        self.assertEqual((stats['total_locations'], stats['high_risk_zones'],
+                          stats['medium_risk_zones']), (2, 1, 1))
+        self.assertEqual((stats['active_claims'], stats['approved_claims'],
+                          stats['pending_claims'], stats['total_claim_amount']),
+                         (3, 1, 2, '3000.00'))
+        self.assertEqual(self.snapshot(), dashboard.aggregate())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.stats(), stats)
+
+    def test_cache_ttl_falls_back_to_the_snapshot_then_rebuilds_once_stale(self):
+        self.stats()
+        # Skips the signals: not visible until the snapshot is rebuilt
+        make_claims(2)
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.stats()['active_claims'], 3)
+        self.assertEqual(self.stats('?fresh=1')['active_claims'], 5)
+
+        make_claims(1)
+        cache.clear()
+        DashboardSnapshot.objects.update(
+            updated_at=timezone.now() - timedelta(seconds=settings.DASHBOARD_STATS_MAX_AGE + 1)
+        )
+        self.assertEqual(self.stats()['active_claims'], 6)
+
+    def test_writes_and_deletes_apply_row_deltas_without_aggregating(self):
+        self.stats()
+        claim = InsuranceClaim.objects.get(claim_id='C1')
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            claim.claim_status = 'Approved'
+            claim.claim_amount_usd = 2500
+            claim.save()
+            make_risk_zone('Tampa', 20).delete()
+            make_risk_zone('Austin', 90)
+            ParametricTrigger.objects.create(trigger_id='T1', parameter='Rainfall', threshold=10,
+                                             current_value=20, location_name='Miami',
+                                             date_checked=date(2024, 1, 1))
+        self.assertFalse([query['sql'] for query in queries
+                          if 'COUNT(' in query['sql'] or 'SUM(' in query['sql']])
+        self.assertEqual(self.snapshot(), dashboard.aggregate())
+        stats = self.stats()
+        self.assertEqual((stats['approved_claims'], stats['pending_claims'],
+                          stats['total_claim_amount'], stats['high_risk_zones'],
+                          stats['low_risk_zones'], stats['active_triggers']),
+                         (2, 1, '4500.00', 2, 0, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            claim.delete()
+        self.assertEqual(self.snapshot(), dashboard.aggregate())
+
+    def test_rolled_back_writes_leave_the_snapshot_alone(self):
+        self.stats()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                make_risk_zone('Austin', 90)
+                try:
+                    with transaction.atomic():
+                        make_risk_zone('Tampa', 90)
+                        raise ValueError
+                except ValueError:
+                    pass
+        self.assertEqual(self.snapshot()['high_risk_zones'], 2)
+
+
+    def test_one_update_applies_every_write_that_survived(self):
+        self.stats()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        make_risk_zone('Tampa', 90)
+                        raise ValueError
+                except ValueError:
+                    pass
+                make_risk_zone('Austin', 90)
+                make_risk_zone('Dallas', 20)
+                dashboard.mark_changed(ParametricTrigger)
+        updates = [query['sql'] for query in queries
+                   if query['sql'].startswith('UPDATE "api_dashboardsnapshot"')]
+        # The deltas, then the re-aggregated triggers
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(self.snapshot(), dashboard.aggregate())
+        self.assertEqual(len(dashboard._pending_changes()), 0)
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        # Few distinct dates, so pages have to break ties on id
+        claims = make_claims(25)
+        for i, claim in enumerate(claims):
+            claim.date_filed = date(2024, 1, 1 + i % 3)
+        InsuranceClaim.objects.bulk_update(claims, ['date_filed'])
+        self.expected = list(
+            InsuranceClaim.objects.order_by('-date_filed', '-id').values_list('claim_id', flat=True)
+        )
+
+    def walk(self, url, link='next'):
+        seen = []
+        while url:
+            # One query per page: no COUNT, no OFFSET; analyses are left out
+            with self.assertNumQueries(1):
+                data = self.client.get(url).json()
+            seen.append([claim['claim_id'] for claim in data['results']])
+            url = data[link]
+        return seen
+
+    def test_walks_forward_and_back(self):
+        url = reverse('claim-list') + '?pagination=cursor&page_size=10&fields=claim_id,date_filed'
+        pages = self.walk(url)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        last = self.client.get(url).json()
+        last = self.client.get(last['next']).json()
+        last = self.client.get(last['next']).json()
+        back = self.walk(last['previous'], link='previous')
+        self.assertEqual(back, pages[:2][::-1])
+
+    def test_optional_count(self):
+        url = reverse('claim-list') + '?pagination=cursor&count=exact&view=summary'
+        self.assertEqual(self.client.get(url).json()['count'], 25)
+        url = reverse('claim-list') + '?pagination=cursor&count=approx&view=summary'
+        self.assertEqual(self.client.get(url).json()['count'], 25)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('claim-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+        # Well-formed, but the value doesn't parse as the ordering field's type
+        for position in [{'v': 'garbage', 'id': 1}, {'v': '2024-01-01', 'id': 'x'}, ['v', 'id']]:
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            response = self.client.get(reverse('claim-list') + f'?cursor={cursor}')
+            self.assertEqual(response.status_code, 404, position)
+
+
+def full_scans(sql):
+    """
+    Tables ``sql`` reads whole, according to EXPLAIN: table scans, and on
+    SQLite walks of a whole index (``SCAN t USING [COVERING] INDEX i``)
+    too, unless the index is partial (it only holds the rows of its
+    predicate) or the walk supplies the order of a query with a LIMIT (it
+    stops after a page)
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN ' + sql)
+            return re.findall(r'Seq Scan on (\w+)', '\n'.join(row[0] for row in cursor.fetchall()))
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        plan = [row[-1] for row in cursor.fetchall()]
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'")
+        partial = {name for name, in cursor.fetchall()}
+    paged = re.search(r'\bLIMIT \d+', sql) and not any('FOR ORDER BY' in detail for detail in plan)
+    return [
+        match.group(1) for detail in plan
+        for match in [re.match(r'SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?$', detail)]
+        if match and not (match.group(2) and (paged or match.group(2) in partial))
+    ]
+
+
+class QueryPlanTests(TestCase):
+    """
+    Every filter and action of the api viewsets must be served by an index
+    on a realistically sized table.
+    """
+    SIZE = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        locations = [f'City {i}' for i in range(200)]
+        statuses = [status for status, _ in InsuranceClaim.STATUS_CHOICES]
+        disasters = [disaster for disaster, _ in InsuranceClaim.DISASTER_TYPES]
+        asset_types = [asset_type for asset_type, _ in Asset.ASSET_TYPES]
+        RiskZone.objects.bulk_create(Location.assign([
+            RiskZone(location_name=locations[i % 200], latitude=0, longitude=0,
+                     flood_risk=0.5, wildfire_risk=0.5, storm_risk=0.5, vegetation_dryness=0.5,
+                     avg_temp_c=20, risk_score=i % 100)
+            for i in range(cls.SIZE)
+        ]))
+        InsuranceClaim.objects.bulk_create(Location.assign([
+            InsuranceClaim(claim_id=f'C{i}', policy_id='P', location_name=locations[i % 200],
+                           disaster_type=disasters[i % 5], damage_score=0.5,
+                           claim_amount_usd=1000, claim_status=statuses[i % 4],
+                           auto_approved=i % 20 == 0, date_filed=date(2024, 1, 1 + i % 28))
+            for i in range(cls.SIZE)
+        ]))
+        ParametricTrigger.objects.bulk_create(Location.assign([
+            ParametricTrigger(trigger_id=f'T{i}', parameter=f'param {i % 10}', threshold=1,
+                              current_value=i % 2, triggered=i % 20 == 0,
+                              location_name=locations[i % 200], date_checked=date(2024, 1, 1 + i % 28))
+            for i in range(cls.SIZE)
+        ]))
+        Asset.objects.bulk_create(Location.assign([
+            Asset(asset_id=f'A{i}', owner='Owner', asset_type=asset_types[i % 5],
+                  location_name=locations[i % 200], insured_value_usd=i, active=i % 20 == 0,
+                  policy_start_date=date(2024, 1, 1), policy_end_date=date(2025, 1, 1))
+            for i in range(cls.SIZE)
+        ]))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assert_indexed(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            # Counting a whole unfiltered table reads all of it by definition
+            if sql.startswith('SELECT COUNT(*)') and ' WHERE ' not in sql:
+                continue
+            # The once-per-process check for the search and spatial index tables
+            if 'sqlite_master' in sql:
+                continue
+            self.assertEqual(full_scans(sql), [], f'{url}: {sql}')
+
+    def test_risk_zones(self):
+        for url in ['?location_name=City%205', '?risk_score=70', 'high_risk/',
+                    'by_location/?location=city%2012', '?bbox=-1,-1,1,1',
+                    '?near=0,0&radius_km=10', '']:
+            self.assert_indexed('/api/risk-zones/' + url)
+
+    def test_claims(self):
+        for url in ['?claim_status=Approved', '?disaster_type=Flood', '?location_name=City%205',
+                    '?auto_approved=true', 'approved/', 'pending/', '?pagination=cursor',
+                    '?pagination=cursor&claim_status=Rejected', '']:
+            self.assert_indexed('/api/claims/' + url)
+
+    def test_triggers(self):
+        for url in ['?triggered=true', '?location_name=City%205', '?parameter=param%203',
+                    'active/', 'by_location/?location=city%2012', '']:
+            self.assert_indexed('/api/triggers/' + url)
+
+    def test_assets(self):
+        for url in ['?active=true', '?asset_type=Port', '?location_name=City%205', 'active/',
+                    '?pagination=cursor', 'by_location/?location=city%2012',
+                    '?bbox=-1,-1,1,1', '?near=0,0&radius_km=10', '']:
+            self.assert_indexed('/api/assets/' + url)
+
+    def test_broad_boolean_filters_read_the_table(self):
+        # The partial indexes only hold the few true rows; false matches most
+        # of the table, which a scan reads cheapest. Counting the page total
+        # is the one full read: the page itself walks the ordering index.
+        for url in ['/api/claims/?auto_approved=false', '/api/triggers/?triggered=false',
+                    '/api/assets/?active=false']:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            sqls = [query['sql'] for query in queries.captured_queries]
+            self.assertEqual([bool(full_scans(sql)) for sql in sqls],
+                             [sql.startswith('SELECT COUNT(*)') for sql in sqls], url)
+
+
+class LocationTests(TestCase):
+    def test_saves_link_matching_names_to_one_location(self):
+        zone = make_risk_zone('Miami, FL', 80)
+        make_assets(2, ['miami  fl', 'Houston, TX'])
+        self.assertEqual(zone.location.key, 'miami fl')
+        self.assertEqual(zone.location.latitude, 0)
+        self.assertEqual(Asset.objects.filter(location=zone.location).count(), 1)
+
+        zone.location_name = 'Houston, TX'
+        zone.save()
+        self.assertEqual(zone.location, Asset.objects.get(location_name='Houston, TX').location)
+
+    def test_by_location_matches_through_location(self):
+        make_risk_zone('Miami, FL', 80)
+        make_assets(3, ['Miami, FL', 'Houston, TX', 'North Miami, FL'])
+        url = reverse('asset-by-location') + '?location=MIAMI'
+        names = {asset['location_name'] for asset in self.client.get(url).json()['results']}
+        self.assertEqual(names, {'Miami, FL', 'North Miami, FL'})
+
+    def test_search_ranks_exact_then_prefix_then_substring(self):
+        make_assets(4, ['North Miami, FL', 'Miami Beach, FL', 'Miami', 'Houston, TX'])
+        ids = location_search.search('miami')
+        locations = Location.objects.in_bulk(ids)
+        self.assertEqual([locations[pk].name for pk in ids],
+                         ['Miami', 'Miami Beach, FL', 'North Miami, FL'])
+
+    def test_by_location_returns_every_match_best_first(self):
+        names = ['West Miami', 'Miami Lakes', 'North Miami, FL', 'Miami', 'Coral Miami',
+                 'Miami Gardens', 'Miami Beach, FL', 'Miami Springs']
+        make_assets(len(names), names)
+        with self.settings(LOCATION_SEARCH_LIMIT=3):
+            data = self.client.get(reverse('asset-by-location') + '?location=miami').json()
+            suggestions = self.client.get(reverse('location-suggest') + '?q=miami').json()
+        self.assertEqual(data['count'], len(names))
+        ranked = [asset['location_name'] for asset in data['results']]
+        self.assertEqual(ranked[0], 'Miami')
+        self.assertEqual(set(ranked[1:5]), {'Miami Lakes', 'Miami Gardens', 'Miami Beach, FL',
+                                            'Miami Springs'})
+        self.assertEqual(set(ranked[5:]), {'West Miami', 'North Miami, FL', 'Coral Miami'})
+        ids = location_search.search('miami')
+        locations = Location.objects.in_bulk(ids)
+        self.assertEqual(ranked, [locations[pk].name for pk in ids])
+        self.assertEqual([location['name'] for location in suggestions], ranked[:3])
+
+    def test_by_location_ranks_a_bounded_number_of_matches(self):
+        names = ['Miami'] + [f'Miami {i}' for i in range(20)]
+        make_assets(len(names), names)
+        ids = location_search.search('miami')
+        with self.settings(LOCATION_RANK_LIMIT=3):
+            data = self.client.get(reverse('asset-by-location') + '?location=miami&page_size=50').json()
+            _, params = location_search.rank_by(Asset.objects.all(), ids).query.sql_with_params()
+        self.assertEqual(data['count'], len(names))
+        locations = Location.objects.in_bulk(ids)
+        ranked = [asset['location_name'] for asset in data['results']]
+        self.assertEqual(ranked[:3], [locations[pk].name for pk in ids[:3]])
+        self.assertEqual(set(ranked[3:]), set(names) - set(ranked[:3]))
+        # One parameter per match for the filter, and the CASE stays small
+        self.assertLessEqual(len(params), len(ids) + 2 * 3 + 1)
+
+    def test_search_falls_back_to_fuzzy_matches(self):
+        make_assets(2, ['Miami, FL', 'Houston, TX'])
+        [pk] = location_search.search('Maimi FL')
+        self.assertEqual(Location.objects.get(pk=pk).key, 'miami fl')
+        self.assertEqual(location_search.search('Chicago'), [])
+
+    def test_search_follows_location_changes(self):
+        location = Location.resolve('Miami, FL')
+        location.key = 'tampa fl'
+        location.save()
+        self.assertEqual(location_search.search('miami'), [])
+        self.assertEqual(location_search.search('tampa'), [location.pk])
+        location.delete()
+        self.assertEqual(location_search.search('tampa'), [])
+
+
+class SpatialFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_risk_zone('Miami', 80, 25.76, -80.19)
+        make_risk_zone('Fort Lauderdale', 60, 26.12, -80.14)
+        make_risk_zone('Suva', 50, -18.14, 178.44)
+        make_risk_zone('Apia', 40, -13.83, -171.76)
+        make_assets(4, ['Miami', 'Fort Lauderdale', 'Suva', 'Apia'])
+
+    def names(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return {row['location_name'] for row in response.json()['results']}
+
+    def test_bbox(self):
+        self.assertEqual(self.names('/api/risk-zones/?bbox=-81,25,-80,26'), {'Miami'})
+        self.assertEqual(self.names('/api/assets/?bbox=-81,25,-80,27'), {'Miami', 'Fort Lauderdale'})
+
+    def test_bbox_across_antimeridian(self):
+        self.assertEqual(self.names('/api/risk-zones/?bbox=170,-20,-170,-10'), {'Suva', 'Apia'})
+        self.assertEqual(self.names('/api/assets/?bbox=179,-20,-170,-10'), {'Apia'})
+
+    def test_radius(self):
+        # Fort Lauderdale is about 40 km north of Miami
+        self.assertEqual(self.names('/api/risk-zones/?near=25.76,-80.19&radius_km=10'), {'Miami'})
+        self.assertEqual(self.names('/api/assets/?near=25.76,-80.19&radius_km=50'),
+                         {'Miami', 'Fort Lauderdale'})
+
+    def test_radius_across_antimeridian(self):
+        # Suva and Apia are about 1150 km apart on either side of it
+        self.assertEqual(self.names('/api/risk-zones/?near=-18.14,178.44&radius_km=1000'), {'Suva'})
+        self.assertEqual(self.names('/api/risk-zones/?near=-18.14,178.44&radius_km=1300'),
+                         {'Suva', 'Apia'})
+
+    def test_circle_reaching_a_pole_spans_every_longitude(self):
+        [(west, south, east, north)] = spatial.circle_boxes(89, 0, 500)
+        self.assertEqual((west, east, north), (-180, 180, 90))
+        self.assertAlmostEqual(south, 84.5, places=1)
+
+    def test_invalid_parameters(self):
+        for query in ['bbox=1,2,3', 'bbox=0,10,1,5', 'bbox=0,0,200,1', 'near=25,-80',
+                      'near=25,-80&radius_km=-1', 'near=north&radius_km=1']:
+            self.assertEqual(self.client.get('/api/risk-zones/?' + query).status_code, 400, query)
+
+
+class AssetClusterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_risk_zone('Miami', 80, 25.76, -80.19)
+        make_risk_zone('Miami Beach', 60, 25.79, -80.17)
+        make_risk_zone('Houston', 40, 29.76, -95.37)
+        make_assets(6, ['Miami', 'Miami Beach', 'Houston'])
+
+    def setUp(self):
+        cache.clear()
+        # TestCase never commits: drop the fixtures' pending invalidation
+        connection.run_on_commit.clear()
+
+    def tile(self, z, x, y, query=''):
+        response = self.client.get(f'/api/assets/clusters/{z}/{x}/{y}/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['clusters']
+
+    def test_world_tile_aggregates_per_cell(self):
+        clusters = self.tile(0, 0, 0)
+        self.assertEqual(sum(cluster['count'] for cluster in clusters), 6)
+        self.assertLessEqual(len(clusters), settings.ASSET_CLUSTER_GRID ** 2)
+        # Miami and Miami Beach share a cell at this zoom
+        miami = max(clusters, key=lambda cluster: cluster['count'])
+        self.assertEqual(miami['count'], 4)
+        self.assertEqual(miami['max_risk_score'], 80)
+        self.assertEqual(float(miami['total_insured_value']), 1000 + 1001 + 1003 + 1004)
+
+    def test_zoomed_tile_splits_and_crops(self):
+        # The z=10 tile holding Miami has Miami Beach in another cell and
+        # Houston out of it
+        clusters = self.tile(10, 283, 436)
+        self.assertEqual(
+            [(cluster['cell'], cluster['count'], cluster['max_risk_score']) for cluster in clusters],
+            [([7, 0], 2, 60), ([7, 1], 2, 80)],
+        )
+
+    def test_filters_apply_and_are_cached_apart(self):
+        self.assertEqual(self.tile(0, 0, 0, '?asset_type=Farm%20Land'), [])
+        self.assertEqual(sum(cluster['count'] for cluster in self.tile(0, 0, 0)), 6)
+
+    def test_tiles_are_cached_until_assets_change(self):
+        self.tile(0, 0, 0)
+        # Only the version is read
+        with self.assertNumQueries(1):
+            self.tile(0, 0, 0)
+        # The tiles are dropped once the write commits, which TestCase never does
+        with self.captureOnCommitCallbacks(execute=True):
+            make_risk_zone('Houston', 95, 29.76, -95.37)
+        houston = min(self.tile(0, 0, 0), key=lambda cluster: cluster['count'])
+        self.assertEqual(houston['max_risk_score'], 95)
+
+    def test_a_rolled_back_write_leaves_the_next_one_to_invalidate(self):
+        version = clusters._version()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        make_risk_zone('Tampa', 70, 27.95, -82.46)
+                        raise ValueError
+                except ValueError:
+                    pass
+                make_risk_zone('Houston', 95, 29.76, -95.37)
+                make_risk_zone('Dallas', 50, 32.78, -96.80)
+        self.assertEqual(clusters._version(), version + 1)
+
+    def test_version_is_shared_through_the_database(self):
+        clusters.invalidate()
+        clusters.invalidate()
+        self.assertEqual(CacheVersion.objects.get(pk=clusters.VERSION_KEY).version, 2)
+        self.tile(0, 0, 0)
+        # A bump from another worker process, whose cache this one doesn't see
+        CacheVersion.objects.filter(pk=clusters.VERSION_KEY).update(version=3)
+        with self.assertNumQueries(3):
+            self.tile(0, 0, 0)
+
+    def test_unknown_tile(self):
+        response = self.client.get('/api/assets/clusters/1/2/0/')
+        self.assertEqual(response.status_code, 404)
+
+
+STORM_EVENTS_CSV = """EVENT_ID,STATE,CZ_NAME,EVENT_TYPE,BEGIN_YEARMONTH,BEGIN_DAY,BEGIN_DATE_TIME,DAMAGE_PROPERTY
+101,FLORIDA,MIAMI-DADE,Flash Flood,202309,14,14-SEP-23 10:00:00,25K
+102,TEXAS,HARRIS,Hurricane (Typhoon),202308,2,02-AUG-23 08:00:00,1.5M
+103,TEXAS,HARRIS,Hail,202308,3,03-AUG-23 08:00:00,10K
+104,,HARRIS,Wildfire,202308,4,04-AUG-23 08:00:00,
+"""
+
+
+class StormEventsImportTests(TestCase):
+    def write_csv(self, text, directory=None, name='StormEvents_details-d2023.csv.gz'):
+        if directory is None:
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            directory = directory.name
+        path = os.path.join(directory, name)
+        with gzip.open(path, 'wt', newline='') as file:
+            file.write(text)
+        return path
+
+    def test_parse_damage(self):
+        for value, amount in [('25K', 25_000), ('1.5M', 1_500_000), ('2B', 2e9), ('0.00K', 0),
+                              ('', 0), ('K', 1_000), ('$1,200', 1_200), ('n/a', 0)]:
+            self.assertEqual(storm_events.parse_damage(value), amount, value)
+
+    def test_columnar_normalization_matches_per_row(self):
+        header = ['EVENT_ID', 'STATE', 'CZ_NAME', 'EVENT_TYPE', 'BEGIN_YEARMONTH', 'BEGIN_DAY',
+                  'BEGIN_DATE_TIME', 'DAMAGE_PROPERTY']
+        rows = [
+            ['1', 'TEXAS', 'HARRIS', 'Flood', '202302', '28', '', '2.5K'],
+            ['2', 'TEXAS', 'HARRIS', 'Flood', '202302', '30', '', '1M'],  # no Feb 30
+            ['3', 'TEXAS', 'HARRIS', 'Tornado', '', '', '03-AUG-23 08:00:00', ''],
+            ['4', 'TEXAS', ' ', 'Tornado', '202301', '1', '', '1K'],
+            [' 5 ', 'IOWA', 'POLK', 'Wildfire', '202413', '1', '', '3B'],
+            ['6', 'IOWA', 'POLK', 'Hail', '202401', '1', '', '3K'],
+            ['7', 'IOWA', 'POLK', 'Hurricane (Typhoon)', ' 202401', '2 ', '', ' 7.5M '],
+        ]
+        columns = dict(zip(header, zip(*rows)))
+        expected = [storm_events.normalize(dict(zip(header, row))) for row in rows]
+        self.assertEqual(list(storm_events.iter_events(storm_events.normalize_chunk(columns))),
+                         [event for event in expected if event is not None])
+        self.assertEqual([event['event_id'] for event in expected if event], ['1', '3', '7'])
+
+    def test_imports_covered_events_and_upserts_on_reimport(self):
+        path = self.write_csv(STORM_EVENTS_CSV)
+        call_command('import_storm_events', path, '--batch-size', '1', stdout=io.StringIO())
+        claims = {claim.claim_id: claim for claim in InsuranceClaim.objects.select_related('location')}
+        self.assertEqual(set(claims), {'NOAA-101', 'NOAA-102'})
+        self.assertEqual(claims['NOAA-102'].disaster_type, 'Storm')
+        self.assertEqual(claims['NOAA-102'].claim_amount_usd, 1_500_000)
+        self.assertEqual(claims['NOAA-101'].date_filed, date(2023, 9, 14))
+        self.assertEqual(claims['NOAA-101'].location.key, 'miami dade florida')
+
+        InsuranceClaim.objects.filter(claim_id='NOAA-101').update(claim_status='Approved')
+        path = self.write_csv(STORM_EVENTS_CSV.replace('25K', '30K'))
+        call_command('import_storm_events', path, stdout=io.StringIO())
+        claim = InsuranceClaim.objects.get(claim_id='NOAA-101')
+        self.assertEqual(InsuranceClaim.objects.count(), 2)
+        self.assertEqual((claim.claim_amount_usd, claim.claim_status), (30_000, 'Approved'))
+        self.assertEqual(DashboardSnapshot.objects.get().active_claims, 2)
+
+    def test_imports_a_directory_of_yearly_files_in_parallel(self):
+        directory = os.path.dirname(self.write_csv(STORM_EVENTS_CSV))
+        self.write_csv(STORM_EVENTS_CSV.replace('\n10', '\n20'), directory,
+                       'StormEvents_details-d2022.csv.gz')
+        self.write_csv(STORM_EVENTS_CSV.replace('\n10', '\n30'), directory, 'unrelated.csv.gz')
+        call_command('import_storm_events', directory, '--workers', '2', stdout=io.StringIO())
+        self.assertEqual(set(InsuranceClaim.objects.values_list('claim_id', flat=True)),
+                         {'NOAA-101', 'NOAA-102', 'NOAA-201', 'NOAA-202'})
+
+
+    def test_files_without_covered_events_do_not_end_the_import(self):
+        directory = os.path.dirname(self.write_csv(
+            STORM_EVENTS_CSV.split('\n')[0] + '\n301,TEXAS,HARRIS,Hail,202308,3,,10K\n',
+            name='StormEvents_details-d2021.csv.gz'
+        ))
+        self.write_csv(STORM_EVENTS_CSV, directory)
+        for workers, limit, expected in [('1', '0', 2), ('2', '0', 2), ('1', '1', 1)]:
+            InsuranceClaim.objects.all().delete()
+            call_command('import_storm_events', directory, '--workers', workers, '--limit', limit,
+                         stdout=io.StringIO())
+            self.assertEqual(InsuranceClaim.objects.count(), expected, (workers, limit))
+
+class BulkWriteTests(TestCase):
+    def post(self, name, body, content_type='application/json'):
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        return self.client.post(reverse(name), body, content_type=content_type)
+
+    def claim(self, claim_id, **fields):
+        return {'claim_id': claim_id, 'policy_id': 'P1', 'location_name': 'Miami',
+                'disaster_type': 'Flood', 'damage_score': 0.5, 'claim_amount_usd': 1000,
+                'date_filed': '2024-01-01', **fields}
+
+    def test_upserts_claims_and_reports_row_errors(self):
+        make_claims(2, statuses=['Approved', 'Pending'])
+        response = self.post('claim-bulk', [
+            self.claim('C0', claim_amount_usd=5000),
+            self.claim('NEW', damage_score=0.9),
+            self.claim('BAD', disaster_type='Meteor'),
+            'not an object',
+            self.claim('NEW', damage_score=0.9, claim_amount_usd=7000),
+            self.claim('C1', damage_score=0.9),
+            self.claim('LATE', date_filed='yesterday', damage_score=2),
+        ])
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['written'], 3)
+        self.assertEqual([error['index'] for error in result['errors']], [2, 3, 6])
+        self.assertIn('disaster_type', result['errors'][0]['errors'])
+        self.assertIn('non_field_errors', result['errors'][1]['errors'])
+        self.assertEqual(set(result['errors'][2]['errors']), {'date_filed', 'damage_score'})
+
+        claims = {claim.claim_id: claim for claim in InsuranceClaim.objects.select_related('location')}
+        self.assertEqual(set(claims), {'C0', 'C1', 'NEW'})
+        # Fields left out of an update keep their value; only new rows are
+        # auto-approved
+        self.assertEqual((claims['C0'].claim_amount_usd, claims['C0'].claim_status), (5000, 'Approved'))
+        self.assertEqual((claims['NEW'].claim_amount_usd, claims['NEW'].claim_status), (7000, 'Approved'))
+        self.assertTrue(claims['NEW'].auto_approved)
+        self.assertEqual((claims['C1'].damage_score, claims['C1'].claim_status), (0.9, 'Pending'))
+        self.assertEqual(claims['NEW'].location, claims['C0'].location)
+        self.assertIn(InsuranceClaim, {change.model for change in dashboard._pending_changes()})
+
+    def test_streams_ndjson_triggers(self):
+        ParametricTrigger.objects.create(trigger_id='T0', parameter='Rainfall', threshold=100,
+                                         current_value=10, location_name='Miami',
+                                         date_checked=date(2024, 1, 1))
+        lines = [
+            json.dumps({'trigger_id': 'T0', 'parameter': 'Rainfall', 'threshold': 100,
+                        'current_value': 150, 'location_name': 'Miami', 'date_checked': '2024-01-02'}),
+            '{not json',
+            '',
+            json.dumps({'trigger_id': 'T1', 'parameter': 'Wind', 'threshold': 50,
+                        'current_value': 20, 'location_name': 'Houston', 'date_checked': '2024-01-02'}),
+        ]
+        with self.settings(BULK_CHUNK_SIZE=2):
+            result = self.post('trigger-bulk', '\n'.join(lines) + '\n',
+                               'application/x-ndjson').json()
+        self.assertEqual(result['written'], 2)
+        self.assertEqual([error['index'] for error in result['errors']], [1])
+        triggered = dict(ParametricTrigger.objects.values_list('trigger_id', 'triggered'))
+        self.assertEqual(triggered, {'T0': True, 'T1': False})
+        self.assertEqual(ParametricTrigger.objects.get(trigger_id='T1').location.key, 'houston')
+
+    def test_asset_query_count_is_constant(self):
+        def assets(count, start):
+            return [{'asset_id': f'A{start + i}', 'owner': 'Owner', 'asset_type': 'Port',
+                     'location_name': f'City {i % 3}', 'insured_value_usd': 1000,
+                     'policy_start_date': '2024-01-01', 'policy_end_date': '2025-01-01'}
+                    for i in range(count)]
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.post('asset-bulk', assets(3, 0))
+            with CaptureQueriesContext(connection) as few:
+                self.post('asset-bulk', assets(3, 100))
+            with CaptureQueriesContext(connection) as many:
+                result = self.post('asset-bulk', assets(60, 200)).json()
+        self.assertEqual(result, {'written': 60, 'errors': []})
+        self.assertEqual(len(many), len(few))
+        # One tile invalidation for every write in the transaction
+        version = clusters._version()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(clusters._version(), version + 1)
+
+    def test_rejects_a_body_that_is_not_rows(self):
+        self.assertEqual(self.post('asset-bulk', {'asset_id': 'A1'}).status_code, 400)
+
+
+class ExportTests(TestCase):
+    def export(self, name, query='', queries=1):
+        response = self.client.get(reverse(name) + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(queries):
+            return response, b''.join(response.streaming_content).decode()
+
+    def test_streams_filtered_claims_as_ndjson(self):
+        make_claims(7)
+        with self.settings(EXPORT_CHUNK_SIZE=2):
+            response, body = self.export('claim-export', '?claim_status=Pending')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        # Same date_filed: newest first
+        self.assertEqual([row['claim_id'] for row in rows], ['C4', 'C1'])
+        self.assertEqual({row['claim_status'] for row in rows}, {'Pending'})
+        self.assertEqual(rows[0]['date_filed'], '2024-01-01')
+        self.assertNotIn('analyses', rows[0])
+
+    def test_streams_assets_as_csv(self):
+        make_risk_zone('Miami', 80, latitude=25.76, longitude=-80.19)
+        make_assets(3, ['Miami', 'Houston'])
+        _, body = self.export('asset-export', '?output=csv&fields=asset_id,risk_score,latitude')
+        rows = list(csv.reader(io.StringIO(body)))
+        self.assertEqual(rows, [
+            ['asset_id', 'risk_score', 'latitude'],
+            ['A2', '80', '25.76'], ['A1', '', ''], ['A0', '80', '25.76'],
+        ])
+        _, body = self.export('asset-export', '?output=csv&active=false')
+        self.assertEqual(body.splitlines()[0].split(',')[:2], ['id', 'asset_id'])
+        self.assertEqual(len(body.splitlines()), 1)
+
+    def test_rejects_unknown_output(self):
+        self.assertEqual(self.client.get(reverse('asset-export') + '?output=xml').status_code, 400)
@@ -0,0 +1,218 @@
+"""
+Tiled, multi-scale inference for large satellite scenes.
+
+Running the detector on a whole 20k x 20k scene either downsamples small
+buildings away or exhausts memory, so large scenes are cut into
+overlapping windows that are read, batched through the detector and
+merged back with cross-tile NMS. GeoTIFFs are read window by window
+through rasterio when it is installed; other formats fall back to slicing
+the decoded array (views, no copies).
+"""
+import cv2
+import numpy as np
+
+from .imaging import pyramid_down
+
+
+def _starts(length, span, step):
+    if length <= span:
+        return [0]
+    starts = list(range(0, length - span + 1, step))
+    if starts[-1] + span < length:
+        starts.append(length - span)
+    return starts
+
+
+def iter_windows(height, width, span, overlap=0):
+    """Yield ``(y0, x0, y1, x1)`` windows of side ``span`` covering the scene"""
+    step = max(span - overlap, 1)
+    for y in _starts(height, span, step):
+        for x in _starts(width, span, step):
+            yield (y, x, min(y + span, height), min(x + span, width))
+
+
+class ArraySource:
+    """Tiles sliced out of an already decoded BGR array"""
+
+    def __init__(self, array):
+        self.array = array
+
+    @property
+    def shape(self):
+        return self.array.shape[:2]
+
+    def read(self, window):
+        y0, x0, y1, x1 = window
+        return self.array[y0:y1, x0:x1]
+
+    def overview(self, width, height):
+        """The whole scene scaled down to ``width`` x ``height``"""
+        return pyramid_down(self.array, width, height)
+
+    def close(self):
+        pass
+
+
+class RasterSource:
+    """Tiles read window by window through rasterio"""
+
+    def __init__(self, path):
+        import rasterio
+
+        # A path is read lazily; a file object is read into memory first
+        self.dataset = rasterio.open(path)
+        self.bands = [1, 2, 3] if self.dataset.count >= 3 else [1]
+
+    @property
+    def shape(self):
+        return (self.dataset.height, self.dataset.width)
+
+    def read(self, window):
+        from rasterio.windows import Window
+
+        y0, x0, y1, x1 = window
+        return self._bgr(self.dataset.read(self.bands, window=Window(x0, y0, x1 - x0, y1 - y0)))
+
+    def overview(self, width, height):
+        """
+        The whole scene scaled down to ``width`` x ``height``, read from the
+        file's overviews where it has them rather than at full resolution
+        """
+        from rasterio.enums import Resampling
+
+        return self._bgr(self.dataset.read(self.bands, out_shape=(len(self.bands), height, width),
+                                           resampling=Resampling.average))
+
+    def _bgr(self, data):
+        if data.dtype != np.uint8:
+            if np.issubdtype(data.dtype, np.integer):
+                scale = 255.0 / np.iinfo(data.dtype).max
+            else:
+                scale = 255.0
+            data = np.clip(data * scale, 0, 255).astype(np.uint8)
+        tile = np.ascontiguousarray(np.moveaxis(data, 0, -1))
+        if len(self.bands) == 1:
+            return cv2.cvtColor(tile, cv2.COLOR_GRAY2BGR)
+        return cv2.cvtColor(tile, cv2.COLOR_RGB2BGR)
+
+    def close(self):
+        self.dataset.close()
+
+
+def _local_path(source):
+    if hasattr(source, 'temporary_file_path'):
+        return source.temporary_file_path()
+    try:
+        return source.path
+    except (AttributeError, NotImplementedError, ValueError):
+        return None
+
+
+def open_tile_source(image):
+    """
+    Tile source for a DecodedImage: rasterio for (Geo)TIFFs when it is
+    installed -- windowed reads from disk, or from memory for small
+    in-memory uploads -- otherwise the decoded array. GeoTIFFs OpenCV can't
+    decode (e.g. float or 16-bit multi-band rasters) need rasterio.
+    """
+    path = _local_path(image.source)
+    if image.format == 'TIFF' or (path and str(path).lower().endswith(('.tif', '.tiff'))):
+        try:
+            if path is None:
+                image.source.seek(0)
+            return RasterSource(path or image.source)
+        except (ImportError, OSError):
+            pass
+    if image.color is None:
+        raise ValueError(f"Could not decode {image.name or 'image'}")
+    return ArraySource(image.color)
+
+
+def box_overlaps(box, boxes, metric='iou'):
+    """
+    Overlap of one ``[x1, y1, x2, y2]`` box with each row of ``boxes``.
+    ``metric='ios'`` divides by the smaller area, which also catches a box
+    that a tile edge cut in half.
+    """
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == 'ios':
+        denom = np.minimum(area, areas)
+    else:
+        denom = area + areas - inter
+    return inter / np.maximum(denom, 1e-9)
+
+
+def nms(boxes, threshold=0.5, metric='ios'):
+    """
+    Class-aware greedy NMS over rows of ``[x1, y1, x2, y2, conf, cls]``.
+    Returns the kept rows, highest confidence first.
+    """
+    if len(boxes) == 0:
+        return boxes
+    # Shift each class into its own coordinate range so one pass handles all
+    offset = boxes[:, 5:6] * (boxes[:, :4].max() + 1)
+    shifted = boxes[:, :4] + offset
+    order = np.argsort(-boxes[:, 4])
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        order = rest[box_overlaps(shifted[best], shifted[rest], metric) <= threshold]
+    return boxes[keep]
+
+
+def detect_tiled(source, predict_boxes, tile_size=640, overlap=64, scales=(1.0,),
+                 batch_size=8, nms_threshold=0.5):
+    """
+    Run ``predict_boxes`` (list of BGR tiles -> list of Nx6 box arrays) over
+    overlapping tiles of ``source`` at each scale, ``batch_size`` tiles at
+    a time, and merge the results in scene coordinates.
+    """
+    height, width = source.shape
+    merged = []
+
+    def flush(pending):
+        results = predict_boxes([tile for tile, _, _ in pending])
+        for (_, (y0, x0), scale), boxes in zip(pending, results):
+            if len(boxes):
+                boxes = np.array(boxes, dtype=np.float64, copy=True)
+                boxes[:, :4] /= scale
+                boxes[:, [0, 2]] += x0
+                boxes[:, [1, 3]] += y0
+                merged.append(boxes)
+
+    for scale in scales:
+        span = max(int(round(tile_size / scale)), 1)
+        pending = []
+        for window in iter_windows(height, width, span, int(round(overlap / scale))):
+            tile = source.read(window)
+            if scale != 1.0:
+                tile = cv2.resize(tile, (max(int(tile.shape[1] * scale), 1),
+                                         max(int(tile.shape[0] * scale), 1)))
+            pending.append((tile, window[:2], scale))
+            if len(pending) >= batch_size:
+                flush(pending)
+                pending = []
+        if pending:
+            flush(pending)
+
+    if not merged:
+        return np.zeros((0, 6))
+    return nms(np.concatenate(merged), nms_threshold)
+
+
+def scale_boxes(boxes, from_shape, to_shape):
+    """Map boxes detected on a scene of ``from_shape`` onto ``to_shape``"""
+    if tuple(from_shape) == tuple(to_shape) or len(boxes) == 0:
+        return boxes
+    boxes = boxes.copy()
+    boxes[:, [0, 2]] *= to_shape[1] / from_shape[1]
+    boxes[:, [1, 3]] *= to_shape[0] / from_shape[0]
+    return boxes
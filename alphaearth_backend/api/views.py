@@ -2,35 +2,133 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Sum, Q
+from rest_framework.reverse import reverse
+from django.conf import settings
+from django.db.models import OuterRef, Q, Subquery
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 import random
-from datetime import date
-from datetime import date
 from PIL import Image
-import numpy as np 
-import cv2
-from decimal import Decimal 
 import io 
-import torch
-from ultralytics import YOLO
-from skimage.metrics import structural_similarity as ssim
 
 
 from .models import (
-        RiskZone, InsuranceClaim, ParametricTrigger,
-        Asset, AIModelInsight, DamageAnalysis
+        Location, RiskZone, InsuranceClaim, ParametricTrigger,
+        Asset, AIModelInsight, DamageAnalysis, DamageAnalysisJob
         )
+from . import (
+        batching, bulk, clusters, dashboard, detection_cache, export, jobs,
+        location_search, model_registry, spatial
+        )
+from .damage import compute_damage_reports, run_damage_analysis
+from .imaging import DecodedImage
+from .pagination import PageOrKeysetPagination
 from .serializers import (
         RiskZoneSerializer, InsuranceClaimSerializer,
-        InsuranceClaimCreateSerializer, ParametricTriggerSerializer,
-        AssetSerializer, AIModelInsightSerializer,
+        InsuranceClaimCreateSerializer, InsuranceClaimBulkSerializer,
+        ParametricTriggerSerializer, ParametricTriggerBulkSerializer,
+        AssetSerializer, AssetBulkSerializer, AIModelInsightSerializer,
         DashboardStatsSerializer, ImageUploadSerializer,
-        DamageAnalysisSerializer
+        BatchImageUploadSerializer, DamageAnalysisSerializer,
+        DamageAnalysisJobSerializer, InsuranceClaimSummarySerializer,
+        LocationSerializer, requested_fields
+        )
+
+
+class ListActionMixin:
+    """
+    Lists, including custom list actions, go through the viewset's filter
+    backends and paginator, and only load the columns the serializer will
+    output (so ``?fields=`` and ``?view=summary`` narrow the query too).
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.list_response(self.get_queryset())
+
+    def list_response(self, queryset):
+        serializer = self.get_serializer(many=True)
+        queryset = self.project(self.filter_queryset(queryset), serializer.child)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    def project(self, queryset, serializer):
+        """Defer the model columns ``serializer`` doesn't read"""
+        columns = {field.name for field in queryset.model._meta.concrete_fields}
+        needed = set()
+        for field in serializer.fields.values():
+            # Method fields ('*') are expected to work from annotations
+            name = field.source.split('.')[0]
+            if name in columns:
+                needed.add(name)
+        # Relations joined with select_related can't be deferred
+        if isinstance(queryset.query.select_related, dict):
+            needed |= columns & set(queryset.query.select_related)
+        if needed == columns:
+            return queryset
+        return queryset.only(*needed)
+
+
+class BulkActionMixin:
+    """
+    ``POST <list>/bulk/``: create or update many objects in one request,
+    from a JSON array or NDJSON rows (see ``bulk``). Rows are upserted on
+    ``bulk_serializer_class``'s ``Meta.bulk_key``; the response counts the
+    rows written (created or updated: telling them apart would take a
+    query per chunk) and lists the errors of the rejected ones.
+    """
+    bulk_serializer_class = None
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create or update many objects at once"""
+        result = {'written': 0, 'errors': []}
+        context = self.get_serializer_context()
+        for chunk in bulk.chunked(bulk.iter_rows(request), settings.BULK_CHUNK_SIZE):
+            bulk.write_chunk(self.bulk_serializer_class, chunk, result, context)
+        return Response(result)
+
+
+class ExportActionMixin:
+    """
+    ``GET <list>/export/``: every object the list's filters select,
+    streamed as NDJSON (default) or CSV (``?output=csv``) without
+    pagination (see ``export``). ``export_fields`` maps the output columns
+    to ORM lookups; ``?fields=`` narrows them. Rows come in
+    ``keyset_ordering`` order, ties broken by id.
+    """
+    export_fields = {}
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream every matching object as NDJSON or CSV"""
+        # Flat rows: no prefetching, no select_related joins beyond the lookups
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None).select_related(None)
+        ordering = self.keyset_ordering
+        queryset = queryset.order_by(ordering, '-id' if ordering.startswith('-') else 'id')
+        return export.response(
+            queryset, self.export_fields, self.basename,
+            output=request.query_params.get('output', 'ndjson'),
+            requested=requested_fields(request),
         )
 
 
-class RiskZoneViewSet(viewsets.ModelViewSet):
+def filter_by_location(queryset, request):
+    """
+    Narrow ``queryset`` to the locations matching ``?location=``, best
+    match first. Only the small Location table is searched, through its
+    trigram index (see ``location_search``); the rows themselves are
+    matched on the indexed ``location_id``.
+    """
+    term = request.query_params.get('location', '')
+    if not Location.normalize(term):
+        return queryset
+    return location_search.rank_by(queryset, location_search.search(term))
+
+
+class RiskZoneViewSet(ListActionMixin, viewsets.ModelViewSet):
     """
     ViewSet for Risk Zones
 
@@ -41,30 +139,32 @@ class RiskZoneViewSet(viewsets.ModelViewSet):
     partial_update: Partially update a risk zone
     destroy: Delete a risk zone
     """
-    queryset = RiskZone.objects.all()
+    queryset = RiskZone.objects.select_related('location')
     serializer_class = RiskZoneSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['location_name', 'risk_score']
     search_fields = ['location_name']
     ordering_fields = ['risk_score', 'location_name']
 
+    def filter_queryset(self, queryset):
+        # ?bbox= / ?near=&radius_km= on the zone's own coordinates
+        return spatial.filter_queryset(super().filter_queryset(queryset), self.request)
+
     @action(detail=False, methods=['get'])
     def high_risk(self, request):
         """Get all high-risk zones (score >= 70)"""
-        high_risk_zones = self.queryset.filter(risk_score__gte=70)
-        serializer = self.get_serializer(high_risk_zones, many=True)
-        return Response(serializer.data)
+        high_risk_zones = self.get_queryset().filter(risk_score__gte=70)
+        return self.list_response(high_risk_zones)
 
     @action(detail=False, methods=['get'])
     def by_location(self, request):
         """Search risk zones by location name"""
-        location = request.query_params.get('location', '')
-        zones = self.queryset.filter(location_name__icontains=location)
-        serializer = self.get_serializer(zones, many=True)
-        return Response(serializer.data)
+        zones = filter_by_location(self.get_queryset(), request)
+        return self.list_response(zones)
 
 
-class InsuranceClaimViewSet(viewsets.ModelViewSet):
+class InsuranceClaimViewSet(ListActionMixin, BulkActionMixin, ExportActionMixin,
+                            viewsets.ModelViewSet):
     """
     ViewSet for Insurance Claims
 
@@ -75,7 +175,17 @@ class InsuranceClaimViewSet(viewsets.ModelViewSet):
     partial_update: Partially update a claim
     destroy: Delete a claim
     """
-    queryset = InsuranceClaim.objects.all()
+    queryset = InsuranceClaim.objects.select_related('location')
+    bulk_serializer_class = InsuranceClaimBulkSerializer
+    pagination_class = PageOrKeysetPagination
+    keyset_ordering = '-date_filed'
+    export_fields = {
+        name: name for name in [
+            'id', 'claim_id', 'policy_id', 'location_name', 'disaster_type',
+            'pre_image_url', 'post_image_url', 'damage_score', 'claim_amount_usd',
+            'claim_status', 'auto_approved', 'date_filed', 'created_at', 'updated_at'
+        ]
+    }
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['claim_status', 'disaster_type', 'location_name', 'auto_approved']
     search_fields = ['claim_id', 'policy_id', 'location_name']
@@ -84,23 +194,33 @@ class InsuranceClaimViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         if self.action == 'create':
             return InsuranceClaimCreateSerializer
+        if self.request.query_params.get('view') == 'summary':
+            return InsuranceClaimSummarySerializer
         return InsuranceClaimSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Fetch every claim's analyses in one extra query, unless the
+        # response leaves them out (?view=summary, or ?fields= without them)
+        fields = requested_fields(self.request)
+        if self.get_serializer_class() is InsuranceClaimSerializer and (
+                not fields or 'analyses' in fields):
+            queryset = queryset.prefetch_related('analyses')
+        return queryset
+
     @action(detail=False, methods=['get'])
     def approved(self, request):
         """Get all approved claims"""
-        approved_claims = self.queryset.filter(claim_status='Approved')
-        serializer = self.get_serializer(approved_claims, many=True)
-        return Response(serializer.data)
+        approved_claims = self.get_queryset().filter(claim_status='Approved')
+        return self.list_response(approved_claims)
 
     @action(detail=False, methods=['get'])
     def pending(self, request):
         """Get all pending claims"""
-        pending_claims = self.queryset.filter(
+        pending_claims = self.get_queryset().filter(
                 Q(claim_status='Pending') | Q(claim_status='Under Review')
                 )
-        serializer = self.get_serializer(pending_claims, many=True)
-        return Response(serializer.data)
+        return self.list_response(pending_claims)
 
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -121,7 +241,7 @@ class InsuranceClaimViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class ParametricTriggerViewSet(viewsets.ModelViewSet):
+class ParametricTriggerViewSet(ListActionMixin, BulkActionMixin, viewsets.ModelViewSet):
     """
     ViewSet for Parametric Triggers
 
@@ -132,8 +252,9 @@ class ParametricTriggerViewSet(viewsets.ModelViewSet):
     partial_update: Partially update a trigger
     destroy: Delete a trigger
     """
-    queryset = ParametricTrigger.objects.all()
+    queryset = ParametricTrigger.objects.select_related('location')
     serializer_class = ParametricTriggerSerializer
+    bulk_serializer_class = ParametricTriggerBulkSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['triggered', 'location_name', 'parameter']
     search_fields = ['trigger_id', 'location_name', 'parameter']
@@ -142,20 +263,17 @@ class ParametricTriggerViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def active(self, request):
         """Get all active (triggered) triggers"""
-        active_triggers = self.queryset.filter(triggered=True)
-        serializer = self.get_serializer(active_triggers, many=True)
-        return Response(serializer.data)
+        active_triggers = self.get_queryset().filter(triggered=True)
+        return self.list_response(active_triggers)
 
     @action(detail=False, methods=['get'])
     def by_location(self, request):
         """Get triggers for a specific location"""
-        location = request.query_params.get('location', '')
-        triggers = self.queryset.filter(location_name__icontains=location)
-        serializer = self.get_serializer(triggers, many=True)
-        return Response(serializer.data)
+        triggers = filter_by_location(self.get_queryset(), request)
+        return self.list_response(triggers)
 
 
-class AssetViewSet(viewsets.ModelViewSet):
+class AssetViewSet(ListActionMixin, BulkActionMixin, ExportActionMixin, viewsets.ModelViewSet):
     """
     ViewSet for Assets
 
@@ -166,27 +284,56 @@ class AssetViewSet(viewsets.ModelViewSet):
     partial_update: Partially update an asset
     destroy: Delete an asset
     """
-    queryset = Asset.objects.all()
+    # Resolve every asset's location risk score in the same query (the
+    # highest-scoring zone of that location, as RiskZone's default ordering gives)
+    queryset = Asset.objects.select_related('location').annotate(
+        zone_risk_score=Subquery(
+            RiskZone.objects.filter(location=OuterRef('location'))
+            .order_by('-risk_score').values('risk_score')[:1]
+        )
+    )
     serializer_class = AssetSerializer
+    bulk_serializer_class = AssetBulkSerializer
+    pagination_class = PageOrKeysetPagination
+    keyset_ordering = '-insured_value_usd'
+    export_fields = {
+        **{name: name for name in [
+            'id', 'asset_id', 'owner', 'asset_type', 'location_name', 'insured_value_usd',
+            'policy_start_date', 'policy_end_date', 'active', 'created_at', 'updated_at'
+        ]},
+        'risk_score': 'zone_risk_score',
+        'latitude': 'location__latitude',
+        'longitude': 'location__longitude',
+    }
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['active', 'asset_type', 'location_name']
     search_fields = ['asset_id', 'owner', 'location_name']
     ordering_fields = ['insured_value_usd', 'policy_start_date']
 
+    def filter_queryset(self, queryset):
+        # ?bbox= / ?near=&radius_km= on the coordinates of the asset's location
+        return spatial.filter_queryset(super().filter_queryset(queryset), self.request,
+                                       through='location')
+
     @action(detail=False, methods=['get'])
     def active(self, request):
         """Get all active assets"""
-        active_assets = self.queryset.filter(active=True)
-        serializer = self.get_serializer(active_assets, many=True)
-        return Response(serializer.data)
+        active_assets = self.get_queryset().filter(active=True)
+        return self.list_response(active_assets)
 
     @action(detail=False, methods=['get'])
     def by_location(self, request):
         """Get assets for a specific location"""
-        location = request.query_params.get('location', '')
-        assets = self.queryset.filter(location_name__icontains=location)
-        serializer = self.get_serializer(assets, many=True)
-        return Response(serializer.data)
+        assets = filter_by_location(self.get_queryset(), request)
+        return self.list_response(assets)
+
+    @action(detail=False, methods=['get'],
+            url_path=r'clusters/(?P<z>[0-9]+)/(?P<x>[0-9]+)/(?P<y>[0-9]+)')
+    def clusters(self, request, z, x, y):
+        """Asset clusters of map tile z/x/y (count, insured value, max risk per grid cell)"""
+        assets = self.filter_queryset(Asset.objects.all())
+        return Response(clusters.get_tile(assets, int(z), int(x), int(y),
+                                          variant=request.query_params.urlencode()))
 
 
 class AIModelInsightViewSet(viewsets.ModelViewSet):
@@ -212,122 +359,25 @@ class DashboardStatsView(APIView):
     Get dashboard statistics
 
     GET /api/dashboard-stats/
-    Returns aggregated statistics for the dashboard
+    Returns aggregated statistics for the dashboard from the cached
+    snapshot; pass ?fresh=1 to recompute them from the tables
     """
 
     def get(self, request):
-        total_locations = RiskZone.objects.count()
-        active_claims = InsuranceClaim.objects.count()
-        approved_claims = InsuranceClaim.objects.filter(claim_status='Approved').count()
-        pending_claims = InsuranceClaim.objects.filter(
-                Q(claim_status='Pending') | Q(claim_status='Under Review')
-                ).count()
-
-        total_claim_amount = InsuranceClaim.objects.aggregate(
-                total=Sum('claim_amount_usd')
-                )['total'] or 0
-
-        active_triggers = ParametricTrigger.objects.filter(triggered=True).count()
-        high_risk_zones = RiskZone.objects.filter(risk_score__gte=70).count()
-        medium_risk_zones = RiskZone.objects.filter(
-                risk_score__gte=50, risk_score__lt=70
-                ).count()
-        low_risk_zones = RiskZone.objects.filter(risk_score__lt=50).count()
-
-        data = {
-                'total_locations': total_locations,
-                'active_claims': active_claims,
-                'approved_claims': approved_claims,
-                'pending_claims': pending_claims,
-                'total_claim_amount': total_claim_amount,
-                'active_triggers': active_triggers,
-                'high_risk_zones': high_risk_zones,
-                'medium_risk_zones': medium_risk_zones,
-                'low_risk_zones': low_risk_zones,
-                }
+        fresh = request.query_params.get('fresh', '').lower() in ('1', 'true', 'yes')
+        data = dashboard.get_stats(fresh=fresh)
 
         serializer = DashboardStatsSerializer(data)
         return Response(serializer.data)
 
-# Predefined disaster severity factor
-DISASTER_SEVERITY = {
-    "flood": 0.7,
-    "wildfire": 0.8,
-    "storm": 0.6,
-    "earthquake": 0.9,
-}
-
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-model = YOLO("yolov8m.pt").to(device)
-
-
-def get_disaster_score(disaster_type):
-    return DISASTER_SEVERITY.get(disaster_type.lower(), 0.5)
-
-
-def load_image_as_array(uploaded_file):
-    uploaded_file.seek(0)
-    img_bytes = np.frombuffer(uploaded_file.read(), np.uint8)
-    img = cv2.imdecode(img_bytes, cv2.IMREAD_COLOR)
-    uploaded_file.seek(0)
-    return img
-
-
-def analyze_image_objects_yolo(image_file):
-    img = load_image_as_array(image_file)
-    if img is None:
-        return {}
-
-    results = model.predict(img, save=False, verbose=False, device=device)
-    objects = {}
-
-    for result in results:
-        for box in result.boxes:
-            cls_id = int(box.cls[0])
-            class_name = model.names[cls_id]
-            score = float(box.conf[0])
-            objects[class_name] = max(objects.get(class_name, 0), score)
-
-    return objects
-
-def compute_damage_score(pre_image, post_image):
-    """
-    Compute damage score using YOLO object detection.
-    Returns float in [0,1] (1=max damage).
-    """
-    pre_objects = analyze_image_objects_yolo(pre_image)
-    post_objects = analyze_image_objects_yolo(post_image)
-
-    # If both images have no detected objects, fallback to SSIM
-    if not pre_objects and not post_objects:
-        pre_image.seek(0)
-        post_image.seek(0)
-        pre_bytes = np.frombuffer(pre_image.read(), np.uint8)
-        post_bytes = np.frombuffer(post_image.read(), np.uint8)
-        pre_gray = cv2.imdecode(pre_bytes, cv2.IMREAD_GRAYSCALE)
-        post_gray = cv2.imdecode(post_bytes, cv2.IMREAD_GRAYSCALE)
-
-        # Resize to smallest shape
-        h = min(pre_gray.shape[0], post_gray.shape[0])
-        w = min(pre_gray.shape[1], post_gray.shape[1])
-        pre_gray = cv2.resize(pre_gray, (w, h))
-        post_gray = cv2.resize(post_gray, (w, h))
-
-        ssim_score, _ = ssim(pre_gray, post_gray, full=True)
-        return round(1 - ssim_score, 2)
-
-    # Compare objects by presence only (ignore confidence)
-    all_objects = set(pre_objects.keys()) | set(post_objects.keys())
-    changes = 0
-    for obj in all_objects:
-        if (obj in pre_objects) != (obj in post_objects):
-            changes += 1
-
-    if not all_objects:
-        return 0  # no objects detected in either image → no damage
-
-    damage_score = changes / len(all_objects)
-    return min(max(damage_score, 0), 1)
+def inference_busy_response(exc):
+    """429 telling the client when to retry a request the inference queue refused"""
+    return Response(
+        {'error': 'Damage analysis is at capacity, please retry later',
+         'retry_after': exc.retry_after},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={'Retry-After': str(exc.retry_after)},
+    )
 
 class DamageAnalysisView(APIView):
     """
@@ -342,51 +392,31 @@ class DamageAnalysisView(APIView):
         data = serializer.validated_data
 
         # Extract optional location metadata
-        vegetation_dryness = data.get('vegetation_dryness', 0.5)
-        sea_level_rise_m = data.get('sea_level_rise_m', 0.0)
-        historical_events = data.get('historical_events', 0)
-
-        # Compute damage score using Vision API
-        image_damage_score = compute_damage_score(data['pre_image'], data['post_image'])
-        disaster_score = get_disaster_score(data['disaster_type'])
-        location_score = min(vegetation_dryness + sea_level_rise_m/5 + historical_events/10, 3)/3
-
-        # Weighted combination
-        damage_score = 0.5*image_damage_score + 0.3*disaster_score + 0.2*location_score
-
-        # Estimate affected area (max 5000 sqm)
-        affected_area = damage_score * 5000
-        confidence = 0.9  # fixed high-confidence for deterministic scoring
-
-        # Generate IDs
-        claim_count = InsuranceClaim.objects.count()
-        claim_id = f"C{1000 + claim_count + 1}"
-        policy_id = f"P{5000 + claim_count + 1}"
-
-        # Save InsuranceClaim
-        claim = InsuranceClaim.objects.create(
-            claim_id=claim_id,
-            policy_id=policy_id,
-            location_name=data['location_name'],
-            disaster_type=data['disaster_type'],
-            pre_image=data['pre_image'],
-            post_image=data['post_image'],
-            damage_score=float(damage_score),
-            claim_amount_usd=Decimal(affected_area*100),
-            claim_status='Approved' if damage_score >= 0.7 else 'Under Review',
-            auto_approved=damage_score >= 0.7,
-            date_filed=date.today()
-        )
-
-        # Save DamageAnalysis
-        analysis = DamageAnalysis.objects.create(
-            claim=claim,
-            damage_percentage=Decimal(damage_score*100),
-            affected_area_sqm=Decimal(affected_area),
-            confidence_score=Decimal(confidence),
-            ai_model_used='Google Vision Object Comparator v1.0',
-            notes=f'Automated analysis using Vision API. Confidence: {confidence:.2%}'
-        )
+        parameters = {
+            'vegetation_dryness': data.get('vegetation_dryness', 0.5),
+            'sea_level_rise_m': data.get('sea_level_rise_m', 0.0),
+            'historical_events': data.get('historical_events', 0),
+        }
+
+        if self.wants_async(request):
+            job = jobs.enqueue(
+                data['pre_image'], data['post_image'],
+                data['location_name'], data['disaster_type'], **parameters
+            )
+            return Response({
+                'job_id': job.pk,
+                'status': job.status,
+                'status_url': reverse('damage-analysis-job', args=[job.pk], request=request),
+                'message': 'Damage analysis queued'
+            }, status=status.HTTP_202_ACCEPTED)
+
+        try:
+            claim, analysis = run_damage_analysis(
+                data['pre_image'], data['post_image'],
+                data['location_name'], data['disaster_type'], **parameters
+            )
+        except batching.QueueFull as exc:
+            return inference_busy_response(exc)
 
         return Response({
             'claim': InsuranceClaimSerializer(claim).data,
@@ -394,6 +424,93 @@ class DamageAnalysisView(APIView):
             'message': 'Damage analysis completed successfully'
         }, status=status.HTTP_201_CREATED)
 
+    def wants_async(self, request):
+        value = request.query_params.get('async', request.data.get('async'))
+        if value is None:
+            return settings.DAMAGE_ANALYSIS_ASYNC
+        return str(value).lower() in ('1', 'true', 'yes')
+
+class DamageAnalysisBatchView(APIView):
+    """
+    Analyze damage for several claims at once
+    POST /api/damage-analysis/batch/
+
+    Takes lists of pre_images, post_images, location_names and
+    disaster_types paired by position; all images go through the detector
+    together.
+    """
+    def post(self, request):
+        serializer = BatchImageUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        pairs = [
+            (DecodedImage(pre_image), DecodedImage(post_image))
+            for pre_image, post_image in zip(data['pre_images'], data['post_images'])
+        ]
+        try:
+            reports = compute_damage_reports(pairs)
+        except batching.QueueFull as exc:
+            return inference_busy_response(exc)
+        finally:
+            for pre_image, post_image in pairs:
+                pre_image.release()
+                post_image.release()
+
+        results = []
+        for (pre_image, post_image), location_name, disaster_type, report in zip(
+                pairs, data['location_names'], data['disaster_types'], reports):
+            claim, analysis = run_damage_analysis(
+                pre_image.source, post_image.source, location_name, disaster_type,
+                report=report
+            )
+            results.append({
+                'claim': InsuranceClaimSerializer(claim).data,
+                'analysis': DamageAnalysisSerializer(analysis).data,
+            })
+
+        return Response({
+            'results': results,
+            'message': f'Damage analysis completed for {len(results)} claims'
+        }, status=status.HTTP_201_CREATED)
+
+class DamageAnalysisJobView(APIView):
+    """
+    Poll an asynchronous damage analysis job
+    GET /api/damage-analysis/jobs/<id>/
+    """
+    def get(self, request, pk):
+        job = get_object_or_404(
+            DamageAnalysisJob.objects.select_related('claim', 'analysis'), pk=pk
+        )
+        return Response(DamageAnalysisJobSerializer(job).data)
+
+class InferenceMetricsView(APIView):
+    """
+    Get inference metrics for this worker process
+
+    GET /api/inference-metrics/
+    Returns detector load time and memory usage, inference queue depth,
+    batching and latency statistics and detection cache hit/miss counters
+    """
+
+    def get(self, request):
+        return Response({
+            'detectors': model_registry.metrics(),
+            'batchers': batching.metrics(),
+            'detection_cache': detection_cache.metrics(),
+        })
+
+class LocationSuggestView(APIView):
+    """
+    Autocomplete location names
+    GET /api/locations/suggest/?q=<term>
+    """
+    def get(self, request):
+        locations = location_search.suggest(request.query_params.get('q', ''))
+        return Response(LocationSerializer(locations, many=True).data)
+
 class RiskAssessmentView(APIView):
     """
        """
@@ -411,7 +528,7 @@ class RiskAssessmentView(APIView):
 
         # Check if location already exists
         existing = RiskZone.objects.filter(
-                location_name=location_name
+                location__key=Location.normalize(location_name)
                 ).first()
 
         if existing: